@@ -1,22 +1,31 @@
 import yaml
-import subprocess
 import os
 import argparse
 import tempfile
 import json
 import itertools
+import collections
 import pprint
+import functools
+import shutil
+import random
+import time
 from cryptography.exceptions import InvalidTag
 # --- Local Module Imports
 import credential_loader
+import phase_graph
+import scan_cache
 import shared_utils
-from tools import cucm_vtc_tool, dashboard_generator_tool
+import worker_pool
+from tools import cucm_vtc_tool, dashboard_generator_tool, governor_tool, timeout_policy_tool
 
 # --- Configuration ---
 CONFIG_DIR = "./configs/"
 OUTPUT_DIR = "./output/"
-ORCHESTRATOR_SCRIPT = "orchestrator.py"
 CREDENTIALS_FILE = "./credentials.enc"
+# CUCM results are cached per DN pattern for this long, so repeated runs within the window make no AXL calls
+CUCM_CACHE_FILE = f"{shared_utils.CACHE_DIR}cucm_vtc_devices.json"
+CUCM_CACHE_TTL = 60 * 60
 
 def get_sites_to_process(target: str, groups_config_file: str) -> list:
     # Determines the list of individual sites to run based on the target
@@ -40,19 +49,317 @@ def get_sites_to_process(target: str, groups_config_file: str) -> list:
         print(f"Target: '{target}' not found as a group. Processing as a single site.")
         return [target]
 
+# --- Phase Graph Node Executors ---
+# Each executor receives the shared 'run' state plus its planned value from phase_graph.plan_run
+# (the set of sites to process for site nodes, True for group nodes).
+def _raise_on_failures(exit_codes: dict, phase: str):
+    # Raises if any site's worker failed during a phase that later phases cannot do without
+    failed_sites = sorted(site for site, code in exit_codes.items() if code != 0)
+    if failed_sites:
+        raise Exception(f"Worker script failed during {phase} for site(s): {failed_sites}")
+
+def _run_discovery_node(run: dict, sites: set):
+    # Discovery always collects ARP in the same sessions; sites that also need a config backup get it fused in too
+    print("\n--- CONDUCTOR PHASE: DISCOVERY & ARP COLLECTION ---")
+    backup_sites = run['plan'].get('backup') or set()
+    site_options = {site: {'with_config_backup': site in backup_sites, 'incremental': run['incremental_discovery'],
+                           'scan_cache_dir': run['scan_cache_dir']} for site in sites}
+    exit_codes, results = worker_pool.run_phase_for_sites(run['pool'], sorted(sites), "discovery_and_arp", site_options=site_options)
+    _raise_on_failures(exit_codes, "discovery")
+    for site, result in results.items():
+        run['arp_tables'][site] = result.get('arp_table', {})
+        run['subnets'][site] = result.get('subnet_list', [])
+    run['fused_backup_sites'] = sites & backup_sites
+
+def _run_arp_node(run: dict, sites: set):
+    # Sites that were just rediscovered already have fresh ARP; the rest only need an ARP refresh
+    refresh_sites = sites - (run['plan'].get('discovery') or set())
+    if not refresh_sites:
+        return
+    print("\n--- CONDUCTOR PHASE: ARP REFRESH ---")
+    shared_utils.flush_background_writer() # The ARP phase reads discovered_topology.yml
+    exit_codes, results = worker_pool.run_phase_for_sites(run['pool'], sorted(refresh_sites), "arp",
+                                                          {'scan_cache_dir': run['scan_cache_dir']})
+    _raise_on_failures(exit_codes, "ARP refresh")
+    for site, result in results.items():
+        run['arp_tables'][site] = result.get('arp_table', {})
+
+def _run_backup_node(run: dict, sites: set):
+    # Backs up sites whose configs were not already collected during this run's discovery sessions
+    remaining_sites = sites - run['fused_backup_sites']
+    print("\n--- CONDUCTOR WORKFLOW: CONFIGURATION BACKUP ---")
+    if not remaining_sites:
+        print("Configurations were backed up during the discovery sessions.")
+        return
+    shared_utils.flush_background_writer() # The backup phase reads discovered_topology.yml
+    worker_pool.run_phase_for_sites(run['pool'], sorted(remaining_sites), "backup_configs",
+                                    {'scan_cache_dir': run['scan_cache_dir']})
+
+def _load_site_report(site: str, filename: str, root_key: str):
+    # Reads back a report from an earlier run for sites whose phases were fresh and therefore skipped
+    try:
+        with open(f"{OUTPUT_DIR}{site}/{filename}", 'r') as f:
+            return (yaml.safe_load(f) or {}).get(root_key)
+    except FileNotFoundError:
+        print(f"Warning: Could not load '{filename}' for site {site}.")
+        return None
+
+def _run_aggregate_node(run: dict, planned: bool):
+    print("\n--- CONDUCTOR PHASE: GROUP ARP AGGREGATION ---")
+    group_arp_table = {}
+    for site in run['sites']:
+        if site not in run['arp_tables']:
+            run['arp_tables'][site] = _load_site_report(site, "arp_table.yml", 'arp_table') or {}
+        if site not in run['subnets']:
+            run['subnets'][site] = (_load_site_report(site, "discovered_vlans.yml", 'vlan_info') or {}).get('subnet_list', [])
+        site_arp_data = run['arp_tables'][site]
+        if isinstance(site_arp_data, dict):
+            group_arp_table.update(site_arp_data)
+        else:
+            print(f"  -> ERROR: Type mismatch. ARP data for site '{site}' is not a dictionary.")
+
+    # --- DEBUG BLOCK #1: Inspect the Final ARP Table ---
+    # print("\n" + "="*20 + " ARP AGGREGATION DEBUG " + "="*20)
+    # print(f"Final Aggregated group_arp_table contains {len(group_arp_table)} entries.")
+    # if group_arp_table:
+    #     print("Sample of aggregated ARP entries:")
+    #     for ip, details in itertools.islice(group_arp_table.items(), 3):
+    #         print(f"  IP: {ip}, MAC: {details.get('mac_address')}")
+    #     print("="*61 + "\n")
+    # --- END DEBUG BLOCK #1 ---
+
+    run['group_arp_table'] = group_arp_table
+    print(f"Success: Aggregated {len(group_arp_table)} ARP entries from {len(run['sites'])} site(s).")
+
+def _fetch_vtc_devices(run: dict, patterns: set) -> dict | None:
+    # Returns the CUCM devices for each DN pattern. Patterns cached within CUCM_CACHE_TTL are served from disk;
+    # the rest are fetched together in one batched AXL query. Returns None if that query failed.
+    cache = shared_utils.load_json_cache(CUCM_CACHE_FILE)
+    ttl = 0 if run.get('force_refresh') else CUCM_CACHE_TTL
+    now = time.time()
+    devices_by_pattern = {pattern: cache[pattern]['devices'] for pattern in patterns
+                          if pattern in cache and now - cache[pattern]['fetched_at'] < ttl}
+    if devices_by_pattern:
+        print(f"Using cached CUCM results for pattern(s) {sorted(devices_by_pattern)}.")
+    missing = sorted(patterns - devices_by_pattern.keys())
+    if not missing:
+        return devices_by_pattern
+    devices = cucm_vtc_tool.get_vtc_devices(run['services_config']['cucm_cluster']['publisher_ip'], run['creds']['cucm_user'], run['creds']['cucm_pass'], missing)
+    if devices is None:
+        return None
+    for pattern, pattern_devices in cucm_vtc_tool.split_by_pattern(devices, missing).items():
+        cache[pattern] = {'fetched_at': now, 'devices': pattern_devices}
+        devices_by_pattern[pattern] = pattern_devices
+    # Drop entries that have expired anyway
+    shared_utils.save_json_cache(CUCM_CACHE_FILE, {pattern: entry for pattern, entry in cache.items() if now - entry['fetched_at'] < CUCM_CACHE_TTL})
+    return devices_by_pattern
+
+def _run_cucm_node(run: dict, planned: bool):
+    # Queries CUCM for the VTC/phone devices of every site in the group; needs no discovery data, so it runs alongside discovery.
+    # Each site's DN pattern comes from its seed; all patterns are fetched in one query and the rows split back out per site.
+    print("\n--- CONDUCTOR PHASE: CUCM VTC/PHONE QUERY ---")
+    site_patterns = {}
+    for site in run['sites']:
+        site_devices = [dev for dev in run['all_network_devices'] if dev.get('site') == site]
+        site_seed = shared_utils.find_device_by_role(site_devices, 'discovery_seed')
+        vtc_pattern = shared_utils.generate_vtc_pattern(site_seed['ip']) if site_seed else None
+        if vtc_pattern:
+            site_patterns[site] = vtc_pattern
+        else:
+            print(f"Warning: Could not generate VTC pattern for site '{site}'. Its VTC/Phones are not queried.")
+    if not site_patterns:
+        print("Warning: Could not generate VTC pattern. Skipping all VTC/Phone tasks.")
+        return
+    devices_by_pattern = _fetch_vtc_devices(run, set(site_patterns.values()))
+    if devices_by_pattern is None:
+        return
+    run['site_vtc_patterns'] = site_patterns
+    run['site_phone_lists'] = {site: devices_by_pattern[pattern] for site, pattern in site_patterns.items()}
+    for site, site_phones in run['site_phone_lists'].items():
+        print(f"  - {site} ({site_patterns[site]}): {len(site_phones)} device(s)")
+
+def _run_enrichment_node(run: dict, sites: set):
+    print("\n--- CONDUCTOR WORKFLOW: VTC/PHONE ENRICHMENT ---")
+    site_phone_lists = run.get('site_phone_lists')
+    if site_phone_lists is None:
+        print("CUCM query did not complete. Skipping enrichment.")
+        return
+    group_arp_table = run['group_arp_table']
+    mac_to_ip_map = {shared_utils.normalize_mac(details['mac_address']): ip for ip, details in group_arp_table.items()}
+
+    # --- DEBUG BLOCK #2: Inspect the MAC addresses ---
+    # print("\n" + "="*20 + " VTC FILTERING DEBUG " + "="*20)
+    # print(f"CUCM returned {len(global_phone_list)} devices.")
+    # print(f"The mac_to_ip_map (from ARP table) contains {len(mac_to_ip_map)} entries.")
+    # sample_phone_from_cucm = global_phone_list[0]
+    # cucm_mac_raw = sample_phone_from_cucm.get('device_name')
+    # cucm_mac_normalized = shared_utils.normalize_mac(cucm_mac_raw)
+    # sample_arp_mac_raw = list(group_arp_table.values())[0].get('mac_addres') if group_arp_table else "N/A"
+    # arp_mac_normalized = shared_utils.normalize_mac(sample_arp_mac_raw)
+    # print("\n--- MAC Address Format Comparison ---")
+    # print(f"Sample CUCM MAC (Raw)        : {cucm_mac_raw}")
+    # print(f"Sample CUCM Mac (Normalized) : {cucm_mac_normalized}")
+    # print(f"Sample ARP Mac (Raw)         : {sample_arp_mac_raw}")
+    # print(f"Sample ARP Mac (Normalized)  : {arp_mac_normalized}")
+    # match_found = cucm_mac_normalized in mac_to_ip_map
+    # print(f"\nDoes the sample normlaized CUCM MAC exist in the ARP map? -> {match_found}")
+    # print("="*59 + "\n")
+    # --- END DEBUG BLOCK #2
+
+    # Each site enriches the devices matching its own DN pattern that have an IP in the group ARP table.
+    # Sites sharing a pattern get the same rows, so for them the site's subnets decide which devices are its own.
+    sites_per_pattern = collections.Counter(run['site_vtc_patterns'].values())
+    enrichment_inputs = {}
+    for site in run['sites']:
+        if site not in sites:
+            continue
+        devices_for_this_site = [p for p in site_phone_lists.get(site) or [] if shared_utils.normalize_mac(p['device_name']) in mac_to_ip_map]
+        if sites_per_pattern[run['site_vtc_patterns'].get(site)] > 1:
+            site_subnets = run['subnets'].get(site, [])
+            devices_for_this_site = [p for p in devices_for_this_site if shared_utils.is_ip_in_subnets(mac_to_ip_map[shared_utils.normalize_mac(p['device_name'])], site_subnets)]
+        if devices_for_this_site:
+            print(f"Delegating {len(devices_for_this_site)} of the {len(site_phone_lists.get(site) or [])} CUCM device(s) of '{site}' for enrichment.")
+            shared_utils.write_yaml_in_background(f"{OUTPUT_DIR}{site}/devices_to_enrich.yml", devices_for_this_site, 'vtc_devices')
+            # Only the MACs of this site's devices are needed, not the whole group ARP table
+            site_macs = {shared_utils.normalize_mac(p['device_name']) for p in devices_for_this_site}
+            enrichment_inputs[site] = {'devices_to_enrich': devices_for_this_site,
+                                       'mac_to_ip_map': {mac: mac_to_ip_map[mac] for mac in site_macs}}
+        else:
+            # An empty report still records that the site was checked, so its enrichment node counts as fresh
+            print(f"No VTC/Phones of site '{site}' found in the group ARP table. Nothing to enrich.")
+            shared_utils.write_yaml_in_background(f"{OUTPUT_DIR}{site}/devices_to_enrich.yml", [], 'vtc_devices')
+            shared_utils.write_yaml_in_background(f"{OUTPUT_DIR}{site}/vtc_devices_enriched.yml", [], 'vtc_devices')
+    worker_pool.run_phase_for_sites(run['pool'], list(enrichment_inputs), "enrichment", site_options=enrichment_inputs)
+
+def _run_dashboard_node(run: dict, planned: bool):
+    print("\n--- CONDUCTOR WORKFLOW: GENERATING DASHBOARD ---")
+    shared_utils.flush_background_writer() # The dashboard reads the reports back from disk
+    dashboard_generator_tool.generate_dashboard(run['sites'])
+
+PHASE_EXECUTORS = {
+    'discovery': _run_discovery_node,
+    'arp': _run_arp_node,
+    'aggregate': _run_aggregate_node,
+    'cucm': _run_cucm_node,
+    'enrichment': _run_enrichment_node,
+    'backup': _run_backup_node,
+    'dashboard': _run_dashboard_node,
+}
+
+# --- Daemon Mode ---
+# Default per-phase schedules (seconds between runs) for --daemon; override with --schedule NODE=SECONDS.
+# Enrichment follows its freshness TTL; it re-reads the CUCM cache and the group ARP table each time.
+DAEMON_SCHEDULES = {'arp': 5 * 60, 'enrichment': 15 * 60, 'backup': 3600, 'discovery': 24 * 3600}
+# Each run is moved by up to this fraction of its interval, so sites and phases don't all fire at once
+DAEMON_JITTER = 0.1
+# Pooled SSH sessions unused for this long are closed (longer than the shortest schedule keeps them warm)
+DAEMON_SESSION_IDLE_TIMEOUT = 15 * 60
+
+def _parse_schedules(schedule_args: list, run_mode: str = None) -> dict:
+    # Turns ['arp=300', 'backup=3600'] into {'arp': 300.0, 'backup': 3600.0} on top of DAEMON_SCHEDULES.
+    # With a 'run_mode' only the phases that mode needs are scheduled.
+    mode_nodes = phase_graph._required_nodes(phase_graph.MODE_TARGETS[run_mode]) if run_mode else list(phase_graph.PHASE_GRAPH)
+    schedules = dict(DAEMON_SCHEDULES)
+    for item in schedule_args or []:
+        node, _, seconds = item.partition('=')
+        if node not in phase_graph.PHASE_GRAPH or phase_graph.PHASE_GRAPH[node]['scope'] != 'site':
+            raise ValueError(f"Unknown schedulable phase '{node}' in --schedule.")
+        if node not in mode_nodes:
+            raise ValueError(f"Phase '{node}' in --schedule is not part of run mode '{run_mode}'.")
+        schedules[node] = float(seconds)
+    schedules = {node: seconds for node, seconds in schedules.items() if seconds > 0 and node in mode_nodes}
+    if not schedules:
+        raise ValueError("No phase left to schedule in daemon mode.")
+    return schedules
+
+def _next_due(now: float, interval: float, jitter: float) -> float:
+    return now + interval * (1 + random.uniform(-jitter, jitter))
+
+def _report_governor_metrics():
+    # Prints how long connections queued for each governor scope and saves the numbers for tuning configs/governor.yml
+    metrics = governor_tool.get_governor().metrics()
+    if not metrics:
+        return
+    print("\n--- CONNECTION GOVERNOR: queue waits ---")
+    for scope, stats in metrics.items():
+        print(f"  - {scope}: {stats['acquired']} acquired, {stats['blocked']} waited on this limit, avg wait {stats['avg_wait']:.2f}s, max wait {stats['max_wait']:.2f}s")
+    shared_utils.write_yaml_in_background(f"{OUTPUT_DIR}governor_metrics.yml", metrics, 'governor_metrics')
+
+def run_cycle(run: dict, targets: list, force: bool = False, ttls: dict = None):
+    # Plans and executes one pass over the phase graph for the given target nodes.
+    # Each cycle gets its own scan cache, so devices are re-scanned every cycle but only once within it.
+    plan = phase_graph.plan_run(targets, run['sites'], OUTPUT_DIR, force, ttls)
+    print(f"\nPlan for {targets}:")
+    for node, planned in plan.items():
+        work = sorted(planned) if isinstance(planned, set) else ("run" if planned else "skip")
+        print(f"  - {node}: {work if work else 'fresh, skipping'}")
+    run.update({'plan': plan, 'arp_tables': {}, 'subnets': {}, 'fused_backup_sites': set(), 'force_refresh': force,
+                'site_vtc_patterns': {}, 'site_phone_lists': None})
+    run['scan_cache_dir'] = scan_cache.create_scan_cache_dir()
+    try:
+        phase_graph.run_graph(plan, {node: functools.partial(executor, run) for node, executor in PHASE_EXECUTORS.items()})
+    finally:
+        # The conductor's own calls (the CUCM query) add to the latency history too
+        timeout_policy_tool.flush()
+        _report_governor_metrics()
+        shared_utils.flush_background_writer()
+        shutil.rmtree(run['scan_cache_dir'], ignore_errors=True)
+
+def run_daemon(run: dict, schedules: dict, jitter: float = DAEMON_JITTER, group_targets: list = ()):
+    # Runs forever, re-running each scheduled phase when its (jittered) interval has passed.
+    # Phases that are due are forced; everything they depend on is only re-run once stale by its own schedule.
+    # The first cycle runs everything whose outputs are older than its schedule.
+    # 'group_targets' (e.g. the dashboard) have no schedule of their own and are rebuilt after every cycle.
+    print(f"\n--- DAEMON MODE: schedules {schedules} (jitter {jitter:.0%}) ---")
+    next_due = {node: time.time() for node in schedules}
+    first_cycle = True
+    while True:
+        now = time.time()
+        due = [node for node, due_at in next_due.items() if due_at <= now]
+        if due:
+            ttls = dict(schedules) if first_cycle else {node: (0 if node in due else seconds) for node, seconds in schedules.items()}
+            print(f"\n--- DAEMON CYCLE at {time.strftime('%Y-%m-%d %H:%M:%S')}: due {due} ---")
+            try:
+                run_cycle(run, due + list(group_targets), ttls=ttls)
+            except Exception as e:
+                # A failed cycle is retried at the phase's next scheduled time rather than killing the daemon
+                print(f"\nDAEMON CYCLE ERROR: {e}")
+            first_cycle = False
+            for node in due:
+                next_due[node] = _next_due(time.time(), schedules[node], jitter)
+        sleep_for = max(1.0, min(next_due.values()) - time.time())
+        print(f"\n--- DAEMON: sleeping {sleep_for:.0f}s until the next phase is due. ---")
+        time.sleep(sleep_for)
+
 # --- Main Execution Block ---
 def main():
     parser = argparse.ArgumentParser(description="SAD Platform Conductor")
     parser.add_argument("--target", required=True, help="The site or group to process.")
-    parser.add_argument("--run-mode", default="full",
-                        choices=['full', 'discovery_only', 'backup_configs', 'generate_dashboard'],
-                        help="Specify the operational workflow to run.")
+    parser.add_argument("--run-mode", default=None,
+                        choices=list(phase_graph.MODE_TARGETS),
+                        help="Specify the operational workflow to run (default: full). With --daemon, only the phases "
+                             "this mode needs are scheduled (default: every scheduled phase).")
+    parser.add_argument("--max-parallel-sites", type=int, default=4,
+                        help="Maximum number of sites processed at the same time.")
+    parser.add_argument("--force-refresh", action="store_true",
+                        help="Re-run every phase the run mode needs, even if its outputs are still fresh.")
+    parser.add_argument("--incremental-discovery", action="store_true",
+                        help="Only pull 'show cdp neighbors detail' from devices whose CDP summary fingerprint changed.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running, re-running each phase on its own schedule and reusing SSH sessions between cycles.")
+    parser.add_argument("--schedule", action="append", metavar="PHASE=SECONDS",
+                        help=f"Daemon schedule for a phase, e.g. 'arp=300' (0 disables it). Defaults: {DAEMON_SCHEDULES}.")
+    parser.add_argument("--jitter", type=float, default=DAEMON_JITTER,
+                        help="Fraction of each interval by which daemon runs are randomly moved.")
     args = parser.parse_args()
     print("--- SAD Platform Conductor ---")
     
     temp_creds_file = None
-    temp_arp_cache_file = None
+    pool = None
+    governor_server = None
+    shared_utils.start_background_writer()
     try:
+        schedules = _parse_schedules(args.schedule, args.run_mode) if args.daemon else None
         # --- 1. Load Credentials and Create Secure Temp File ---
         master_password = credential_loader.getpass.getpass("Enter master password to unlock credentials: ")
         creds = credential_loader.load_credentials(CREDENTIALS_FILE, master_password)
@@ -62,6 +369,13 @@ def main():
             temp_creds_file = tf.name
         print("Success: Credentials decrypted and loaded into a temporary cache.")
         os.environ['SAD_TEMP_CREDS_FILE'] = temp_creds_file
+        # Started before the pool so every worker shares the same connection limits
+        governor_server = governor_tool.start_governor_server()
+        if args.daemon:
+            # Sites stick to one worker so its pooled SSH sessions are reused every cycle
+            pool = worker_pool.SiteAffinityPool(args.max_parallel_sites, temp_creds_file, DAEMON_SESSION_IDLE_TIMEOUT)
+        else:
+            pool = worker_pool.create_worker_pool(args.max_parallel_sites, temp_creds_file)
         
         # --- 2. Load Static Configurations ---
         with open(f"{CONFIG_DIR}network_devices.yml", 'r') as f:
@@ -76,127 +390,34 @@ def main():
             exit(1)
         print(f"\nFinal list of sites to be processed: {sites_to_process}")
 
-        # --- 4. Phase 1: Run Discovery and ARP for all sites (Required for most modes) ---
-        # This block is run for all modes that need discovery data
-        run_discovery = args.run_mode != 'discovery_only'
-        if args.run_mode == 'discovery_only':
-            # discovery_only mode doesn't technically depend on other phases, so it has its own simple loop
-            print("\nRun mode is 'discovery_only'. Running discovery phase...")
-            for site in sites_to_process:
-                print(f"\n-> Running Discovery/ARP for site: {site}")
-                command = ["python", ORCHESTRATOR_SCRIPT, "--site", site, "--phase", "discovery_and_arp"]
-                result = subprocess.run(command)
-            run_discovery = False # Prevent running discovery again
-        
-        if run_discovery:
-            print("\n--- CONDUCTOR PHASE 1: DISCOVERY & ARP COLLECTION ---")
-            group_arp_table = {}
-            site_subnet_map = {}
-            for site in sites_to_process:
-                print(f"\n-> Running Discovery/ARP for site: {site}")
-                command = ["python", ORCHESTRATOR_SCRIPT, "--site", site, "--phase", "discovery_and_arp"]
-                result = subprocess.run(command)
-                if result.returncode != 0:
-                    raise Exception(f"Worker script failed during discovery for site: {site}")
-                try:
-                    with open(f"{OUTPUT_DIR}/arp_table.yml", 'r') as f:
-                        site_arp_data = yaml.safe_load(f).get('arp_table', {})
-                    if isinstance(site_arp_data, dict):
-                        group_arp_table.update(site_arp_data)
-                    else:
-                        print(f"  -> ERROR: Type mismatch. ARP data for site '{site}' is not a dictionary.")
-                    with open(f"{OUTPUT_DIR}{site}/discovered_vlans.yml", 'r') as f:
-                        site_subnet_map[site] = yaml.safe_load(f).get('vlan_info', {}).get('subnet_list', [])
-                except FileNotFoundError:
-                    print(f"Warning: Could not load discovery output for site {site}.")
-
-            # --- DEBUG BLOCK #1: Inspect the Final ARP Table ---
-            # print("\n" + "="*20 + " ARP AGGREGATION DEBUG " + "="*20)
-            # print(f"Final Aggregated group_arp_table contains {len(group_arp_table)} entries.")
-            # if group_arp_table:
-            #     print("Sample of aggregated ARP entries:")
-            #     for ip, details in itertools.islice(group_arp_table.items(), 3):
-            #         print(f"  IP: {ip}, MAC: {details.get('mac_address')}")
-            #     print("="*61 + "\n")
-            # --- END DEBUG BLOCK #1 ---
-
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".json", encoding='utf-8') as tf:
-                json.dump(group_arp_table, tf)
-                temp_arp_cache_file = tf.name
-            os.environ['SAD_GROUP_ARP_CACHE'] = temp_arp_cache_file
-            print("Success: Aggregated ARP entries and created temporary cache.")
-
-        # --- 5. Conditional Workflow based on --run-mode ---
-        if args.run_mode == 'backup_configs':
-            print("\n--- CONDUCTOR WORKFLOW: CONFIGURATION BACKUP ---")
-            for site in sites_to_process:
-                print(f"\n-> Delegating config backup for site: {site}")
-                command = ["python", ORCHESTRATOR_SCRIPT, "--site", site, "--phase", "backup_configs"]
-                subprocess.run(command)
-        
-        elif args.run_mode == 'full' or args.run_mode == 'generate_dashboard':
-            print("\n--- CONDUCTOR WORKFLOW: VTC/PHONE ENRICHMENT ---")
-            primary_site_name = args.target if args.target in site_subnet_map else sites_to_process[0]
-            primary_site_devices = [dev for dev in all_network_devices if dev.get('site') == primary_site_name]
-            primary_site_seed = shared_utils.find_device_by_role(primary_site_devices, 'discovery_seed')
-            vtc_pattern = shared_utils.generate_vtc_pattern(primary_site_seed['ip']) if primary_site_seed else None
-
-            if vtc_pattern:
-                global_phone_list = cucm_vtc_tool.get_vtc_devices(services_config['cucm_cluster']['publisher_ip'], creds['cucm_user'], creds['cucm_pass'], vtc_pattern)
-                if global_phone_list:
-                    mac_to_ip_map = {shared_utils.normalize_mac(details['mac_address']): ip for ip, details in group_arp_table.items()}
-
-                    # --- DEBUG BLOCK #2: Inspect the MAC addresses ---
-                    # print("\n" + "="*20 + " VTC FILTERING DEBUG " + "="*20)
-                    # print(f"CUCM returned {len(global_phone_list)} devices.")
-                    # print(f"The mac_to_ip_map (from ARP table) contains {len(mac_to_ip_map)} entries.")
-                    # sample_phone_from_cucm = global_phone_list[0]
-                    # cucm_mac_raw = sample_phone_from_cucm.get('device_name')
-                    # cucm_mac_normalized = shared_utils.normalize_mac(cucm_mac_raw)
-                    # sample_arp_mac_raw = list(group_arp_table.values())[0].get('mac_addres') if group_arp_table else "N/A"
-                    # arp_mac_normalized = shared_utils.normalize_mac(sample_arp_mac_raw)
-                    # print("\n--- MAC Address Format Comparison ---")
-                    # print(f"Sample CUCM MAC (Raw)        : {cucm_mac_raw}")
-                    # print(f"Sample CUCM Mac (Normalized) : {cucm_mac_normalized}")
-                    # print(f"Sample ARP Mac (Raw)         : {sample_arp_mac_raw}")
-                    # print(f"Sample ARP Mac (Normalized)  : {arp_mac_normalized}")
-                    # match_found = cucm_mac_normalized in mac_to_ip_map
-                    # print(f"\nDoes the sample normlaized CUCM MAC exist in the ARP map? -> {match_found}")
-                    # print("="*59 + "\n")
-                    # --- END DEBUG BLOCK #2
-
-                    group_phones = [phone for phone in global_phone_list if shared_utils.normalize_mac(phone['device_name']) in mac_to_ip_map]
-                    print(f"Success: Filtered global list down to {len(group_phones)} phones belonging to this group.")
-                    for site in sites_to_process:
-                        site_subnets = site_subnet_map.get(site, [])
-                        devices_for_this_site = [p for p in group_phones if shared_utils.is_ip_in_subnets(mac_to_ip_map.get(shared_utils.normalize_mac(p['device_name'])), site_subnets)]
-                        if devices_for_this_site:
-                            print(f"Delegating {len(devices_for_this_site)} devices to '{site}' for enrichment.")
-                            shared_utils.save_data_to_yaml(f"{OUTPUT_DIR}{site}/devices_to_enrich.yml", devices_for_this_site, 'vtc_devices')
-                            command = ["python", ORCHESTRATOR_SCRIPT, "--site", site, "--phase", "enrichment"]
-                            subprocess.run(command)
-                        else:
-                            print(f"No VTC/Phones from the group found in this site '{site}'. Skipping enrichment.")
-            else:
-                print("Warning: Could not generate VTC pattern. Skipping all VTC/Phone tasks.")
-            
-            if args.run_mode == 'generate_dashboard':
-                print("\n--- CONDUCTOR WORKFLOW: GENERATING DASHBOARD ---")
-                print("Backing up configurations first...")
-                for site in sites_to_process:
-                    command = ["python", ORCHESTRATOR_SCRIPT, "--site", site, "--phase", "backup_configs"]
-                    subprocess.run(command)
-                dashboard_generator_tool.generate_dashboard(sites_to_process)
+        # --- 4. Plan and execute the phase graph, skipping anything still fresh ---
+        # Independent branches run concurrently; devices shared between sites are scanned once per cycle
+        run = {
+            'pool': pool, 'creds': creds, 'target': args.target, 'sites': sites_to_process,
+            'all_network_devices': all_network_devices, 'services_config': services_config,
+            'incremental_discovery': args.incremental_discovery,
+        }
+        run_mode = args.run_mode or 'full'
+        if args.daemon:
+            group_targets = [node for node in phase_graph.MODE_TARGETS[run_mode] if phase_graph.PHASE_GRAPH[node]['scope'] == 'group'] if args.run_mode else []
+            run_daemon(run, schedules, args.jitter, group_targets)
+        else:
+            print(f"\nRun mode '{run_mode}':")
+            run_cycle(run, phase_graph.MODE_TARGETS[run_mode], args.force_refresh)
     
+    except KeyboardInterrupt:
+        print("\nConductor stopped by user.")
     except (FileNotFoundError, InvalidTag, ValueError, yaml.YAMLError, Exception) as e:
         print(f"\nCRITICAL CONDUCTOR ERROR: {e}")
     finally:
+        if pool:
+            pool.shutdown()
+        if governor_server:
+            governor_server.shutdown()
+        shared_utils.stop_background_writer()
         if temp_creds_file and os.path.exists(temp_creds_file):
             print("\nCleaning up temporary credential file...")
             os.remove(temp_creds_file)
-        if temp_arp_cache_file and os.path.exists(temp_arp_cache_file):
-            print("\nCleaning up temporary ARP cache file...")
-            os.remove(temp_arp_cache_file)
     print("\n--- Conductor has finished all phases. ---")
 
 if __name__ == "__main__":
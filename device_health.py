@@ -0,0 +1,90 @@
+import os
+import time
+import datetime
+# --- Local Module Imports ---
+import shared_utils
+
+# --- Configuration ---
+# A per-target circuit breaker, persisted under CACHE_DIR so it carries over between phases and runs.
+# After FAILURE_THRESHOLD consecutive connection failures a target is skipped (the circuit is "open")
+# instead of waiting out its connect timeout again. Once the backoff window has passed, one caller
+# probes the target ("half-open"): success closes the circuit, failure re-opens it for twice as long.
+HEALTH_DIR = f"{shared_utils.CACHE_DIR}device_health/"
+FAILURE_THRESHOLD = int(os.getenv('SAD_BREAKER_THRESHOLD', '3'))
+BASE_BACKOFF_SECONDS = 15 * 60
+MAX_BACKOFF_SECONDS = 6 * 3600
+# A probe that has not reported back after this long (e.g. its worker crashed) lets another caller probe
+PROBE_STALE_AFTER = 600
+# Set SAD_BREAKER=off to always attempt every target (records are still kept)
+BREAKER_ENABLED = os.getenv('SAD_BREAKER', 'on').lower() != 'off'
+
+# Records are small per-target JSON files, so workers updating different devices never contend.
+# Each read-modify-write holds the target's record lock, since the same device can be reached from several
+# processes at once (sites sharing infrastructure, the enrichment and backup phases, the syslog listener).
+
+def _paths(target: str) -> tuple[str, str]:
+    # Returns the (record, probe lock) file paths for one target
+    safe_key = target.replace(':', '_').replace('/', '_')
+    return f"{HEALTH_DIR}{safe_key}.json", f"{HEALTH_DIR}{safe_key}.probe"
+
+def _backoff(trips: int) -> float:
+    return min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** max(0, trips - 1))
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+def open_circuit(target: str, now: float = None) -> dict | None:
+    # Returns a summary of the target's open circuit for reports, or None if the target is not being skipped
+    record = shared_utils.load_json_cache(_paths(target)[0])
+    if record.get('open_until', 0) <= (now or time.time()):
+        return None
+    return {'state': 'circuit_open', 'consecutive_failures': record['failures'], 'last_error': record.get('last_error'),
+            'retry_after': _isoformat(record['open_until'])}
+
+def allow_attempt(target: str, now: float = None) -> bool:
+    # Decides whether to connect to a target. Returns False while its circuit is open, and for everyone but
+    # the single caller that gets to probe it once the backoff has passed.
+    if not BREAKER_ENABLED:
+        return True
+    now = now or time.time()
+    record_path, probe_path = _paths(target)
+    record = shared_utils.load_json_cache(record_path)
+    if record.get('failures', 0) < FAILURE_THRESHOLD:
+        return True
+    if record.get('open_until', 0) > now:
+        print(f"  -> [BREAKER] Skipping {target}: {record['failures']} consecutive failures, retrying after {_isoformat(record['open_until'])}.")
+        return False
+    os.makedirs(HEALTH_DIR, exist_ok=True)
+    if shared_utils.try_acquire_file_lock(probe_path, PROBE_STALE_AFTER):
+        print(f"  -> [BREAKER] Probing {target} after its backoff window.")
+        return True
+    print(f"  -> [BREAKER] Skipping {target}: another worker is probing it.")
+    return False
+
+def record_success(target: str):
+    # Closes the target's circuit. Healthy targets without failures are not written (or locked) at all.
+    record_path, probe_path = _paths(target)
+    if shared_utils.load_json_cache(record_path).get('failures'):
+        with shared_utils.exclusive_file_lock(f"{record_path}.lock"):
+            record = shared_utils.load_json_cache(record_path)
+            if record.get('failures'):
+                if record['failures'] >= FAILURE_THRESHOLD:
+                    print(f"  -> [BREAKER] {target} is reachable again. Closing its circuit.")
+                shared_utils.save_json_cache(record_path, {'failures': 0, 'trips': 0, 'last_success': _isoformat(time.time())})
+    shared_utils.release_file_lock(probe_path)
+
+def record_failure(target: str, error: str, now: float = None):
+    # Counts a connection failure; at FAILURE_THRESHOLD (or when a probe fails) the circuit opens
+    now = now or time.time()
+    record_path, probe_path = _paths(target)
+    with shared_utils.exclusive_file_lock(f"{record_path}.lock"):
+        record = shared_utils.load_json_cache(record_path)
+        record['failures'] = record.get('failures', 0) + 1
+        record['last_error'] = error
+        record['last_failure'] = _isoformat(now)
+        if record['failures'] >= FAILURE_THRESHOLD:
+            record['trips'] = record.get('trips', 0) + 1
+            record['open_until'] = now + _backoff(record['trips'])
+            print(f"  -> [BREAKER] Opening circuit for {target} until {_isoformat(record['open_until'])} ({record['failures']} consecutive failures).")
+        shared_utils.save_json_cache(record_path, record)
+    shared_utils.release_file_lock(probe_path)
@@ -1,38 +1,204 @@
 import os
+import re
 import yaml
 import argparse
 import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 # --- Local Module Imports ---
+import device_health
+import scan_cache
 import shared_utils
-from tools import cisco_arp_tool, cisco_cdp_tool, cisco_config_tool, cisco_vlan_tool, vtc_api_tool
+import vtc_status_cache
+from tools import cisco_arp_tool, cisco_cdp_tool, cisco_config_tool, cisco_session_tool, cisco_vlan_tool, config_archive_tool, governor_tool, nxapi_tool, snmp_tool, timeout_policy_tool, vtc_api_tool
 
 # --- Configuration ---
 CONFIG_DIR = "./configs/"
 OUTPUT_DIR = "./output/"
 DISCOVERY_EXCLUSION_PATTERNS = ['SEP*', "*spine*", "*leaf*"]
+DISCOVERY_MAX_WORKERS = int(os.getenv('SAD_DISCOVERY_WORKERS', '16'))
+# VTC status polls in flight at once during enrichment (the governor's 'vtc_api' limit still applies)
+ENRICHMENT_MAX_WORKERS = int(os.getenv('SAD_ENRICHMENT_WORKERS', '32'))
+# ARP is only collected from devices advertising one of these CDP capabilities (i.e. L3 devices).
+# Devices with unknown capabilities (such as the seed) are always collected from.
+ARP_CAPABILITIES = ['Router']
+# CDP platform strings of Nexus switches; discovered neighbors matching this are treated as 'cisco_nxos'.
+# Searched anywhere in the string, since CDP often reports the model with a vendor prefix ("cisco N7K-C7010").
+NXOS_PLATFORM_PATTERN = re.compile(r"\b(N9K-|N7K-|N77-|N5K-|N3K-|Nexus)", re.IGNORECASE)
+# Per-site index of each device's last-change marker (device name -> marker), kept next to the config backups
+CONFIG_MARKERS_FILE = "config_markers.json"
 
-# --- Main Phase Functions ---
-def do_discovery_and_arp_phase(site_name, site_seed_device, creds, mgmt_override):
-    # Phase 1: Discovery topology and collect all ARP data for a single site
-    print(f"--- Starting Discovery & ARP Phase for site: {site_name} ---")
-    output_dir = f"{OUTPUT_DIR}{site_name}/"
-    os.makedirs(output_dir, exist_ok=True)
-    subnet_info = cisco_vlan_tool.get_vlan_and_subnet_info(site_seed_device, creds['net_user'], creds['net_pass'])
-    site_subnets = subnet_info.get('subnet_list', [])
-    if not site_subnets:
-        print("Critical Error: No subnets discovered. Aborting.")
+# --- Batched Device Collection ---
+# Each collectable part maps to the commands it needs and the parser that turns their raw outputs into results.
+# The config part's commands are chosen per device by cisco_config_tool.config_commands (file transfer or scrape).
+DEVICE_DATA_PARTS = {
+    'vlan': (cisco_vlan_tool.VLAN_COMMANDS, lambda outputs, device: cisco_vlan_tool.parse_vlan_outputs(outputs)),
+    'cdp': (cisco_cdp_tool.CDP_COMMANDS, lambda outputs, device: cisco_cdp_tool.parse_cdp_outputs(outputs, device['ip'])),
+    'arp': (cisco_arp_tool.ARP_COMMANDS, lambda outputs, device: cisco_arp_tool.parse_arp_outputs(outputs)),
+    'config': (cisco_config_tool.CONFIG_COMMANDS, lambda outputs, device: cisco_config_tool.parse_config_outputs(outputs, device.get('type', 'cisco_ios'))),
+}
+
+def collect_device_data(device, creds, parts, cdp_cache=None, config_markers=None, backend='ssh'):
+    # Collects the requested parts from a device.
+    # With the 'snmp' backend the ARP and CDP tables are bulk-walked over SNMP instead of logging in.
+    # Device types with an NX-API driver get their parts as JSON over HTTPS; anything SNMP or NX-API
+    # can't provide (or failed to) falls back to the SSH batch below.
+    # Devices whose circuit breaker is open (see device_health) are skipped: every part comes back None.
+    if not device_health.allow_attempt(device['ip']):
+        return {part: None for part in parts}
+    results = {}
+    if backend == 'snmp':
+        if creds.get('snmp_community'):
+            results = snmp_tool.collect_parts(device, creds['snmp_community'], parts)
+            parts = [part for part in parts if results.get(part) is None]
+        else:
+            print(f"  -> Warning: No 'snmp_community' credential stored. Using SSH for {device['ip']}.")
+    if parts and nxapi_tool.uses_nxapi(device):
+        results.update(nxapi_tool.collect_parts(device, creds['net_user'], creds['net_pass'], parts))
+        parts = [part for part in parts if results.get(part) is None]
+    if not parts:
+        device_health.record_success(device['ip'])
+        return results
+    results.update(_collect_over_ssh(device, creds, parts, cdp_cache, config_markers))
+    return results
+
+def _collect_over_ssh(device, creds, parts, cdp_cache=None, config_markers=None):
+    # Runs the commands for every requested part over a single login to the device.
+    # With a 'cdp_cache' (IP -> cached neighbor entry) the CDP part runs incrementally: a cheap summary
+    # probe is fingerprinted and the detail output is only pulled when it changed. The cache is updated in place.
+    # With 'config_markers' (device name -> last-change marker) the config part first reads the device's
+    # last-change marker and only pulls the full running-config when it moved.
+    # Returns a dict keyed by part name; every part is None if the session could not be opened.
+    incremental_cdp = cdp_cache is not None and 'cdp' in parts
+    cache_entry = cdp_cache.get(device['ip']) if incremental_cdp else None
+    commands = []
+    for part in parts:
+        if part == 'cdp' and incremental_cdp:
+            commands.extend(cisco_cdp_tool.incremental_cdp_commands(cache_entry))
+        elif part == 'config' and config_markers is not None:
+            stored_marker = config_markers.get(device.get('device_name'))
+            commands.extend(cisco_config_tool.precheck_config_commands(device, stored_marker))
+        elif part == 'config':
+            commands.extend(cisco_config_tool.config_commands(device))
+        else:
+            commands.extend(DEVICE_DATA_PARTS[part][0])
+    outputs = cisco_session_tool.run_command_batch(device, creds['net_user'], creds['net_pass'], commands)
+    if outputs is None:
+        device_health.record_failure(device['ip'], "SSH session could not be opened")
+        return {part: None for part in parts}
+    device_health.record_success(device['ip'])
+    results = {}
+    for part in parts:
+        try:
+            if part == 'cdp' and incremental_cdp:
+                results[part], new_entry = cisco_cdp_tool.parse_incremental_cdp_outputs(outputs, device['ip'], cache_entry)
+                if new_entry:
+                    cdp_cache[device['ip']] = new_entry
+                else:
+                    cdp_cache.pop(device['ip'], None)
+            else:
+                results[part] = DEVICE_DATA_PARTS[part][1](outputs, device)
+        except Exception as e:
+            print(f"  -> Error parsing '{part}' output from {device['ip']}: {e}")
+            results[part] = None
+    return results
+
+def make_device_collector(creds, cdp_cache=None, scan_cache_dir=None, config_markers=None, backend='ssh'):
+    # Returns a collect(device, parts) function for a phase.
+    # With a run-scoped 'scan_cache_dir' the results are shared with every other worker in the run,
+    # so devices reachable from several sites are only scanned once.
+    def collect(device, parts):
+        if not scan_cache_dir:
+            return collect_device_data(device, creds, parts, cdp_cache, config_markers, backend)
+        return scan_cache.cached_scan(scan_cache_dir, device, parts, lambda missing: collect_device_data(device, creds, missing, cdp_cache, config_markers, backend))
+    return collect
+
+# --- Discovery Engine ---
+def _standardize_neighbor(neighbor, site_subnets, mgmt_override):
+    # Applies the exclusion, override and subnet scoping rules to one CDP neighbor.
+    # Returns the standardized device dictionary, or None if the neighbor is out of scope.
+    neighbor_name = neighbor.get('device_name', '')
+    override_info = mgmt_override.get(neighbor_name)
+    neighbor_ip = override_info.get('management_ip') if override_info else neighbor.get('ip_address')
+    if shared_utils.is_excluded(neighbor_name, DISCOVERY_EXCLUSION_PATTERNS):
+        return None
+    if not neighbor_ip or not shared_utils.is_ip_in_subnets(neighbor_ip, site_subnets):
+        return None
+    platform = neighbor.get('platform', 'N/A')
+    device_type = 'cisco_nxos' if NXOS_PLATFORM_PATTERN.search(platform or '') else 'cisco_ios'
+    standardized = {'device_name': neighbor_name, 'ip': neighbor_ip, 'type': device_type, 'platform': platform}
+    if 'capabilities' in neighbor:
+        standardized['capabilities'] = neighbor['capabilities']
+    return standardized
+
+def needs_arp_collection(device, device_roles):
+    # Decides whether a device's ARP table is worth collecting.
+    # Roles from network_devices.yml win: 'arp_source' always collects, 'arp_skip' never does.
+    # Otherwise only devices with an L3 capability in ARP_CAPABILITIES are collected; pure L2
+    # switches only hold their own management entry, which their gateway's ARP table already has.
+    roles = device_roles.get(device.get('device_name'), [])
+    if 'arp_source' in roles:
+        return True
+    if 'arp_skip' in roles:
         return False
-    shared_utils.save_data_to_yaml(f"{output_dir}discoverd_vlans.yml", subnet_info, 'vlan_info')
+    capabilities = device.get('capabilities')
+    if capabilities is None:
+        return True
+    return any(capability in ARP_CAPABILITIES for capability in capabilities)
 
-    standardized_seed = {'device_name': site_seed_device.get('device_name', site_seed_device['ip']), 'ip': site_seed_device['ip'], 'type': site_seed_device.get('type', 'cisco_ios')}
-    devices_to_scan = [standardized_seed]
+def _stream_scans(seed_device, scan_device, mgmt_override, site_subnets, max_workers, scan_results):
+    # Scans devices as soon as they are discovered, with no per-hop barrier.
+    # Every in-scope neighbor is submitted the moment its parent's scan returns, so collection
+    # (ARP, config) riding in the same session overlaps the rest of the walk. Fills 'scan_results' by IP.
+    claimed_names, submitted_ips = set(), set()
+    ready, pending = [], {}
+
+    def submit(device):
+        claimed_names.add(device.get('device_name'))
+        submitted_ips.add(device['ip'])
+        if device['ip'] in scan_results:
+            ready.append(device)
+        else:
+            pending[executor.submit(scan_device, device)] = device
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        submit(seed_device)
+        while ready or pending:
+            if not ready:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    device = pending.pop(future)
+                    scan_results[device['ip']] = future.result()
+                    ready.append(device)
+            device = ready.pop(0)
+            for neighbor in scan_results[device['ip']].get('cdp') or []:
+                candidate = _standardize_neighbor(neighbor, site_subnets, mgmt_override)
+                if candidate and candidate['device_name'] not in claimed_names and candidate['ip'] not in submitted_ips:
+                    submit(candidate)
+            print(f"--- [DISCOVERY] {len(scan_results)} device(s) scanned, {len(pending)} in flight... ---")
+
+def discover_topology(seed_device, scan_device, mgmt_override, site_subnets, max_workers=DISCOVERY_MAX_WORKERS, known_results=None):
+    # Discovers the site topology from the seed via CDP.
+    # 'scan_device' returns a collect_device_data() style dict with at least a 'cdp' entry;
+    # 'known_results' holds scans already done (e.g. the seed) keyed by IP.
+    # The scans are streamed concurrently, then the serial breadth-first walk is replayed over the
+    # collected results so the dedupe rules give exactly the same topology as a one-at-a-time walk.
+    # Any device the replay needs that the streaming pass did not scan is scanned during the replay.
+    # Returns the topology keyed by IP and the scan results keyed by IP.
+    scan_results = dict(known_results or {})
+    _stream_scans(seed_device, scan_device, mgmt_override, site_subnets, max_workers, scan_results)
+
+    devices_to_scan = [seed_device]
     discovered_topology, discovered_by_name, scanned_ips = {}, {}, set()
     while devices_to_scan:
         current_device = devices_to_scan.pop(0)
         current_ip = current_device['ip']
         if current_ip in scanned_ips:
             continue
-        neighbors = cisco_cdp_tool.get_discovered_devices(current_device, creds['net_user'], creds['net_pass'])
+        if current_ip not in scan_results:
+            print(f"--- [DISCOVERY] Scanning {current_ip} during replay (claimed under a different name while streaming). ---")
+            scan_results[current_ip] = scan_device(current_device)
+        neighbors = scan_results[current_ip].get('cdp')
         scanned_ips.add(current_ip)
         if current_ip not in discovered_topology:
             discovered_topology[current_ip] = current_device
@@ -42,121 +208,374 @@ def do_discovery_and_arp_phase(site_name, site_seed_device, creds, mgmt_override
             continue
 
         for neighbor in neighbors:
-            neighbor_name = neighbor.get('device_name', '')
-            override_info = mgmt_override.get(neighbor_name)
-            neighbor_ip = override_info.get('management_ip') if override_info else neighbor.get('ip_address')
-            if shared_utils.is_excluded(neighbor_name, DISCOVERY_EXCLUSION_PATTERNS):
-                continue
-            if not neighbor_ip or not shared_utils.is_ip_in_subnets(neighbor_ip, site_subnets) or neighbor_name in discovered_by_name:
+            standardized_neighbor = _standardize_neighbor(neighbor, site_subnets, mgmt_override)
+            if not standardized_neighbor or standardized_neighbor['device_name'] in discovered_by_name:
                 continue
-            standardized_neighbor = {'device_name': neighbor_name, 'ip': neighbor_ip, 'type': 'cisco_ios', 'platform': neighbor.get('platform', 'N/A')}
             devices_to_scan.append(standardized_neighbor)
-            discovered_topology[neighbor_ip] = standardized_neighbor
-            discovered_by_name[neighbor_name] = neighbor_ip
-    shared_utils.save_data_to_yaml(f"{output_dir}discovered_topology.yml", list(discovered_topology.values()), "devices")
+            discovered_topology[standardized_neighbor['ip']] = standardized_neighbor
+            discovered_by_name[standardized_neighbor['device_name']] = standardized_neighbor['ip']
+    return discovered_topology, scan_results
+
+# --- Main Phase Functions ---
+def do_discovery_and_arp_phase(site_name, site_seed_device, creds, mgmt_override, with_config_backup=False, incremental=False, scan_cache_dir=None, device_roles=None):
+    # Phase 1: Discovery topology and collect all ARP data for a single site
+    # Every device is logged into once: CDP, ARP (and optionally the running-config) share a session.
+    # In incremental mode each device's neighbor list is reused from the site's CDP cache unless its fingerprint changed.
+    # ARP is only requested from L3-capable devices (see needs_arp_collection).
+    # Returns {'subnet_list', 'topology', 'arp_table'} for the conductor, or None on failure.
+    print(f"--- Starting Discovery & ARP Phase for site: {site_name} ---")
+    output_dir = f"{OUTPUT_DIR}{site_name}/"
+    os.makedirs(output_dir, exist_ok=True)
+    device_roles = device_roles or {}
+    extra_parts = ['config'] if with_config_backup else []
+    parts_for = lambda dev: ['cdp'] + (['arp'] if needs_arp_collection(dev, device_roles) else []) + extra_parts
+    cdp_cache_path = f"{shared_utils.CACHE_DIR}cdp_neighbors_{site_name}.json"
+    cdp_cache = shared_utils.load_json_cache(cdp_cache_path) if incremental else None
+    if with_config_backup:
+        config_backup_dir, archive_dir = _prepare_config_dirs(site_name)
+        config_markers = shared_utils.load_json_cache(f"{config_backup_dir}{CONFIG_MARKERS_FILE}")
+        loaded_markers = dict(config_markers)
+    else:
+        config_markers = None
+
+    standardized_seed = {'device_name': site_seed_device.get('device_name', site_seed_device['ip']), 'ip': site_seed_device['ip'], 'type': site_seed_device.get('type', 'cisco_ios')}
+    # A site can switch ARP/CDP collection to SNMP with 'collection_backend: snmp' on its seed
+    collect = make_device_collector(creds, cdp_cache, scan_cache_dir, config_markers, site_seed_device.get('collection_backend', 'ssh'))
+    seed_result = collect(standardized_seed, ['vlan'] + parts_for(standardized_seed))
+    subnet_info = seed_result.get('vlan') or {"vlan_list": [], "subnet_list": []}
+    site_subnets = subnet_info.get('subnet_list', [])
+    if not site_subnets:
+        print("Critical Error: No subnets discovered. Aborting.")
+        return None
+    shared_utils.save_report_yaml(f"{output_dir}discovered_vlans.yml", subnet_info, 'vlan_info')
+
+    discovered_topology, scan_results = discover_topology(
+        standardized_seed, lambda dev: collect(dev, parts_for(dev)), mgmt_override, site_subnets,
+        known_results={standardized_seed['ip']: seed_result})
+    if incremental:
+        # Only keep entries for devices that are still part of the topology
+        shared_utils.save_json_cache(cdp_cache_path, {ip: entry for ip, entry in cdp_cache.items() if ip in discovered_topology})
+    skipped_devices = _mark_open_circuits(discovered_topology.values())
+    shared_utils.save_report_yaml(f"{output_dir}discovered_topology.yml", list(discovered_topology.values()), "devices")
 
     full_arp_table = {}
-    for device in discovered_topology.values():
-        arp_data = cisco_arp_tool.get_cisco_arp_dict(device, creds['net_user'], creds['net_pass'])
+    arp_devices = [device for device in discovered_topology.values() if needs_arp_collection(device, device_roles)]
+    print(f"--- [ARP] Collected ARP from {len(arp_devices)} of {len(discovered_topology)} device(s) (L3-capable or 'arp_source'). ---")
+    for device in arp_devices:
+        arp_data = scan_results.get(device['ip'], {}).get('arp')
         if arp_data:
             full_arp_table.update(arp_data)
-    shared_utils.save_data_to_yaml(f"{output_dir}arp_table.yml", full_arp_table, "arp_table")
-    return True
+    shared_utils.save_report_yaml(f"{output_dir}arp_table.yml", full_arp_table, "arp_table")
 
-def do_enrichment_phase(site_name, creds):
-    # Phase 2: Perform live enrichment on a pre-filtered list of devices
-    print(f"--- Starting Live Enrichment Phase for site: {site_name} ---")
-    output_dir = f"{OUTPUT_DIR}{site_name}/"
+    if with_config_backup:
+        print(f"--- Storing configuration backups for site: {site_name} ---")
+        for device in discovered_topology.values():
+            if device.get('device_name'):
+                config_result = scan_results.get(device['ip'], {}).get('config')
+                _store_device_config(device, config_result, config_backup_dir, archive_dir, config_markers, creds)
+        _save_config_markers(config_backup_dir, loaded_markers, config_markers)
+        _save_backup_status(site_name, len(discovered_topology), skipped_devices)
+    return {'subnet_list': site_subnets, 'topology': list(discovered_topology.values()), 'arp_table': full_arp_table}
+
+def _mark_open_circuits(devices):
+    # Flags devices whose circuit breaker is open with a 'circuit_breaker' entry, so the reports show
+    # they were skipped rather than silently missing. Returns the flagged devices.
+    skipped = []
+    for device in devices:
+        circuit = device_health.open_circuit(device['ip'])
+        if circuit:
+            device['circuit_breaker'] = circuit
+            skipped.append(device)
+        else:
+            device.pop('circuit_breaker', None)
+    if skipped:
+        print(f"--- [BREAKER] {len(skipped)} device(s) skipped or failing with an open circuit: {', '.join(d.get('device_name', d['ip']) for d in skipped)} ---")
+    return skipped
+
+def _load_site_topology(site_name):
+    # Loads the device list written by the discovery phase, or None if discovery has not run
+    try:
+        with open(f"{OUTPUT_DIR}{site_name}/discovered_topology.yml", 'r') as f:
+            return yaml.safe_load(f).get('devices', [])
+    except FileNotFoundError:
+        return None
+
+def do_arp_phase(site_name, creds, scan_cache_dir=None, device_roles=None, backend='ssh'):
+    # Phase 1b: Refreshes the ARP table of an already discovered site without walking the topology again
+    # Returns {'arp_table': full_arp_table}, or None on failure.
+    print(f"--- Starting ARP Refresh Phase for site: {site_name} ---")
+    discovered_devices = _load_site_topology(site_name)
+    if discovered_devices is None:
+        print(f"Error: Cannot refresh ARP. 'discovered_topology.yml' not found for site '{site_name}'.")
+        return None
+    arp_devices = [dev for dev in discovered_devices if needs_arp_collection(dev, device_roles or {})]
+    print(f"--- [ARP] Collecting ARP from {len(arp_devices)} of {len(discovered_devices)} device(s) (L3-capable or 'arp_source'). ---")
+    collect = make_device_collector(creds, scan_cache_dir=scan_cache_dir, backend=backend)
+    with ThreadPoolExecutor(max_workers=max(1, DISCOVERY_MAX_WORKERS)) as executor:
+        results = list(executor.map(lambda dev: collect(dev, ['arp']), arp_devices))
+    full_arp_table = {}
+    for result in results:
+        if result.get('arp'):
+            full_arp_table.update(result['arp'])
+    _mark_open_circuits(arp_devices)
+    shared_utils.save_report_yaml(f"{OUTPUT_DIR}{site_name}/arp_table.yml", full_arp_table, "arp_table")
+    return {'arp_table': full_arp_table}
+
+def _load_enrichment_inputs(output_dir):
+    # Loads the enrichment inputs when the phase is run from the command line: the devices the conductor
+    # delegated to this site (devices_to_enrich.yml) and the MAC -> IP map from the site's own arp_table.yml.
+    # SAD_GROUP_ARP_CACHE may name a group ARP table (JSON) to use instead, for VTCs ARPed at another site.
     group_arp_cache_path = os.getenv('SAD_GROUP_ARP_CACHE')
-    if not group_arp_cache_path:
-        print("Worker Error: SAD_GROUP_ARP_CACHE environment variable not set. Cannot load ARP data.")
-        return False
     try:
         with open(f"{output_dir}devices_to_enrich.yml", 'r') as f:
             devices_to_enrich = yaml.safe_load(f).get('vtc_devices', [])
-        with open(group_arp_cache_path, 'r') as f:
-            group_arp_table = json.load(f)
+        if group_arp_cache_path:
+            with open(group_arp_cache_path, 'r') as f:
+                arp_table = json.load(f)
+        else:
+            with open(f"{output_dir}arp_table.yml", 'r') as f:
+                arp_table = (yaml.safe_load(f) or {}).get('arp_table') or {}
     except FileNotFoundError as e:
         print(f"Error: Required input file not found for enrichment phase: {e}")
-        return False
+        print("Run the conductor (or the 'discovery_and_arp' phase for this site) first to produce it.")
+        return None, None
+    return devices_to_enrich, {shared_utils.normalize_mac(details['mac_address']): ip for ip, details in arp_table.items()}
+
+def do_enrichment_phase(site_name, creds, devices_to_enrich=None, mac_to_ip_map=None):
+    # Phase 2: Perform live enrichment on a pre-filtered list of devices
+    # The conductor passes the devices and their MAC -> IP map in memory; otherwise they are loaded from disk.
+    # Returns {'vtc_devices': enriched_list}, or None on failure.
+    print(f"--- Starting Live Enrichment Phase for site: {site_name} ---")
+    output_dir = f"{OUTPUT_DIR}{site_name}/"
+    if devices_to_enrich is None or mac_to_ip_map is None:
+        devices_to_enrich, mac_to_ip_map = _load_enrichment_inputs(output_dir)
+        if devices_to_enrich is None:
+            return None
+
+    # Devices are polled concurrently over vtc_api_tool's pooled HTTP session; map() keeps the input order.
+    # Only the status fields whose cached copy has expired are polled (see vtc_status_cache).
+    status_cache_path = vtc_status_cache.cache_path(site_name)
+    status_cache = shared_utils.load_json_cache(status_cache_path)
+    with ThreadPoolExecutor(max_workers=max(1, ENRICHMENT_MAX_WORKERS)) as executor:
+        enriched_list = list(executor.map(lambda device: _enrich_device(device, creds, mac_to_ip_map, status_cache), devices_to_enrich))
+    # Only keep entries for devices that are still enriched at this site
+    device_names = {device['device_name'] for device in enriched_list}
+    shared_utils.save_json_cache(status_cache_path, {name: entry for name, entry in status_cache.items() if name in device_names})
+    shared_utils.save_report_yaml(F"{output_dir}vtc_devices_enriched.yml", enriched_list, 'vtc_devices')
+    return {'vtc_devices': enriched_list}
+
+def _enrich_device(device, creds, mac_to_ip_map, status_cache):
+    # Adds the status of one VTC to its record. A failure only marks this device, never the whole phase.
+    # Fields still fresh in 'status_cache' (device name -> entry, updated in place) are not polled again;
+    # the record lists their ages under 'status_cache_age_seconds'.
+    vtc_mac_normalized = shared_utils.normalize_mac(device['device_name'])
+    ip_address = mac_to_ip_map.get(vtc_mac_normalized)
+    device['ip_address'] = ip_address
+    if not ip_address:
+        device['ip_address'] = "NOT_FOUND_IN_GROUP_ARP"
+        return device
+    cache_entry = status_cache.setdefault(device['device_name'], {})
+    stale = vtc_status_cache.stale_fields(cache_entry, list(vtc_api_tool.STATUS_FIELDS))
+    if stale and not device_health.allow_attempt(ip_address):
+        device['live_status'] = "SKIPPED_CIRCUIT_OPEN"
+        device['circuit_breaker'] = device_health.open_circuit(ip_address)
+        return device
+    if stale:
+        try:
+            live_status = vtc_api_tool.get_device_status(ip_address, creds['vtc_user'], creds['vtc_pass'], stale)
+        except Exception as e:
+            print(f"  -> Error polling VTC {ip_address}: {e}")
+            live_status = None
+        if not live_status:
+            device_health.record_failure(ip_address, "VTC status API unreachable")
+            device['live_status'] = "UNREACHABLE"
+            return device
+        device_health.record_success(ip_address)
+        if 'error' in live_status:
+            device.update(live_status)
+            return device
+        vtc_status_cache.update_entry(cache_entry, live_status)
+    values, ages = vtc_status_cache.cached_values(cache_entry, stale)
+    device.update({field: value for field, value in values.items() if field in vtc_api_tool.STATUS_FIELDS})
+    if ages:
+        device['status_cache_age_seconds'] = ages
+    return device
+
+def _prepare_config_dirs(site_name):
+    # Creates and returns the (config_backup_dir, archive_dir) paths for a site
+    config_backup_dir = f"{OUTPUT_DIR}{site_name}/configs/"
+    archive_dir = f"{config_backup_dir}archive/"
+    os.makedirs(archive_dir, exist_ok=True)
+    return config_backup_dir, archive_dir
+
+def _save_backup_status(site_name, device_count, skipped_devices=()):
+    # Records when the site's configs were last backed up; the conductor uses this file to judge freshness.
+    # Devices skipped by the circuit breaker are listed so their stale backups are easy to spot.
+    status = {'devices_processed': device_count, 'completed_at': datetime.datetime.now().isoformat(timespec='seconds')}
+    if skipped_devices:
+        status['skipped_devices'] = [{'device_name': device.get('device_name'), 'ip': device['ip'], **device['circuit_breaker']} for device in skipped_devices]
+    shared_utils.save_report_yaml(f"{OUTPUT_DIR}{site_name}/config_backup_status.yml", status, 'config_backup')
+
+def _store_device_config(device, config_result, config_backup_dir, archive_dir, config_markers, creds):
+    # Adds a freshly pulled config to the device's history in the config archive and refreshes the plain-text copy.
+    # 'config_result' comes from the 'config' part; when its precheck found the last-change marker unchanged
+    # the stored copy is kept as-is. The device's entry in 'config_markers' is updated in place.
+    device_name = device['device_name']
+    print(f"  -> Processing config for: {device_name}")
+    current_config_path = f"{config_backup_dir}{device_name}.txt"
+    if config_result and config_result.get('unchanged'):
+        # A result shared through the scan cache may have been prechecked against another site's marker,
+        # so only trust it if it matches ours and we still hold the copy it refers to
+        if config_result['marker'] == config_markers.get(device_name) and os.path.exists(current_config_path):
+            print(f"    - No changes detected for {device_name} (last-change marker unchanged).")
+            return
+        config_result = collect_device_data(device, creds, ['config'], config_markers={}).get('config')
+    if config_result and config_result.get('sha256'):
+        # Transferred configs arrive hashed; a byte-identical copy of the latest version needs no further work
+        latest = config_archive_tool.latest_version(archive_dir, device_name)
+        if latest and latest['blob'] == config_result['sha256'] and os.path.exists(current_config_path):
+            print(f"    - No changes detected for {device_name}.")
+            _update_config_marker(config_markers, device_name, config_result)
+            return
+    new_config = cisco_config_tool.read_config_text(config_result)
+    if not new_config:
+        print(f"    - Skipping {device_name} (could not fetch config).")
+        return
+    if config_archive_tool.latest_version(archive_dir, device_name) is None and os.path.exists(current_config_path):
+        # First run against the archive: seed the history with the copy from the previous backup
+        with open(current_config_path, 'r') as f:
+            config_archive_tool.store_config(archive_dir, device_name, f.read())
+
+    # The archive compares normalized content hashes, so volatile lines (ntp clock-period, timestamps) are ignored
+    new_version = config_archive_tool.store_config(archive_dir, device_name, new_config)
+    if new_version is None and os.path.exists(current_config_path):
+        print(f"    - No changes detected for {device_name}.")
+    else:
+        if new_version:
+            print(f"    - CHANGE DETECTED for {device_name}. Stored as version {new_version['version']} in the config archive.")
+        # Keep the latest copy as plain text for the dashboard
+        with open(current_config_path, 'w') as f:
+            f.write(new_config)
+    _update_config_marker(config_markers, device_name, config_result)
+
+def _update_config_marker(config_markers, device_name, config_result):
+    # Remembers the last-change marker that goes with the config we just stored
+    if config_result.get('marker'):
+        config_markers[device_name] = config_result['marker']
+    else:
+        config_markers.pop(device_name, None)
 
-    mac_to_ip_map = {shared_utils.normalize_mac(details['mac_address']): ip for ip, details in group_arp_table.items()}
-    enriched_list = []
-
-    for device in devices_to_enrich:
-        vtc_mac_normalized = shared_utils.normalize_mac(device['device_name'])
-        ip_address = mac_to_ip_map.get(vtc_mac_normalized)
-        device['ip_address'] = ip_address
-        if ip_address:
-            live_status = vtc_api_tool.get_device_status(ip_address, creds['vtc_user'], creds['vtc_pass'])
-            if live_status:
-                device.update(live_status)
+def _save_config_markers(config_backup_dir, loaded_markers, config_markers):
+    # Writes back only the markers that changed since 'loaded_markers' was read, merged into the file under its lock.
+    # A syslog-triggered backup and a backup phase of the same site can then finish in any order without one
+    # putting back the other's outdated markers.
+    markers_path = f"{config_backup_dir}{CONFIG_MARKERS_FILE}"
+    changed = [name for name in loaded_markers.keys() | config_markers.keys() if loaded_markers.get(name) != config_markers.get(name)]
+    if not changed:
+        return
+    with shared_utils.exclusive_file_lock(f"{markers_path}.lock"):
+        markers = shared_utils.load_json_cache(markers_path)
+        for name in changed:
+            if name in config_markers:
+                markers[name] = config_markers[name]
             else:
-                device['live_status'] = "UNREACHABLE"
-        else:
-            device['ip_address'] = "NOT_FOUND_IN_GROUP_ARP"
-        enriched_list.append(device)
-    shared_utils.save_data_to_yaml(F"{output_dir}vtc_devices_enriched.yml", enriched_list, 'vtc_devices')
-    return True
+                markers.pop(name, None)
+        shared_utils.save_json_cache(markers_path, markers)
 
-def do_config_backup_phase(site_name, creds):
+def do_config_backup_phase(site_name, creds, scan_cache_dir=None):
     # Phase 3: Backs up the running config for all discovered devices at a site
+    # Returns {'devices_processed': count}, or None on failure.
     print(f"--- Starting Configuration Backup Phase for site: {site_name} ---")
-    # Define Paths
-    site_output_dir = f"{OUTPUT_DIR}{site_name}/"
-    config_backup_dir = f"{site_output_dir}configs/"
-    archive_dir = f"{config_backup_dir}archive/"
-    os.makedirs(archive_dir, exist_ok=True)
+    config_backup_dir, archive_dir = _prepare_config_dirs(site_name)
+    config_markers = shared_utils.load_json_cache(f"{config_backup_dir}{CONFIG_MARKERS_FILE}")
+    loaded_markers = dict(config_markers)
+    collect = make_device_collector(creds, scan_cache_dir=scan_cache_dir, config_markers=config_markers)
 
     # This phase depends on the discovery phase having run first
-    try:
-        with open(f"{site_output_dir}discovered_topology.yml", 'r') as f:
-            discovered_devices = yaml.safe_load(f).get('devices', [])
-    except FileNotFoundError:
+    discovered_devices = _load_site_topology(site_name)
+    if discovered_devices is None:
         print(f"Error: Cannot run backup. 'discovered_topology.yml' not found for site '{site_name}'.")
-        return False
+        return None
     for device in discovered_devices:
         device_name = device.get('device_name')
         if not device_name:
             continue
-        print(f"  -> Processing config for: {device_name}")
+        config_result = collect(device, ['config']).get('config')
+        _store_device_config(device, config_result, config_backup_dir, archive_dir, config_markers, creds)
+    _save_config_markers(config_backup_dir, loaded_markers, config_markers)
+    _save_backup_status(site_name, len(discovered_devices), _mark_open_circuits(discovered_devices))
+    return {'devices_processed': len(discovered_devices)}
 
-        # Get the new config and its hash
-        new_config, new_hash = cisco_config_tool.get_config_and_hash(device, creds['net_user'], creds['net_pass'])
-        if not new_config:
-            print(f"    - Skipping {device_name} (could not fetch config).")
-            continue
-        current_config_path = f"{config_backup_dir}{device_name}.txt"
-        old_hash = ""
+def do_device_backup(site_name, device, creds):
+    # Backs up the running config of a single discovered device, e.g. when it reports a config change.
+    # Safe to run alongside the site's backup phases: the archive index and the marker index are updated under file locks.
+    # Returns {'devices_processed': 1}.
+    print(f"--- Starting Configuration Backup for {device['device_name']} at site: {site_name} ---")
+    config_backup_dir, archive_dir = _prepare_config_dirs(site_name)
+    config_markers = shared_utils.load_json_cache(f"{config_backup_dir}{CONFIG_MARKERS_FILE}")
+    loaded_markers = dict(config_markers)
+    config_result = collect_device_data(device, creds, ['config'], config_markers=config_markers).get('config')
+    _store_device_config(device, config_result, config_backup_dir, archive_dir, config_markers, creds)
+    _save_config_markers(config_backup_dir, loaded_markers, config_markers)
+    timeout_policy_tool.flush()
+    return {'devices_processed': 1}
 
-        # Try to read the old config file to get its hash
-        if os.path.exists(current_config_path):
-            with open(current_config_path, 'r') as f:
-                old_config = f.read()
-                old_hash = cisco_config_tool.calculate_md5(old_config)
+# --- Worker Entry Points ---
+def load_worker_context(temp_creds_path: str) -> dict:
+    # Loads the credentials and static configuration every phase needs.
+    # Long-lived pool workers call this once and reuse the result for every job.
+    with open(temp_creds_path, 'r') as f:
+        creds = json.load(f)
+    with open(f"{CONFIG_DIR}network_devices.yml", 'r') as f:
+        all_network_devices = yaml.safe_load(f)
+    with open(f"{CONFIG_DIR}management_overrides.yml", 'r') as f:
+        mgmt_overrides = yaml.safe_load(f) or {}
+    return {'creds': creds, 'all_network_devices': all_network_devices, 'mgmt_overrides': mgmt_overrides}
 
-        # Compare hashes
-        if new_hash == old_hash:
-            print(f"    - No changes detected for {device_name}.")
-        else:
-            print(f"    - CHANGE DETECTED for {device_name}. Backup up new config.")
-            # If an old file exists, move it to the archive
-            if os.path.exists(current_config_path):
-                import datetime
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                archive_path = f"{archive_dir}{device_name}_{timestamp}.txt"
-                os.rename(current_config_path, archive_path)
-                print(f"    - Archived old config to: {archive_path}")
-            # Write the new config file
-            with open(current_config_path, 'w') as f:
-                f.write(new_config)
-    return True
+def run_phase(site_name: str, phase: str, context: dict, with_config_backup: bool = False, incremental: bool = False,
+              scan_cache_dir: str = None, devices_to_enrich: list = None, mac_to_ip_map: dict = None) -> dict | None:
+    # Runs a single phase for a single site using an already loaded worker context.
+    # 'scan_cache_dir' defaults to SAD_SCAN_CACHE_DIR so manually launched workers can share a scan cache too.
+    # Returns the phase's result dictionary, or None if the phase failed.
+    # The latencies measured during the phase are saved to the shared history when it ends.
+    governor_tool.set_current_site(site_name)
+    try:
+        return _dispatch_phase(site_name, phase, context, with_config_backup, incremental,
+                               scan_cache_dir or os.getenv('SAD_SCAN_CACHE_DIR'), devices_to_enrich, mac_to_ip_map)
+    finally:
+        timeout_policy_tool.flush()
+
+def _dispatch_phase(site_name, phase, context, with_config_backup, incremental, scan_cache_dir, devices_to_enrich, mac_to_ip_map):
+    site_device_config = [dev for dev in context['all_network_devices'] if dev.get('site') == site_name]
+    if not site_device_config:
+        print(f"Worker Error: No devices found for site '{site_name}' in network_devices.yml")
+
+    creds = context['creds']
+    # Per-device roles from network_devices.yml (e.g. 'arp_source' / 'arp_skip'), keyed by device name
+    device_roles = {dev['device_name']: dev.get('roles', []) for dev in site_device_config if dev.get('device_name')}
+    if phase == 'discovery_and_arp':
+        seed_device = shared_utils.find_device_by_role(site_device_config, 'discovery_seed')
+        if not seed_device:
+            print(f"Worker Error: No 'discovery_seed' device found for site '{site_name}'.")
+            return None
+        return do_discovery_and_arp_phase(site_name, seed_device, creds, context['mgmt_overrides'], with_config_backup, incremental, scan_cache_dir, device_roles)
+    elif phase == 'arp':
+        seed_device = shared_utils.find_device_by_role(site_device_config, 'discovery_seed') or {}
+        return do_arp_phase(site_name, creds, scan_cache_dir, device_roles, seed_device.get('collection_backend', 'ssh'))
+    elif phase == 'enrichment':
+        return do_enrichment_phase(site_name, creds, devices_to_enrich, mac_to_ip_map)
+    elif phase == 'backup_configs':
+        return do_config_backup_phase(site_name, creds, scan_cache_dir)
+    print(f"Worker Error: Unknown phase '{phase}'.")
+    return None
 
 # --- Main Execution Block for the Worker ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SAD Worker Orchestrator")
     parser.add_argument("--site", required=True, help="The individual site to process.")
-    parser.add_argument("--phase", required=True, choices=['discovery_and_arp', 'enrichment', 'backup_configs'], help="The execution phase.")
+    parser.add_argument("--phase", required=True, choices=['discovery_and_arp', 'arp', 'enrichment', 'backup_configs'], help="The execution phase.")
+    parser.add_argument("--with-config-backup", action="store_true", help="Also back up running-configs during 'discovery_and_arp', reusing the discovery session.")
+    parser.add_argument("--incremental", action="store_true", help="Reuse cached CDP neighbor lists when a device's 'show cdp neighbors' fingerprint is unchanged.")
     args = parser.parse_args()
 
     # --- Retrieve credentials from temp credential file
@@ -165,33 +584,13 @@ if __name__ == "__main__":
         print("Worker Error: SAD_TEMP_CREDS_FILE environment variable not set. Cannot load credentials.")
         exit(1)
     try:
-        with open(temp_creds_path, 'r') as f:
-            creds = json.load(f)
-        with open(f"{CONFIG_DIR}network_devices.yml", 'r') as f:
-            all_network_devices = yaml.safe_load(f)
-        with open(f"{CONFIG_DIR}management_overrides.yml", 'r') as f:
-            mgmt_overrides = yaml.safe_load(f) or {}
+        worker_context = load_worker_context(temp_creds_path)
     except (FileNotFoundError, json.JSONDecodeError, yaml.YAMLError) as e:
         print(f"Worker Error: Could not load initial configurations. Reason: {e}")
         exit(1)
-    
-    site_device_config = [dev for dev in all_network_devices if dev.get('site') == args.site]
-    if not site_device_config:
-        print(f"Worker Error: No devices found for site '{args.site}' in network_devices.yml")
 
-    success = False
-    if args.phase == 'discovery_and_arp':
-        seed_device = shared_utils.find_device_by_role(site_device_config, 'discovery_seed')
-        if not seed_device:
-            print(f"Worker Error: No 'discovery_seed' device found for site '{args.site}'.")
-            exit(1)
-        success = do_discovery_and_arp_phase(args.site, seed_device, creds, mgmt_overrides)
-    elif args.phase == 'enrichment':
-        success = do_enrichment_phase(args.site, creds)
-    elif args.phase == 'backup_configs':
-        success = do_config_backup_phase(args.site, creds)
-    
-    if not success:
+    result = run_phase(args.site, args.phase, worker_context, args.with_config_backup, args.incremental)
+    if result is None:
         print(f"Worker for site '{args.site}' phase '{args.phase}' failed.")
         exit(1)
     else:
@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- Phase Graph Definition ---
+# Each node declares the nodes it consumes ('inputs'), the per-site report files it produces ('outputs',
+# relative to OUTPUT_DIR/<site>/) and how long those files stay fresh ('ttl', seconds).
+# 'site' nodes run per site; 'group' nodes run once for the whole run and keep their results in memory,
+# so they have no outputs and only run when something downstream needs them.
+PHASE_GRAPH = {
+    'discovery':  {'scope': 'site',  'inputs': [],                       'outputs': ['discovered_topology.yml', 'discovered_vlans.yml'], 'ttl': 24 * 3600},
+    'arp':        {'scope': 'site',  'inputs': ['discovery'],            'outputs': ['arp_table.yml'],                                   'ttl': 3600},
+    'aggregate':  {'scope': 'group', 'inputs': ['arp'],                  'outputs': [],                                                  'ttl': 0},
+    'cucm':       {'scope': 'group', 'inputs': [],                       'outputs': [],                                                  'ttl': 0},
+    'enrichment': {'scope': 'site',  'inputs': ['aggregate', 'cucm'],    'outputs': ['vtc_devices_enriched.yml'],                        'ttl': 15 * 60},
+    'backup':     {'scope': 'site',  'inputs': ['discovery'],            'outputs': ['config_backup_status.yml'],                        'ttl': 3600},
+    'dashboard':  {'scope': 'group', 'inputs': ['enrichment', 'backup'], 'outputs': [],                                                  'ttl': 0},
+}
+
+# The nodes each conductor run mode asks for; everything they depend on is pulled in automatically
+MODE_TARGETS = {
+    'full': ['enrichment'],
+    'discovery_only': ['discovery', 'arp'],
+    'backup_configs': ['backup'],
+    'generate_dashboard': ['dashboard'],
+}
+
+# --- Planning Helpers ---
+def _required_nodes(targets: list) -> list:
+    # Returns the targets plus everything they depend on, inputs before the nodes that consume them
+    ordered = []
+    def visit(node):
+        if node in ordered:
+            return
+        for input_node in PHASE_GRAPH[node]['inputs']:
+            visit(input_node)
+        ordered.append(node)
+    for target in targets:
+        visit(target)
+    return ordered
+
+def _site_inputs(node: str) -> set:
+    # The site-scoped nodes a node depends on, looking through group nodes (e.g. enrichment -> arp via aggregate)
+    found = set()
+    for input_node in PHASE_GRAPH[node]['inputs']:
+        if PHASE_GRAPH[input_node]['scope'] == 'site':
+            found.add(input_node)
+        else:
+            found |= _site_inputs(input_node)
+    return found
+
+def _outputs_mtime(node: str, site: str, output_dir: str) -> float | None:
+    # Returns the oldest modification time of a node's outputs for a site, or None if any is missing
+    mtimes = []
+    for filename in PHASE_GRAPH[node]['outputs']:
+        path = os.path.join(output_dir, site, filename)
+        if not os.path.exists(path):
+            return None
+        mtimes.append(os.path.getmtime(path))
+    return min(mtimes) if mtimes else None
+
+def is_fresh(node: str, site: str, output_dir: str, now: float = None, ttl: float = None) -> bool:
+    # A site node is fresh when all of its outputs exist, are within the TTL and are newer than its inputs' outputs.
+    # 'ttl' overrides the node's default TTL from PHASE_GRAPH.
+    ttl = PHASE_GRAPH[node]['ttl'] if ttl is None else ttl
+    now = now or time.time()
+    oldest = _outputs_mtime(node, site, output_dir)
+    if oldest is None or now - oldest >= ttl:
+        return False
+    for input_node in _site_inputs(node):
+        input_mtime = _outputs_mtime(input_node, site, output_dir)
+        if input_mtime is not None and input_mtime > oldest:
+            return False
+    return True
+
+def plan_run(targets: list, sites: list, output_dir: str, force: bool = False, ttls: dict = None) -> dict:
+    # Works out which nodes actually need to run for the requested targets.
+    # 'ttls' overrides the TTL of individual nodes (a TTL of 0 always re-runs the node).
+    # Site nodes map to the set of sites whose outputs are missing or stale, or whose inputs are being rebuilt;
+    # a rebuilt site input makes group-fed nodes stale for every site (e.g. new ARP data -> re-enrich all sites).
+    # Group nodes map to True only when a node that consumes them is going to run.
+    nodes = _required_nodes(targets)
+    plan = {}
+    for node in nodes:
+        if PHASE_GRAPH[node]['scope'] != 'site':
+            continue
+        stale_sites = set()
+        for site in sites:
+            rebuilt_inputs = any(site in plan.get(input_node, set()) for input_node in _site_inputs(node)
+                                 if input_node in PHASE_GRAPH[node]['inputs'])
+            group_inputs_rebuilt = any(plan.get(input_node) for input_node in _site_inputs(node)
+                                       if input_node not in PHASE_GRAPH[node]['inputs'])
+            if force or rebuilt_inputs or group_inputs_rebuilt or not is_fresh(node, site, output_dir, ttl=(ttls or {}).get(node)):
+                stale_sites.add(site)
+        plan[node] = stale_sites
+
+    # Group nodes are demand-driven: walk from the consumers back to their inputs
+    for node in reversed(nodes):
+        if PHASE_GRAPH[node]['scope'] == 'group':
+            is_target = node in targets
+            consumers = [other for other in nodes if node in PHASE_GRAPH[other]['inputs']]
+            plan[node] = is_target or any(plan.get(consumer) for consumer in consumers)
+    return {node: plan[node] for node in nodes}
+
+# --- Scheduler ---
+def run_graph(plan: dict, executors: dict, max_concurrent_nodes: int = 4):
+    # Runs every planned node once all of its inputs have finished, running independent branches concurrently.
+    # 'executors' maps node name -> callable taking the node's planned value (set of sites or True).
+    # Nodes with nothing to do are marked finished without calling their executor.
+    # If a node raises, no new nodes are started, running ones are allowed to finish and the error is re-raised.
+    finished, running, error = set(), {}, None
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrent_nodes)) as executor:
+        while len(finished) < len(plan):
+            if error is None:
+                for node, planned in plan.items():
+                    if node in finished or node in running.values():
+                        continue
+                    if not all(input_node in finished for input_node in PHASE_GRAPH[node]['inputs'] if input_node in plan):
+                        continue
+                    if not planned:
+                        print(f"\n--- [GRAPH] '{node}': nothing to do (outputs are fresh). ---")
+                        finished.add(node)
+                        continue
+                    print(f"\n--- [GRAPH] Starting '{node}'" + (f" for {sorted(planned)}" if isinstance(planned, set) else "") + " ---")
+                    running[executor.submit(executors[node], planned)] = node
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    future.result()
+                    finished.add(node)
+                except Exception as e:
+                    print(f"\n--- [GRAPH] '{node}' failed: {e} ---")
+                    error = error or e
+    if error is not None:
+        raise error
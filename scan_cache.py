@@ -0,0 +1,53 @@
+import os
+import time
+import tempfile
+# --- Local Module Imports ---
+import shared_utils
+
+# --- Configuration ---
+# How long a worker waits between checks while another worker is scanning the same device
+LOCK_POLL_INTERVAL = 0.5
+# The scanning worker touches its lock this often. A scan can take far longer than any fixed limit
+# (adaptive timeouts, governor queueing), so staleness is judged by the heartbeat, not the scan time.
+LOCK_HEARTBEAT_INTERVAL = 30
+# A lock not touched for this long is assumed to belong to a crashed worker
+LOCK_STALE_AFTER = 4 * LOCK_HEARTBEAT_INTERVAL
+
+# A run-scoped, cross-process cache of device scan results keyed by management IP.
+# The conductor creates one directory per run and hands it to every worker. Sites that share
+# infrastructure then collect each shared device once: the first worker to lock an IP scans it and
+# publishes the result, and later workers reuse it. Each entry stores the collect_device_data() parts
+# gathered so far, so a worker needing an extra part (e.g. 'config') only scans for what is missing.
+
+def _entry_paths(cache_dir: str, ip: str) -> tuple[str, str]:
+    # Returns the (result, lock) file paths for one device
+    safe_key = ip.replace(':', '_').replace('/', '_')
+    return os.path.join(cache_dir, f"{safe_key}.json"), os.path.join(cache_dir, f"{safe_key}.lock")
+
+def create_scan_cache_dir(base_dir: str | None = None) -> str:
+    # Creates an empty directory for one run's scan cache
+    return tempfile.mkdtemp(prefix="sad_scan_cache_", dir=base_dir)
+
+def cached_scan(cache_dir: str, device: dict, parts: list, scan_missing) -> dict:
+    # Returns the requested parts for a device, scanning only if no worker has published them yet.
+    # 'scan_missing' is called with the list of missing parts and must return a dict of part -> result.
+    # Only one worker scans a given IP at a time; the others wait for its result.
+    result_path, lock_path = _entry_paths(cache_dir, device['ip'])
+    while True:
+        entry = shared_utils.load_json_cache(result_path)
+        if all(part in entry for part in parts):
+            print(f"  -> [SCAN CACHE] Reusing {parts} for {device['ip']} collected earlier in this run.")
+            return {part: entry[part] for part in parts}
+        if shared_utils.try_acquire_file_lock(lock_path, LOCK_STALE_AFTER):
+            try:
+                # Another worker may have published between our read and taking the lock
+                entry = shared_utils.load_json_cache(result_path)
+                missing = [part for part in parts if part not in entry]
+                if missing:
+                    with shared_utils.keep_file_lock_fresh(lock_path, LOCK_HEARTBEAT_INTERVAL):
+                        entry.update(scan_missing(missing))
+                    shared_utils.save_json_cache(result_path, entry)
+            finally:
+                shared_utils.release_file_lock(lock_path)
+            return {part: entry.get(part) for part in parts}
+        time.sleep(LOCK_POLL_INTERVAL)
@@ -1,5 +1,11 @@
 import os
+import json
+import time
+import fcntl
 import yaml
+import queue
+import threading
+import contextlib
 import ipaddress
 
 # --- Data Handling Helpers ---
@@ -19,6 +25,150 @@ def save_data_to_yaml(filepath: str, data: dict | list, root_key: str):
     except IOError as e:
         print(f"  -> Error: Could not write to file '{filepath}'. Reason: {e}")
 
+# --- Persistent Cache Helpers ---
+# Run-to-run caches (CDP fingerprints, health records, etc.) are small JSON files kept under CACHE_DIR
+CACHE_DIR = "./output/.cache/"
+
+def load_json_cache(filepath: str) -> dict:
+    # Loads a JSON cache file, returning an empty dict if it is missing or unreadable.
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"  -> Warning: Ignoring unreadable cache file '{filepath}'. Reason: {e}")
+        return {}
+
+def save_json_cache(filepath: str, data: dict):
+    # Atomically replaces a JSON cache file, so a crash never leaves it half written.
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, filepath)
+    except OSError as e:
+        print(f"  -> Error: Could not write cache file '{filepath}'. Reason: {e}")
+
+@contextlib.contextmanager
+def exclusive_file_lock(lock_path: str):
+    # Blocks until this caller holds an exclusive fcntl lock on 'lock_path', and holds it for the block.
+    # Works across threads and processes, and the OS drops the lock if its holder dies.
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def try_acquire_file_lock(lock_path: str, stale_after: float) -> bool:
+    # Atomically creates a lock file; works across processes. Returns False if someone else holds the lock.
+    # A lock older than 'stale_after' seconds is assumed to belong to a crashed process and is broken.
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) > stale_after:
+                print(f"  -> Warning: Breaking stale lock '{lock_path}'.")
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        return False
+
+def release_file_lock(lock_path: str):
+    # Removes a lock file taken with try_acquire_file_lock
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+@contextlib.contextmanager
+def keep_file_lock_fresh(lock_path: str, interval: float):
+    # Touches a held lock file every 'interval' seconds for the duration of the block, so a long-running
+    # holder is never mistaken for a crashed one. Only a holder that really stopped lets the lock go stale.
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(interval):
+            try:
+                os.utime(lock_path)
+            except FileNotFoundError:
+                return
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+# --- Report Artifact Helpers ---
+# Worker phases hand their YAML reports to save_report_yaml. Inside a collect_report_artifacts() block
+# the reports are only recorded, so a pool worker can return them to the conductor instead of
+# serializing them itself; the conductor then writes them on its background writer thread.
+_artifact_collector = None
+_write_queue = None
+_writer_thread = None
+
+@contextlib.contextmanager
+def collect_report_artifacts():
+    # Records save_report_yaml calls made inside the block as (filepath, data, root_key) tuples
+    global _artifact_collector
+    previous, _artifact_collector = _artifact_collector, []
+    try:
+        yield _artifact_collector
+    finally:
+        _artifact_collector = previous
+
+def save_report_yaml(filepath: str, data: dict | list, root_key: str):
+    # Saves a YAML report, or records it for the caller when an artifact collector is active
+    if _artifact_collector is not None:
+        _artifact_collector.append((filepath, data, root_key))
+    else:
+        save_data_to_yaml(filepath, data, root_key)
+
+def _background_writer_loop():
+    # Drains the write queue until the None sentinel arrives
+    while True:
+        item = _write_queue.get()
+        try:
+            if item is None:
+                return
+            save_data_to_yaml(*item)
+        finally:
+            _write_queue.task_done()
+
+def start_background_writer():
+    # Starts the thread that serializes YAML reports off the main workflow
+    global _write_queue, _writer_thread
+    if _writer_thread is None:
+        _write_queue = queue.Queue()
+        _writer_thread = threading.Thread(target=_background_writer_loop, name="yaml-writer", daemon=True)
+        _writer_thread.start()
+
+def write_yaml_in_background(filepath: str, data: dict | list, root_key: str):
+    # Queues a YAML report for the background writer (writes immediately if it isn't running).
+    # The caller must not modify 'data' afterwards.
+    if _writer_thread is None:
+        save_data_to_yaml(filepath, data, root_key)
+    else:
+        _write_queue.put((filepath, data, root_key))
+
+def flush_background_writer():
+    # Blocks until every queued report has been written
+    if _writer_thread is not None:
+        _write_queue.join()
+
+def stop_background_writer():
+    # Writes any remaining reports and stops the writer thread
+    global _write_queue, _writer_thread
+    if _writer_thread is not None:
+        _write_queue.put(None)
+        _writer_thread.join()
+        _write_queue, _writer_thread = None, None
+
 def _find_target_node_recursive(current_node, target_key):
     # Recursively searches a nested dictionary/list structure for a specific key.
     # Returns the value associated with that key if found.
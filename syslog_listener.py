@@ -0,0 +1,213 @@
+import re
+import time
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+# --- Local Module Imports ---
+import conductor
+import credential_loader
+import orchestrator
+
+# --- Configuration ---
+# Syslog messages that mean a device's running-config just changed
+CONFIG_CHANGE_PATTERNS = [
+    re.compile(r"%SYS-5-CONFIG_[IP]\b"),            # IOS / IOS-XE: "Configured from console by admin on vty0"
+    re.compile(r"%VSHD-5-VSHD_SYSLOG_CONFIG_I\b"),  # NX-OS: "Configured from vty by admin on 10.0.0.5"
+]
+# A backup runs this long after a device's last change event, so a burst of changes results in one backup...
+DEBOUNCE_SECONDS = 30
+# ...but never later than this after the first event, so a device that keeps changing still gets backed up
+MAX_DEBOUNCE_SECONDS = 300
+BACKUP_MAX_WORKERS = 4
+# How often (at most) the device index is rebuilt from the discovered topologies
+INDEX_REFRESH_SECONDS = 60
+# Where the hostname sits in the syslog header; used to match devices that log from another interface.
+# The timestamp may carry Cisco's sequence number, '*' (clock not in sync) or '.' prefix and milliseconds.
+SYSLOG_TIMESTAMP = r"[*.]?\w{3}\s+\d+\s+\d{2}:\d{2}:\d{2}(?:\.\d+)?"
+SYSLOG_HOSTNAME_PATTERNS = [
+    # RFC 3164: "<PRI>Mmm dd hh:mm:ss HOSTNAME ..." and Cisco "<PRI>seq: *Mmm dd hh:mm:ss.mmm: HOSTNAME: ..."
+    re.compile(rf"^<\d+>(?:\d+:?\s+)?{SYSLOG_TIMESTAMP}:?\s+(?!%)([^\s:]+):?\s"),
+    # Cisco 'logging origin-id hostname': "<PRI>seq: HOSTNAME: *Mmm dd hh:mm:ss.mmm: %FACILITY-..."
+    re.compile(rf"^<\d+>\d+:\s+(?!%)([^\s:]+):\s+{SYSLOG_TIMESTAMP}"),
+]
+
+def is_config_change(message: str) -> bool:
+    return any(pattern.search(message) for pattern in CONFIG_CHANGE_PATTERNS)
+
+def syslog_hostname(message: str) -> str | None:
+    # Returns the hostname from the message header, or None if the device didn't send one
+    # (e.g. plain "<PRI>seq: *Mmm dd hh:mm:ss.mmm: %SYS-5-CONFIG_I: ...")
+    for pattern in SYSLOG_HOSTNAME_PATTERNS:
+        match = pattern.match(message)
+        if match:
+            return match.group(1)
+    return None
+
+# --- Device Index ---
+class DeviceIndex:
+    # Maps syslog sources to the (site, device) they belong to, using each site's discovered_topology.yml.
+    # The index is rebuilt from disk at most every INDEX_REFRESH_SECONDS, so rediscovered sites are picked up.
+    def __init__(self, sites: list):
+        self.sites = sites
+        self._lock = threading.Lock()
+        self._by_ip, self._by_name, self._loaded_at = {}, {}, None
+
+    def _refresh(self, now: float):
+        by_ip, by_name = {}, {}
+        for site in self.sites:
+            for device in orchestrator._load_site_topology(site) or []:
+                if device.get('device_name') and device.get('ip'):
+                    by_ip[device['ip']] = (site, device)
+                    by_name[device['device_name'].lower()] = (site, device)
+        self._by_ip, self._by_name, self._loaded_at = by_ip, by_name, now
+
+    def lookup(self, source_ip: str, message: str, now: float) -> tuple[str, dict] | None:
+        # Matches on the source IP first, then on the hostname in the syslog header
+        with self._lock:
+            if self._loaded_at is None or now - self._loaded_at > INDEX_REFRESH_SECONDS:
+                self._refresh(now)
+            match = self._by_ip.get(source_ip)
+            if match is None:
+                hostname = syslog_hostname(message)
+                if hostname:
+                    match = self._by_name.get(hostname.lower())
+            return match
+
+# --- Debounced Backups ---
+class BackupScheduler:
+    # Collapses bursts of change events per device into a single backup, run on a small thread pool.
+    # Backups can overlap each other and the conductor's backup phases; do_device_backup locks what they share.
+    def __init__(self, creds: dict, debounce: float = DEBOUNCE_SECONDS, max_delay: float = MAX_DEBOUNCE_SECONDS):
+        self.creds = creds
+        self.debounce, self.max_delay = debounce, max_delay
+        self._lock = threading.Lock()
+        self._pending = {}     # device IP -> (timer, first event time)
+        self._executor = ThreadPoolExecutor(max_workers=BACKUP_MAX_WORKERS)
+
+    def schedule(self, site: str, device: dict, now: float):
+        with self._lock:
+            timer, first_seen = self._pending.get(device['ip'], (None, now))
+            if timer:
+                timer.cancel()
+            delay = max(0.0, min(self.debounce, first_seen + self.max_delay - now))
+            timer = threading.Timer(delay, self._fire, args=(site, device))
+            timer.daemon = True
+            self._pending[device['ip']] = (timer, first_seen)
+            timer.start()
+        print(f"--- [SYSLOG] Config change on {device['device_name']} ({site}); backing up in {delay:.0f}s. ---")
+
+    def _fire(self, site: str, device: dict):
+        with self._lock:
+            self._pending.pop(device['ip'], None)
+        self._executor.submit(self._backup, site, device)
+
+    def _backup(self, site: str, device: dict):
+        try:
+            orchestrator.do_device_backup(site, device, self.creds)
+        except Exception as e:
+            print(f"--- [SYSLOG] Error backing up {device['device_name']}: {e}")
+
+    def shutdown(self):
+        with self._lock:
+            for timer, _ in self._pending.values():
+                timer.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+# --- Syslog Servers ---
+def handle_message(message: str, source_ip: str, index: DeviceIndex, scheduler: BackupScheduler, now: float):
+    # Schedules a backup if the message is a config change from a device we know about
+    if not is_config_change(message):
+        return
+    match = index.lookup(source_ip, message, now)
+    if match is None:
+        print(f"--- [SYSLOG] Ignoring config change from unknown source {source_ip}. ---")
+        return
+    scheduler.schedule(*match, now)
+
+class _UDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        message = self.request[0].decode('utf-8', errors='replace').strip()
+        self.server.on_message(message, self.client_address[0])
+
+class _TCPHandler(socketserver.StreamRequestHandler):
+    # Accepts both RFC 6587 framings: newline-terminated messages and octet-counted ("<len> <msg>") frames
+    def handle(self):
+        while True:
+            first = self.rfile.read(1)
+            if not first:
+                return
+            if first.isdigit():
+                header = first
+                while not header.endswith(b" "):
+                    byte = self.rfile.read(1)
+                    if not byte:
+                        return
+                    header += byte
+                if header[:-1].isdigit():
+                    message = self.rfile.read(int(header[:-1]))
+                else:
+                    message = header + self.rfile.readline()
+            else:
+                message = first + self.rfile.readline()
+            self.server.on_message(message.decode('utf-8', errors='replace').strip(), self.client_address[0])
+
+class _UDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_listeners(on_message, host: str = "0.0.0.0", udp_port: int = 514, tcp_port: int = 514) -> list:
+    # Starts the UDP and TCP syslog servers on background threads; 'on_message(message, source_ip)' is called per message.
+    # A port of 0 disables that listener. Returns the servers so the caller can shut them down.
+    servers = []
+    for server_class, handler, port in ((_UDPServer, _UDPHandler, udp_port), (_TCPServer, _TCPHandler, tcp_port)):
+        if not port:
+            continue
+        server = server_class((host, port), handler)
+        server.on_message = on_message
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        print(f"--- [SYSLOG] Listening on {'UDP' if server_class is _UDPServer else 'TCP'} {host}:{port} ---")
+    return servers
+
+# --- Main Execution Block ---
+def main():
+    parser = argparse.ArgumentParser(description="SAD Syslog-Triggered Config Backup Listener")
+    parser.add_argument("--target", required=True, help="The site or group whose devices to listen for.")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on.")
+    parser.add_argument("--udp-port", type=int, default=514, help="UDP syslog port (0 disables UDP).")
+    parser.add_argument("--tcp-port", type=int, default=514, help="TCP syslog port (0 disables TCP).")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS,
+                        help="Seconds to wait after a device's last change event before backing it up.")
+    args = parser.parse_args()
+    print("--- SAD Syslog Listener ---")
+
+    try:
+        master_password = credential_loader.getpass.getpass("Enter master password to unlock credentials: ")
+        creds = credential_loader.load_credentials(conductor.CREDENTIALS_FILE, master_password)
+    except (FileNotFoundError, InvalidTag, Exception) as e:
+        print(f"\nCRITICAL LISTENER ERROR: {e}")
+        exit(1)
+    sites = conductor.get_sites_to_process(args.target, f"{conductor.CONFIG_DIR}site_groups.yml")
+    index = DeviceIndex(sites)
+    scheduler = BackupScheduler(creds, debounce=args.debounce)
+    servers = start_listeners(lambda message, source_ip: handle_message(message, source_ip, index, scheduler, time.monotonic()),
+                              args.host, args.udp_port, args.tcp_port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nListener stopped by user.")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        scheduler.shutdown()
+
+if __name__ == "__main__":
+    main()
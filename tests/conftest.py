@@ -0,0 +1,14 @@
+import pytest
+import device_health
+from tools import governor_tool, timeout_policy_tool
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    # Keeps each test's run-to-run state (latency history, breaker records, governor limits) out of ./output
+    # and away from the other tests
+    monkeypatch.setattr(timeout_policy_tool, 'HISTORY_FILE', f"{tmp_path}/latency_history.json")
+    monkeypatch.setattr(timeout_policy_tool, '_history', None)
+    monkeypatch.setattr(timeout_policy_tool, '_pending', {})
+    monkeypatch.setattr(device_health, 'HEALTH_DIR', f"{tmp_path}/device_health/")
+    monkeypatch.delenv(governor_tool.GOVERNOR_ADDRESS_ENV, raising=False)
+    monkeypatch.setattr(governor_tool, '_governor', governor_tool.Governor({}))
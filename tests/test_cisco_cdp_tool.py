@@ -0,0 +1,59 @@
+import pytest
+from tools import cisco_cdp_tool
+
+IOS_SUMMARY = """
+Capability Codes: R - Router, T - Trans Bridge, B - Source Route Bridge
+                  S - Switch, H - Host, I - IGMP, r - Repeater, P - Phone,
+                  D - Remote, C - CVTA, M - Two-port Mac Relay
+
+Device ID        Local Intrfce     Holdtme    Capability  Platform  Port ID
+core-sw1.example.com
+                 Gig 1/0/1         {hold1}             R S I  WS-C3850- Gig 1/0/48
+SEP001122334455  Gig 1/0/2         {hold2}              H P M  IP Phone  Port {port}
+access-sw2       Gig 1/0/3         {hold3}              S I   WS-C2960X Gig 0/1
+
+Total cdp entries displayed : 3
+"""
+
+NXOS_SUMMARY = """
+Capability Codes: R - Router, T - Trans-Bridge, B - Source-Route-Bridge
+                  S - Switch, H - Host, I - IGMP, r - Repeater,
+                  V - VoIP-Phone, D - Remotely-Managed-Device,
+                  s - Supports-STP-Dispute
+
+Device-ID          Local Intrfce  Hldtme Capability  Platform      Port ID
+core-sw1(FOX1234ABCD)
+                    mgmt0          {hold1}    R S I s   N9K-C93180YC- mgmt0
+leaf-101(FOX5678EFGH)
+                    Eth1/49        {hold2}    R S I s   N9K-C93180YC- Eth1/{port}
+
+Total entries displayed: 2
+"""
+
+def _ios(hold1=155, hold2=162, hold3=171, port=1):
+    return IOS_SUMMARY.format(hold1=hold1, hold2=hold2, hold3=hold3, port=port)
+
+def _nxos(hold1=170, hold2=9, port=49):
+    return NXOS_SUMMARY.format(hold1=f"{hold1:<3}", hold2=f"{hold2:<3}", port=port)
+
+def test_holdtime_change_keeps_ios_fingerprint():
+    assert cisco_cdp_tool.cdp_fingerprint(_ios()) == cisco_cdp_tool.cdp_fingerprint(_ios(hold1=8, hold2=99, hold3=120))
+
+def test_holdtime_change_keeps_nxos_fingerprint():
+    assert cisco_cdp_tool.cdp_fingerprint(_nxos()) == cisco_cdp_tool.cdp_fingerprint(_nxos(hold1=121, hold2=179))
+
+@pytest.mark.parametrize("summary, changed", [
+    (_ios(), _ios(port=2)),           # the phone moved to its other port
+    (_nxos(), _nxos(port=50)),        # the uplink moved to another interface
+    (_ios(), _ios().replace("Gig 1/0/3 ", "Gig 1/0/4 ")),
+], ids=["ios-phone-port", "nxos-port-id", "ios-local-interface"])
+def test_port_change_alters_fingerprint(summary, changed):
+    assert cisco_cdp_tool.cdp_fingerprint(summary) != cisco_cdp_tool.cdp_fingerprint(changed)
+
+def test_fingerprint_without_header_keeps_every_number():
+    rows = "access-sw2       Gig 1/0/3         {hold}              S I   WS-C2960X Gig 0/1"
+    assert cisco_cdp_tool.cdp_fingerprint(rows.format(hold=155)) != cisco_cdp_tool.cdp_fingerprint(rows.format(hold=154))
+
+def test_empty_summary_has_no_fingerprint():
+    assert cisco_cdp_tool.cdp_fingerprint(None) == ""
+    assert cisco_cdp_tool.cdp_fingerprint("") == ""
@@ -0,0 +1,89 @@
+import threading
+import time
+import types
+import pytest
+from tools import cisco_session_tool
+
+CONN_DETAILS = {'device_type': "cisco_ios", 'host': "10.1.0.1", 'username': "admin", 'password': "secret"}
+LONG_AGO = 10 ** 6
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.alive, self.disconnected = True, False
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.disconnected = True
+
+@pytest.fixture
+def session_pool(monkeypatch):
+    connections = []
+    def connect(**kwargs):
+        connections.append(FakeConnection(**kwargs))
+        return connections[-1]
+    monkeypatch.setattr(cisco_session_tool, 'ConnectHandler', connect)
+    monkeypatch.setattr(cisco_session_tool, '_session_pool', {})
+    monkeypatch.setattr(cisco_session_tool, '_session_idle_timeout', 60)
+    return connections
+
+def test_checkout_reuses_the_pooled_session(session_pool):
+    entry = cisco_session_tool._checkout_session(CONN_DETAILS)
+    cisco_session_tool._checkin_session(entry, healthy=True)
+    assert cisco_session_tool._checkout_session(CONN_DETAILS) is entry
+    cisco_session_tool._checkin_session(entry, healthy=True)
+    assert len(session_pool) == 1
+
+def test_idle_sessions_are_evicted_and_closed(session_pool):
+    entry = cisco_session_tool._checkout_session(CONN_DETAILS)
+    cisco_session_tool._checkin_session(entry, healthy=True)
+    assert cisco_session_tool.evict_idle_sessions(now=time.monotonic() + LONG_AGO) == 1
+    assert session_pool[0].disconnected
+    assert cisco_session_tool._session_pool == {}
+
+def test_eviction_between_lookup_and_lock_keeps_the_entry(session_pool, monkeypatch):
+    # Eviction runs right after the caller found the (idle) entry but before it locked it. The entry must stay
+    # pooled, or the session the caller opens on it would never be closed.
+    class EvictingLock:
+        def __init__(self):
+            self._lock = threading.Lock()
+        def acquire(self):
+            cisco_session_tool.evict_idle_sessions(now=time.monotonic() + LONG_AGO)
+            self._lock.acquire()
+        def release(self):
+            self._lock.release()
+        def locked(self):
+            return self._lock.locked()
+    monkeypatch.setattr(cisco_session_tool, 'threading', types.SimpleNamespace(Lock=EvictingLock))
+
+    entry = cisco_session_tool._checkout_session(CONN_DETAILS)
+    assert list(cisco_session_tool._session_pool.values()) == [entry]
+    cisco_session_tool._checkin_session(entry, healthy=True)
+    assert not session_pool[0].disconnected
+
+def test_waiting_caller_keeps_the_entry(session_pool):
+    first = cisco_session_tool._checkout_session(CONN_DETAILS)
+    second = []
+    waiter = threading.Thread(target=lambda: second.append(cisco_session_tool._checkout_session(CONN_DETAILS)), daemon=True)
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while first['users'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    cisco_session_tool._checkin_session(first, healthy=True)
+    waiter.join(timeout=5)
+    # Checked in and idle for long, but the waiter now holds it
+    assert cisco_session_tool.evict_idle_sessions(now=time.monotonic() + LONG_AGO) == 0
+    assert second == [first]
+    cisco_session_tool._checkin_session(first, healthy=True)
+    assert cisco_session_tool.evict_idle_sessions(now=time.monotonic() + LONG_AGO) == 1
+
+def test_failed_login_leaves_no_session_checked_out(session_pool, monkeypatch):
+    def refuse(**kwargs):
+        raise ConnectionRefusedError("connection refused")
+    monkeypatch.setattr(cisco_session_tool, 'ConnectHandler', refuse)
+    with pytest.raises(ConnectionRefusedError):
+        cisco_session_tool._checkout_session(CONN_DETAILS)
+    entry = next(iter(cisco_session_tool._session_pool.values()))
+    assert (entry['conn'], entry['users'], entry['lock'].locked()) == (None, 0, False)
+    assert cisco_session_tool.evict_idle_sessions(now=time.monotonic() + LONG_AGO) == 1
@@ -0,0 +1,47 @@
+import time
+import types
+import pytest
+import conductor
+
+def test_default_schedules_include_enrichment():
+    assert conductor._parse_schedules(None) == conductor.DAEMON_SCHEDULES
+    assert 'enrichment' in conductor.DAEMON_SCHEDULES
+
+def test_schedule_overrides_and_disabling():
+    schedules = conductor._parse_schedules(["arp=600", "backup=0"])
+    assert schedules == {'arp': 600.0, 'enrichment': 15 * 60, 'discovery': 24 * 3600}
+
+@pytest.mark.parametrize("run_mode, expected", [
+    ('discovery_only', {'arp', 'discovery'}),
+    ('backup_configs', {'backup', 'discovery'}),
+    ('full', {'arp', 'discovery', 'enrichment'}),
+    ('generate_dashboard', {'arp', 'backup', 'discovery', 'enrichment'}),
+])
+def test_run_mode_limits_the_schedules(run_mode, expected):
+    assert set(conductor._parse_schedules(None, run_mode)) == expected
+
+@pytest.mark.parametrize("schedule_args, run_mode", [
+    (["dashboard=60"], None),                   # group phases have no schedule of their own
+    (["nonsense=60"], None),
+    (["backup=600"], 'discovery_only'),         # not part of the run mode
+    (["discovery=0", "arp=0"], 'discovery_only'),
+])
+def test_invalid_schedules_are_rejected(schedule_args, run_mode):
+    with pytest.raises(ValueError):
+        conductor._parse_schedules(schedule_args, run_mode)
+
+def test_daemon_rebuilds_group_targets_every_cycle(monkeypatch):
+    # With --run-mode generate_dashboard the dashboard follows every cycle of the scheduled phases
+    cycles, now = [], [1000.0]
+    def fake_run_cycle(run, targets, force=False, ttls=None):
+        cycles.append((targets, ttls))
+        if len(cycles) == 2:
+            raise KeyboardInterrupt
+    def sleep(seconds):
+        now[0] += seconds
+    monkeypatch.setattr(conductor, 'run_cycle', fake_run_cycle)
+    monkeypatch.setattr(conductor, 'time', types.SimpleNamespace(time=lambda: now[0], sleep=sleep, strftime=time.strftime))
+    with pytest.raises(KeyboardInterrupt):
+        conductor.run_daemon({}, {'arp': 300, 'backup': 3600}, jitter=0, group_targets=['dashboard'])
+    assert cycles == [(['arp', 'backup', 'dashboard'], {'arp': 300, 'backup': 3600}),
+                      (['arp', 'dashboard'], {'arp': 0, 'backup': 3600})]
@@ -0,0 +1,58 @@
+import threading
+import orchestrator
+import shared_utils
+from tools import config_archive_tool
+
+BASE_CONFIG = "\n".join(["hostname core-sw1", "!"] + [f"interface GigabitEthernet1/0/{port}\n description port {port}\n!" for port in range(1, 49)])
+
+def _config(revision: int) -> str:
+    return f"{BASE_CONFIG}\nsnmp-server location rack-{revision}\nend"
+
+def test_store_config_versions_and_deltas(tmp_path):
+    archive_dir = str(tmp_path)
+    first = config_archive_tool.store_config(archive_dir, "core-sw1", _config(1))
+    assert (first['version'], first['chain']) == (1, 0)
+    # Only volatile lines changed: not a new version
+    assert config_archive_tool.store_config(archive_dir, "core-sw1", "! Last configuration change at 10:00:00 UTC\n" + _config(1)) is None
+    second = config_archive_tool.store_config(archive_dir, "core-sw1", _config(2))
+    assert (second['version'], second['chain']) == (2, 1)
+    assert config_archive_tool.materialize_version(archive_dir, "core-sw1", 1) == _config(1)
+    assert config_archive_tool.materialize_version(archive_dir, "core-sw1") == _config(2)
+
+def test_concurrent_stores_of_one_device_keep_every_version(tmp_path):
+    # Syslog-triggered backups and the backup phases can store the same device at once
+    archive_dir = str(tmp_path)
+    config_archive_tool.store_config(archive_dir, "core-sw1", _config(0))
+    barrier = threading.Barrier(8)
+    def store(revision):
+        barrier.wait()
+        config_archive_tool.store_config(archive_dir, "core-sw1", _config(revision))
+    threads = [threading.Thread(target=store, args=(revision,)) for revision in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    versions = config_archive_tool.list_versions(archive_dir, "core-sw1")
+    assert [entry['version'] for entry in versions] == list(range(1, 10))
+    stored = [config_archive_tool.materialize_version(archive_dir, "core-sw1", entry['version']) for entry in versions]
+    assert sorted(stored) == sorted(_config(revision) for revision in range(9))
+
+def test_marker_updates_merge_with_concurrent_backups(tmp_path):
+    config_backup_dir = f"{tmp_path}/"
+    markers_path = f"{config_backup_dir}{orchestrator.CONFIG_MARKERS_FILE}"
+    shared_utils.save_json_cache(markers_path, {'core-sw1': "old-1", 'access-sw2': "old-2", 'retired-sw9': "old-9"})
+
+    # A site backup phase loads the markers...
+    phase_loaded = shared_utils.load_json_cache(markers_path)
+    phase_markers = dict(phase_loaded)
+    # ...a syslog-triggered backup of access-sw2 finishes while it runs...
+    single_loaded = shared_utils.load_json_cache(markers_path)
+    single_markers = {**single_loaded, 'access-sw2': "new-2"}
+    orchestrator._save_config_markers(config_backup_dir, single_loaded, single_markers)
+    # ...and the phase then saves what it changed itself
+    phase_markers['core-sw1'] = "new-1"
+    del phase_markers['retired-sw9']
+    orchestrator._save_config_markers(config_backup_dir, phase_loaded, phase_markers)
+
+    assert shared_utils.load_json_cache(markers_path) == {'core-sw1': "new-1", 'access-sw2': "new-2"}
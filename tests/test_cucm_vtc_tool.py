@@ -0,0 +1,127 @@
+import io
+import re
+import threading
+import pytest
+from tools import cucm_vtc_tool
+
+PHONE_NUMBERS = [f"5{index:04d}" for index in range(2500)]
+
+def _rows_response(rows: list) -> bytes:
+    body = ''.join('<row>' + ''.join(f"<{column}>{value}</{column}>" for column, value in row.items()) + '</row>' for row in rows)
+    return (f'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>'
+            f'<ns:executeSQLQueryResponse xmlns:ns="http://www.cisco.com/AXL/API/14.0"><return>{body}</return>'
+            f'</ns:executeSQLQueryResponse></soapenv:Body></soapenv:Envelope>').encode('utf-8')
+
+class FakeAXL:
+    # Answers the COUNT and SKIP/FIRST statements from an in-memory table, and refuses pages above 'max_rows'
+    # with the fault (and row suggestion) CUCM sends for results that are too large
+    def __init__(self, phone_numbers: list, max_rows: int = None):
+        self.rows = [{'device_name': f"SEP{number}", 'device_description': f"Room {number}", 'model_phone': "Cisco Webex Room Kit",
+                      'phone_number': number} for number in phone_numbers]
+        self.max_rows = max_rows
+        self.pages = []
+        self._lock = threading.Lock()
+
+    def __call__(self, session, cucm_host, username, headers, sql_query):
+        if 'COUNT(*)' in sql_query:
+            return _rows_response([{'row_count': len(self.rows)}])
+        skip, first = map(int, re.search(r"SKIP (\d+) FIRST (\d+)", sql_query).groups())
+        if self.max_rows is not None and first > self.max_rows:
+            raise cucm_vtc_tool.AXLFault(f"Query request too large. Total rows matched: {len(self.rows)} rows. "
+                                  f"Suggestive Row Fetch: less than {self.max_rows} rows")
+        with self._lock:
+            self.pages.append((skip, first))
+        return _rows_response(self.rows[skip:skip + first])
+
+@pytest.fixture
+def axl(monkeypatch):
+    def install(phone_numbers, max_rows=None):
+        fake = FakeAXL(phone_numbers, max_rows)
+        monkeypatch.setattr(cucm_vtc_tool, '_execute_sql', fake)
+        return fake
+    return install
+
+def _numbers(devices) -> list:
+    return [device['phone_number'] for device in devices]
+
+def _page_rows(contents: list) -> list:
+    return [row for content in contents for row in cucm_vtc_tool.iter_rows(io.BytesIO(content))]
+
+# --- iter_vtc_devices ---
+@pytest.mark.parametrize("total_rows, expected_pages", [
+    (0, [0]),
+    (1, [0]),
+    (999, [0]),
+    (1000, [0]),                    # an exact page: no empty page after it
+    (1001, [0, 1000]),
+    (2500, [0, 1000, 2000]),
+], ids=["empty", "one-row", "under-a-page", "exactly-one-page", "one-past-a-page", "partial-last-page"])
+def test_pages_cover_every_row_once(axl, total_rows, expected_pages):
+    fake = axl(PHONE_NUMBERS[:total_rows])
+    assert _numbers(cucm_vtc_tool.iter_vtc_devices("cucm", "admin", "secret", "5%")) == PHONE_NUMBERS[:total_rows]
+    assert sorted(skip for skip, _ in fake.pages) == expected_pages
+
+def test_page_size_shrinks_to_the_suggested_row_count(axl):
+    fake = axl(PHONE_NUMBERS, max_rows=300)
+    assert _numbers(cucm_vtc_tool.iter_vtc_devices("cucm", "admin", "secret", ["5%"])) == PHONE_NUMBERS
+    # 90% of the suggestion, and the remaining pages use it too
+    assert {first for _, first in fake.pages} == {270}
+
+def test_get_vtc_devices_returns_none_on_fault(monkeypatch):
+    def refuse(*args):
+        raise cucm_vtc_tool.AXLFault("Invalid SQL")
+    monkeypatch.setattr(cucm_vtc_tool, '_execute_sql', refuse)
+    assert cucm_vtc_tool.get_vtc_devices("cucm", "admin", "secret", "5%") is None
+
+# --- _calibrate_first_page ---
+def test_calibration_keeps_the_default_page_when_it_fits(axl):
+    axl(PHONE_NUMBERS)
+    page_size, content = cucm_vtc_tool._calibrate_first_page(None, "cucm", "admin", {}, "1=1")
+    assert page_size == cucm_vtc_tool.AXL_PAGE_SIZE
+    assert _numbers(_page_rows([content])) == PHONE_NUMBERS[:cucm_vtc_tool.AXL_PAGE_SIZE]
+
+def test_calibration_halves_when_the_suggestion_is_larger(axl):
+    # A suggestion above half the current size still at least halves it, so calibration always converges
+    fake = axl(PHONE_NUMBERS, max_rows=900)
+    page_size, _ = cucm_vtc_tool._calibrate_first_page(None, "cucm", "admin", {}, "1=1")
+    assert page_size == 500
+    assert fake.pages == [(0, 500)]
+
+def test_calibration_reraises_other_faults(monkeypatch):
+    def refuse(*args):
+        raise cucm_vtc_tool.AXLFault("Invalid SQL")
+    monkeypatch.setattr(cucm_vtc_tool, '_execute_sql', refuse)
+    with pytest.raises(cucm_vtc_tool.AXLFault):
+        cucm_vtc_tool._calibrate_first_page(None, "cucm", "admin", {}, "1=1")
+
+# --- _fetch_page ---
+def test_too_large_page_is_split_without_gaps_or_overlap(axl):
+    fake = axl(PHONE_NUMBERS, max_rows=100)
+    contents = cucm_vtc_tool._fetch_page(None, "cucm", "admin", {}, "1=1", skip=1000, first=250)
+    assert _numbers(_page_rows(contents)) == PHONE_NUMBERS[1000:1250]
+    assert all(first <= 100 for _, first in fake.pages)
+
+def test_single_row_too_large_is_raised(axl):
+    axl(PHONE_NUMBERS, max_rows=0)
+    with pytest.raises(cucm_vtc_tool.AXLFault):
+        cucm_vtc_tool._fetch_page(None, "cucm", "admin", {}, "1=1", skip=0, first=4)
+
+# --- Batched patterns ---
+def _device(phone_number: str) -> dict:
+    return {'device_name': f"SEP{phone_number}", 'phone_number': phone_number}
+
+def test_overlapping_patterns_each_get_their_rows():
+    # '5012%' is a subset of '501%': its rows belong to both sites, the rest only to the broader one
+    devices = [_device(number) for number in ("50110", "50120", "50129", "50200")]
+    split = cucm_vtc_tool.split_by_pattern(devices, ["501%", "5012%"])
+    assert _numbers(split["501%"]) == ["50110", "50120", "50129"]
+    assert _numbers(split["5012%"]) == ["50120", "50129"]
+
+def test_like_wildcards_and_literals():
+    devices = [_device(number) for number in ("5010", "50100", "5.10", "+15010")]
+    split = cucm_vtc_tool.split_by_pattern(devices, ["501_", "5.1_", "+1%", "9%"])
+    assert split == {"501_": [devices[0]], "5.1_": [devices[2]], "+1%": [devices[3]], "9%": []}
+
+def test_patterns_are_batched_into_one_where_clause():
+    assert (cucm_vtc_tool._where_clause(["501%", "5012%", "50'3%"])
+            == "n.dnorpattern LIKE '501%' OR n.dnorpattern LIKE '5012%' OR n.dnorpattern LIKE '50''3%'")
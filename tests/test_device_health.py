@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+import device_health
+
+TARGET = "10.1.0.1"
+
+def test_threshold_opens_and_success_closes_the_circuit():
+    now = 1_000_000.0
+    for _ in range(device_health.FAILURE_THRESHOLD):
+        assert device_health.allow_attempt(TARGET, now=now)
+        device_health.record_failure(TARGET, "timed out", now=now)
+    assert not device_health.allow_attempt(TARGET, now=now + 60)
+    assert device_health.open_circuit(TARGET, now=now + 60)['consecutive_failures'] == device_health.FAILURE_THRESHOLD
+
+    # Past the backoff one caller gets to probe, the next is turned away
+    after_backoff = now + device_health.BASE_BACKOFF_SECONDS + 1
+    assert device_health.allow_attempt(TARGET, now=after_backoff)
+    assert not device_health.allow_attempt(TARGET, now=after_backoff)
+    device_health.record_success(TARGET)
+    assert device_health.open_circuit(TARGET) is None
+    assert device_health.allow_attempt(TARGET)
+
+def test_healthy_targets_are_not_written():
+    device_health.record_success(TARGET)
+    assert not os.path.exists(device_health.HEALTH_DIR)
+
+def _fail_repeatedly(start, count):
+    start.wait()
+    for _ in range(count):
+        device_health.record_failure(TARGET, "connection refused")
+
+def test_failures_from_several_processes_are_all_counted(monkeypatch):
+    # Phases and sites sharing a device update its record from separate processes; no increment may be lost
+    monkeypatch.setattr(device_health, 'FAILURE_THRESHOLD', 10 ** 6)
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(4)
+    workers = [context.Process(target=_fail_repeatedly, args=(start, 25)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+    record = device_health.shared_utils.load_json_cache(device_health._paths(TARGET)[0])
+    assert record['failures'] == 4 * 25
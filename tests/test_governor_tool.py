@@ -0,0 +1,106 @@
+import threading
+import time
+import pytest
+from tools import governor_tool
+
+DEVICE = ('device', "10.1.0.1")
+AAA = ('aaa', "admin")
+
+def _hold(governor, keys, started, release):
+    # Takes the keys on a background thread and keeps them until 'release' is set
+    def run():
+        governor.acquire(keys)
+        started.set()
+        release.wait()
+        governor.release(keys)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def test_unlimited_scopes_never_wait():
+    governor = governor_tool.Governor({})
+    assert governor.acquire([DEVICE, AAA]) == pytest.approx(0, abs=0.01)
+    governor.release([DEVICE, AAA])
+    assert governor.metrics()['device']['blocked'] == 0
+
+def test_concurrency_limit_blocks_until_release():
+    governor = governor_tool.Governor({'device': {'concurrency': 1}})
+    started, release = threading.Event(), threading.Event()
+    holder = _hold(governor, [DEVICE], started, release)
+    started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    waited = governor.acquire([DEVICE])
+    governor.release([DEVICE])
+    holder.join(5)
+    assert waited >= 0.15
+    assert governor.metrics()['device']['blocked'] == 1
+
+def test_other_devices_are_not_blocked():
+    governor = governor_tool.Governor({'device': {'concurrency': 1}})
+    started, release = threading.Event(), threading.Event()
+    holder = _hold(governor, [DEVICE], started, release)
+    started.wait(5)
+    assert governor.acquire([('device', "10.1.0.2")]) < 0.05
+    release.set()
+    holder.join(5)
+
+def test_rate_limit_spaces_out_acquisitions():
+    governor = governor_tool.Governor({'aaa': {'rate': 20, 'burst': 2}})
+    started = time.monotonic()
+    for _ in range(4):
+        governor.acquire([AAA])
+        governor.release([AAA])
+    # Two go out as a burst, the other two wait for a token each (1/20 s)
+    assert time.monotonic() - started >= 0.09
+    stats = governor.metrics()['aaa:admin']
+    assert (stats['acquired'], stats['blocked']) == (4, 2)
+
+def test_service_limits_are_per_service():
+    governor = governor_tool.Governor({'services': {'axl': {'concurrency': 1}}})
+    started, release = threading.Event(), threading.Event()
+    holder = _hold(governor, [('service', "axl")], started, release)
+    started.wait(5)
+    assert governor.acquire([('service', "nxapi")]) < 0.05
+    release.set()
+    holder.join(5)
+
+def test_wait_is_charged_only_to_the_blocking_scope():
+    # The AAA limit is full; the device scope requested alongside it is free and must not show the wait
+    governor = governor_tool.Governor({'device': {'concurrency': 5}, 'aaa': {'concurrency': 1}})
+    started, release = threading.Event(), threading.Event()
+    holder = _hold(governor, [('device', "10.1.0.9"), AAA], started, release)
+    started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    waited = governor.acquire([DEVICE, AAA])
+    governor.release([DEVICE, AAA])
+    holder.join(5)
+
+    metrics = governor.metrics()
+    assert metrics['aaa:admin']['blocked'] == 1
+    assert metrics['aaa:admin']['total_wait'] == pytest.approx(waited, abs=0.05)
+    assert metrics['aaa:admin']['avg_wait'] == pytest.approx(waited / 2, abs=0.05)
+    assert (metrics['device']['blocked'], metrics['device']['total_wait']) == (0, 0.0)
+
+def test_waiting_count_shows_queued_callers():
+    governor = governor_tool.Governor({'aaa': {'concurrency': 1}})
+    started, release = threading.Event(), threading.Event()
+    holder = _hold(governor, [AAA], started, release)
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: (governor.acquire([AAA]), governor.release([AAA])), daemon=True)
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while governor.metrics().get('aaa:admin', {}).get('waiting') != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert governor.metrics()['aaa:admin']['waiting'] == 1
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert governor.metrics()['aaa:admin']['waiting'] == 0
+
+def test_limit_context_includes_the_current_site(monkeypatch):
+    governor = governor_tool.Governor({'site': {'concurrency': 1}})
+    monkeypatch.setattr(governor_tool, '_governor', governor)
+    monkeypatch.setattr(governor_tool, '_current_site', "site-a")
+    with governor_tool.limit(device="10.1.0.1", aaa="admin", service="ssh"):
+        assert sorted(governor._active) == [('aaa', "admin"), ('device', "10.1.0.1"), ('service', "ssh"), ('site', "site-a")]
+    assert governor._active == {}
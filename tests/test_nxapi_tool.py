@@ -0,0 +1,196 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import orchestrator
+from tools import nxapi_tool
+
+DEVICE = {'device_name': "leaf-101", 'ip': "10.1.0.101", 'type': "cisco_nxos"}
+CREDS = {'net_user': "admin", 'net_pass': "secret"}
+
+# --- NX-API bodies as a Nexus returns them: one row is a dict, several rows are a list ---
+CDP_ONE_ROW = {'TABLE_cdp_neighbor_detail_info': {'ROW_cdp_neighbor_detail_info': {
+    'ifindex': "436207616", 'device_id': "core-sw1(FOX1234ABCD)", 'v4mgmtaddr': "10.1.0.1", 'platform_id': "N9K-C93180YC-EX",
+    'capability': "switch", 'intf_id': "Ethernet1/49", 'port_id': "Ethernet1/1"}}}
+CDP_ROWS = {'TABLE_cdp_neighbor_detail_info': {'ROW_cdp_neighbor_detail_info': [
+    {'device_id': "core-sw1(FOX1234ABCD)", 'v4mgmtaddr': "10.1.0.1", 'platform_id': "N9K-C93180YC-EX",
+     'capability': ["router", "switch", "IGMP_cnd_filtering", "Supports-STP-Dispute"], 'intf_id': "Ethernet1/49"},
+    {'device_id': "SEP001122334455", 'v4addr': "10.1.20.15", 'platform_id': "Cisco IP Phone 8865",
+     'capability': ["host", "phone"], 'intf_id': "Ethernet1/5"},
+    {'device_id': "unmanaged-ap", 'platform_id': "AIR-AP2802I", 'intf_id': "Ethernet1/6"},   # no address: dropped
+]}}
+
+ARP_ONE_ROW = {'TABLE_vrf': {'ROW_vrf': {'vrf-name-out': "default", 'cnt-total': 1, 'TABLE_adj': {'ROW_adj': {
+    'intf-out': "Vlan10", 'ip-addr-out': "10.1.10.20", 'time-stamp': "00:04:12", 'mac': "0011.2233.4455"}}}}}
+ARP_ROWS = {'TABLE_vrf': {'ROW_vrf': [
+    {'vrf-name-out': "default", 'TABLE_adj': {'ROW_adj': [
+        {'intf-out': "Vlan10", 'ip-addr-out': "10.1.10.20", 'time-stamp': "00:04:12", 'mac': "0011.2233.4455"},
+        {'intf-out': "Vlan20", 'ip-addr-out': "10.1.20.15", 'time-stamp': "00:00:41", 'mac': "aabb.ccdd.eeff"},
+        {'intf-out': "Vlan20", 'ip-addr-out': "10.1.20.16", 'time-stamp': "00:00:02", 'incomplete': "true"},   # no MAC: dropped
+    ]}},
+    {'vrf-name-out': "management", 'TABLE_adj': {'ROW_adj': {
+        'intf-out': "mgmt0", 'ip-addr-out': "192.168.0.1", 'time-stamp': "00:12:00", 'mac': "0000.0c07.ac01"}}},
+]}}
+
+VLAN_ONE_ROW = {'TABLE_vlanbriefxbrief': {'ROW_vlanbriefxbrief': {
+    'vlanshowbr-vlanid': "1", 'vlanshowbr-vlanname': "default", 'vlanshowbr-vlanstate': "active", 'vlanshowplist-ifidx': "Ethernet1/1"}}}
+VLAN_ROWS = {'TABLE_vlanbriefxbrief': {'ROW_vlanbriefxbrief': [
+    {'vlanshowbr-vlanid': "10", 'vlanshowbr-vlanname': "users", 'vlanshowbr-vlanstate': "active",
+     'vlanshowplist-ifidx': "Ethernet1/1,Ethernet1/2"},
+    {'vlanshowbr-vlanid': "20", 'vlanshowbr-vlanname': "voice", 'vlanshowbr-vlanstate': "active"},
+]}}
+INTERFACE_ONE_ROW = {'TABLE_intf': {'ROW_intf': {'intf-name': "Vlan10", 'prefix': "10.1.10.1", 'masklen': "24"}}}
+# 'show ip interface' returns TABLE_intf itself as a list, one ROW_intf per element
+INTERFACE_ROWS = {'TABLE_intf': [
+    {'ROW_intf': {'intf-name': "Vlan10", 'prefix': "10.1.10.1", 'masklen': "24"}},
+    {'ROW_intf': {'intf-name': "Vlan20", 'prefix': "10.1.20.1", 'masklen': "23"}},
+    {'ROW_intf': {'intf-name': "Lo0", 'unnum-intf': "Lo0"}},   # unnumbered: ignored
+]}
+
+# --- Stub NX-API endpoint ---
+class StubNxapi:
+    # Answers JSON-RPC 'cli' batches from a command -> body map; commands mapped to an Exception get a per-command error
+    def __init__(self):
+        self.bodies, self.status, self.requests = {}, 200, []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append(request)
+                replies = []
+                for call in request:
+                    body = stub.bodies.get(call['params']['cmd'])
+                    if isinstance(body, Exception):
+                        replies.append({'jsonrpc': "2.0", 'id': call['id'],
+                                        'error': {'code': -32602, 'message': "Invalid params", 'data': {'msg': str(body)}}})
+                    else:
+                        replies.append({'jsonrpc': "2.0", 'id': call['id'], 'result': {'body': body}})
+                # A batch of one is answered with a bare object, like the switch does
+                payload = json.dumps(replies if len(replies) > 1 else replies[0]).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', "application/json-rpc")
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/ins"
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def nxapi(monkeypatch):
+    stub = StubNxapi()
+    monkeypatch.setattr(nxapi_tool, 'NXAPI_URL_TEMPLATE', stub.url)
+    yield stub
+    stub.close()
+
+# --- Parsers ---
+@pytest.mark.parametrize("body, expected", [
+    (CDP_ONE_ROW, [{'device_name': "core-sw1(FOX1234ABCD)", 'ip_address': "10.1.0.1", 'platform': "N9K-C93180YC-EX",
+                    'local_interface': "Ethernet1/49", 'capabilities': ["Switch"]}]),
+    (CDP_ROWS, [{'device_name': "core-sw1(FOX1234ABCD)", 'ip_address': "10.1.0.1", 'platform': "N9K-C93180YC-EX",
+                 'local_interface': "Ethernet1/49", 'capabilities': ["Router", "Switch", "IGMP", "Supports-STP-Dispute"]},
+                {'device_name': "SEP001122334455", 'ip_address': "10.1.20.15", 'platform': "Cisco IP Phone 8865",
+                 'local_interface': "Ethernet1/5", 'capabilities': ["Host", "Phone"]}]),
+    ({}, []),
+], ids=["one-row", "rows", "no-neighbors"])
+def test_parse_cdp_json(body, expected):
+    assert nxapi_tool.parse_cdp_json(body) == expected
+
+def test_parse_arp_json_one_row():
+    assert nxapi_tool.parse_arp_json(ARP_ONE_ROW) == {
+        "10.1.10.20": {'mac_address': "0011.2233.4455", 'age': "00:04:12", 'interface': "Vlan10", 'protocol': "Internet", 'type': "ARPA"}}
+
+def test_parse_arp_json_rows_across_vrfs():
+    table = nxapi_tool.parse_arp_json(ARP_ROWS)
+    assert sorted(table) == ["10.1.10.20", "10.1.20.15", "192.168.0.1"]
+    assert table["10.1.20.15"]['interface'] == "Vlan20"
+
+def test_parse_vlan_json_one_row():
+    assert nxapi_tool.parse_vlan_json(VLAN_ONE_ROW, INTERFACE_ONE_ROW) == {
+        'vlan_list': [{'vlan_id': "1", 'name': "default", 'status': "active", 'interfaces': ["Ethernet1/1"]}],
+        'subnet_list': ["10.1.10.0/24"]}
+
+def test_parse_vlan_json_rows():
+    result = nxapi_tool.parse_vlan_json(VLAN_ROWS, INTERFACE_ROWS)
+    assert [(vlan['vlan_id'], vlan['interfaces']) for vlan in result['vlan_list']] == [("10", ["Ethernet1/1", "Ethernet1/2"]), ("20", [])]
+    assert result['subnet_list'] == ["10.1.10.0/24", "10.1.20.0/23"]
+
+# --- Transport ---
+def test_collect_parts_in_one_batch(nxapi):
+    nxapi.bodies = {"show vlan brief": VLAN_ROWS, "show ip interface": INTERFACE_ROWS,
+                    "show cdp neighbors detail": CDP_ONE_ROW, "show ip arp": ARP_ROWS}
+    results = nxapi_tool.collect_parts(DEVICE, "admin", "secret", ['vlan', 'cdp', 'arp', 'config'])
+    assert len(nxapi.requests) == 1
+    assert [call['params']['cmd'] for call in nxapi.requests[0]] == [
+        "show vlan brief", "show ip interface", "show cdp neighbors detail", "show ip arp"]
+    assert sorted(results) == ['arp', 'cdp', 'vlan']   # 'config' has no NX-API mapping
+    assert results['vlan']['subnet_list'] == ["10.1.10.0/24", "10.1.20.0/23"]
+    assert results['cdp'][0]['device_name'] == "core-sw1(FOX1234ABCD)"
+    assert len(results['arp']) == 3
+
+def test_null_body_means_no_rows(nxapi):
+    nxapi.bodies = {"show cdp neighbors detail": None}
+    assert nxapi_tool.collect_parts(DEVICE, "admin", "secret", ['cdp']) == {'cdp': []}
+
+def test_failed_command_only_fails_its_part(nxapi):
+    nxapi.bodies = {"show vlan brief": VLAN_ROWS, "show ip interface": RuntimeError("% Invalid command"),
+                    "show cdp neighbors detail": CDP_ROWS}
+    results = nxapi_tool.collect_parts(DEVICE, "admin", "secret", ['vlan', 'cdp'])
+    assert results['vlan'] is None
+    assert len(results['cdp']) == 2
+
+@pytest.mark.parametrize("status", [401, 500])
+def test_http_error_fails_every_part(nxapi, status):
+    nxapi.status = status
+    nxapi.bodies = {"show ip arp": ARP_ROWS}
+    assert nxapi_tool.run_nxapi_commands(DEVICE, "admin", "secret", ["show ip arp"]) is None
+    assert nxapi_tool.collect_parts(DEVICE, "admin", "secret", ['arp']) == {'arp': None}
+
+# --- Fallback to SSH ---
+@pytest.fixture
+def ssh_calls(monkeypatch):
+    calls = []
+    def fake_collect_over_ssh(device, creds, parts, cdp_cache=None, config_markers=None):
+        calls.append(parts)
+        return {part: f"{part} over ssh" for part in parts}
+    monkeypatch.setattr(orchestrator, '_collect_over_ssh', fake_collect_over_ssh)
+    return calls
+
+def test_collect_device_data_uses_nxapi_only(nxapi, ssh_calls):
+    nxapi.bodies = {"show cdp neighbors detail": CDP_ONE_ROW, "show ip arp": ARP_ONE_ROW}
+    results = orchestrator.collect_device_data(DEVICE, CREDS, ['cdp', 'arp'])
+    assert ssh_calls == []
+    assert results['cdp'][0]['ip_address'] == "10.1.0.1"
+
+def test_collect_device_data_falls_back_on_http_error(nxapi, ssh_calls):
+    nxapi.status = 500
+    results = orchestrator.collect_device_data(DEVICE, CREDS, ['cdp', 'arp'])
+    assert ssh_calls == [['cdp', 'arp']]
+    assert results == {'cdp': "cdp over ssh", 'arp': "arp over ssh"}
+
+def test_collect_device_data_falls_back_on_connection_error(nxapi, ssh_calls):
+    nxapi.close()   # nothing listens on the port any more
+    results = orchestrator.collect_device_data(DEVICE, CREDS, ['cdp'])
+    assert ssh_calls == [['cdp']]
+    assert results == {'cdp': "cdp over ssh"}
+
+def test_collect_device_data_falls_back_for_failed_parts_only(nxapi, ssh_calls):
+    nxapi.bodies = {"show cdp neighbors detail": CDP_ROWS, "show ip arp": RuntimeError("% Permission denied")}
+    results = orchestrator.collect_device_data(DEVICE, CREDS, ['cdp', 'arp', 'config'])
+    assert ssh_calls == [['arp', 'config']]
+    assert len(results['cdp']) == 2
+    assert results['arp'] == "arp over ssh"
+
+def test_ios_devices_never_use_nxapi(nxapi, ssh_calls):
+    orchestrator.collect_device_data({**DEVICE, 'type': "cisco_ios"}, CREDS, ['cdp'])
+    assert nxapi.requests == []
+    assert ssh_calls == [['cdp']]
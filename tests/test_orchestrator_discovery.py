@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+import pytest
+import orchestrator
+import shared_utils
+
+SITE_SUBNETS = ["10.1.0.0/16"]
+
+def serial_bfs(seed_device, get_discovered_devices, mgmt_override, site_subnets):
+    # The one-at-a-time breadth-first walk discover_topology replaced, kept as the reference behaviour
+    devices_to_scan = [seed_device]
+    discovered_topology, discovered_by_name, scanned_ips = {}, {}, set()
+    while devices_to_scan:
+        current_device = devices_to_scan.pop(0)
+        current_ip = current_device['ip']
+        if current_ip in scanned_ips:
+            continue
+        neighbors = get_discovered_devices(current_device)
+        scanned_ips.add(current_ip)
+        if current_ip not in discovered_topology:
+            discovered_topology[current_ip] = current_device
+            if 'device_name' in current_device:
+                discovered_by_name[current_device['device_name']] = current_ip
+        if neighbors is None:
+            continue
+
+        for neighbor in neighbors:
+            neighbor_name = neighbor.get('device_name', '')
+            override_info = mgmt_override.get(neighbor_name)
+            neighbor_ip = override_info.get('management_ip') if override_info else neighbor.get('ip_address')
+            if shared_utils.is_excluded(neighbor_name, orchestrator.DISCOVERY_EXCLUSION_PATTERNS):
+                continue
+            if not neighbor_ip or not shared_utils.is_ip_in_subnets(neighbor_ip, site_subnets) or neighbor_name in discovered_by_name:
+                continue
+            standardized_neighbor = {'device_name': neighbor_name, 'ip': neighbor_ip}
+            devices_to_scan.append(standardized_neighbor)
+            discovered_topology[neighbor_ip] = standardized_neighbor
+            discovered_by_name[neighbor_name] = neighbor_ip
+    return discovered_topology
+
+def _summary(topology):
+    # (ip, name) pairs in insertion order; discover_topology adds type/platform fields the reference doesn't
+    return [(ip, device['device_name']) for ip, device in topology.items()]
+
+def _random_site(rng):
+    # Builds a CDP graph keyed by the IP a device is scanned at. Names and IPs are drawn from small pools
+    # so the same name shows up at several IPs and the same IP under several names.
+    names = [f"sw{index}" for index in range(12)] + ["SEP001122334455", "dc-spine-1", "dc-leaf-2"]
+    in_scope = [f"10.1.0.{index}" for index in range(1, 15)]
+    out_of_scope = ["10.2.0.1", "192.0.2.7"]
+    graph = {}
+    for ip in in_scope:
+        if rng.random() < 0.15:
+            graph[ip] = None  # CDP collection failed on this device
+            continue
+        neighbors = []
+        for _ in range(rng.randint(0, 6)):
+            neighbor = {'device_name': rng.choice(names), 'platform': rng.choice(["cisco WS-C3850", "N9K-C93180YC-EX"])}
+            roll = rng.random()
+            if roll < 0.1:
+                neighbor['ip_address'] = rng.choice(out_of_scope)
+            elif roll < 0.15:
+                pass  # CDP advertised no management address
+            else:
+                neighbor['ip_address'] = rng.choice(in_scope)
+            neighbors.append(neighbor)
+        graph[ip] = neighbors
+    # One reachable-only-by-override device and one override pointing out of the site
+    mgmt_override = {'sw3': {'management_ip': "10.1.0.14"}, 'sw7': {'management_ip': "10.2.0.9"}}
+    return graph, mgmt_override
+
+def _fake_scanner(graph, rng):
+    # Scans return after a short random delay so the streamed scans complete out of order
+    lock = threading.Lock()
+    def scan_device(device):
+        with lock:
+            delay = rng.random() / 500
+        time.sleep(delay)
+        neighbors = graph.get(device['ip'], [])
+        return {'cdp': None if neighbors is None else [dict(neighbor) for neighbor in neighbors]}
+    return scan_device
+
+@pytest.mark.parametrize("seed", range(40))
+def test_discover_topology_matches_serial_walk(seed):
+    rng = random.Random(seed)
+    graph, mgmt_override = _random_site(rng)
+    seed_device = {'device_name': "sw0", 'ip': "10.1.0.1", 'type': "cisco_ios"}
+
+    expected = serial_bfs(seed_device, lambda device: graph.get(device['ip'], []), mgmt_override, SITE_SUBNETS)
+    topology, scan_results = orchestrator.discover_topology(seed_device, _fake_scanner(graph, rng), mgmt_override, SITE_SUBNETS, max_workers=8)
+
+    assert _summary(topology) == _summary(expected)
+    assert set(topology) <= set(scan_results)
+
+def test_discover_topology_scoping_rules():
+    graph = {
+        "10.1.0.1": [
+            {'device_name': "SEP001122334455", 'ip_address': "10.1.0.50"},   # excluded by name
+            {'device_name': "dc-spine-1", 'ip_address': "10.1.0.51"},        # excluded by name
+            {'device_name': "remote", 'ip_address': "10.2.0.1"},             # outside the site subnets
+            {'device_name': "no-address"},                                   # no management address
+            {'device_name': "core", 'ip_address': "172.16.0.1"},             # pulled in by its override
+            {'device_name': "access", 'ip_address': "10.1.0.2", 'platform': "N9K-C93180YC-EX"},
+        ],
+        "10.1.0.5": [{'device_name': "access", 'ip_address': "10.1.0.3"}],   # name already claimed
+        "10.1.0.2": None,                                                    # CDP failed
+    }
+    mgmt_override = {'core': {'management_ip': "10.1.0.5"}}
+    seed_device = {'device_name': "seed", 'ip': "10.1.0.1", 'type': "cisco_ios"}
+    topology, _ = orchestrator.discover_topology(seed_device, _fake_scanner(graph, random.Random(0)), mgmt_override, SITE_SUBNETS, max_workers=4)
+    assert _summary(topology) == [("10.1.0.1", "seed"), ("10.1.0.5", "core"), ("10.1.0.2", "access")]
+    assert topology["10.1.0.2"]['type'] == "cisco_nxos"
+
+def test_discover_topology_reuses_known_results():
+    graph = {"10.1.0.1": [{'device_name': "access", 'ip_address': "10.1.0.2"}], "10.1.0.2": []}
+    scanned = []
+    def scan_device(device):
+        scanned.append(device['ip'])
+        return {'cdp': graph[device['ip']]}
+    seed_device = {'device_name': "seed", 'ip': "10.1.0.1"}
+    known_results = {"10.1.0.1": {'cdp': graph["10.1.0.1"]}}
+    topology, _ = orchestrator.discover_topology(seed_device, scan_device, {}, SITE_SUBNETS, known_results=known_results)
+    assert list(topology) == ["10.1.0.1", "10.1.0.2"]
+    assert scanned == ["10.1.0.2"]
@@ -0,0 +1,53 @@
+import os
+import time
+import conductor
+import phase_graph
+import shared_utils
+import worker_pool
+
+def _write_outputs(output_dir, site, node, age=0):
+    # Creates a node's output files for a site, 'age' seconds old
+    for filename in phase_graph.PHASE_GRAPH[node]['outputs']:
+        path = os.path.join(output_dir, site, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write("{}\n")
+        os.utime(path, (time.time() - age, time.time() - age))
+
+def test_plan_run_skips_fresh_sites(tmp_path):
+    for node, age in (('discovery', 30), ('arp', 20), ('enrichment', 10)):
+        _write_outputs(str(tmp_path), "site-a", node, age)
+    plan = phase_graph.plan_run(phase_graph.MODE_TARGETS['full'], ["site-a", "site-b"], str(tmp_path))
+    assert plan == {'discovery': {"site-b"}, 'arp': {"site-b"}, 'aggregate': True, 'cucm': True, 'enrichment': {"site-a", "site-b"}}
+
+def test_plan_run_rebuilds_enrichment_after_new_arp_data(tmp_path):
+    for node, age in (('discovery', 30), ('enrichment', 20), ('arp', 10)):
+        _write_outputs(str(tmp_path), "site-a", node, age)
+    plan = phase_graph.plan_run(phase_graph.MODE_TARGETS['full'], ["site-a"], str(tmp_path))
+    assert plan['enrichment'] == {"site-a"}
+    assert plan['arp'] == set()
+
+def test_site_without_vtcs_is_fresh_after_enrichment(tmp_path, monkeypatch):
+    # A site with no VTCs still gets an (empty) enrichment report, so the next run has nothing to do for it
+    output_dir = f"{tmp_path}/"
+    for node, age in (('discovery', 30), ('arp', 20)):
+        _write_outputs(output_dir, "site-a", node, age)
+    monkeypatch.setattr(conductor, 'OUTPUT_DIR', output_dir)
+    delegated = []
+    monkeypatch.setattr(worker_pool, 'run_phase_for_sites', lambda pool, sites, phase, site_options=None: delegated.extend(sites))
+    run = {'sites': ["site-a"], 'pool': None, 'subnets': {'site-a': ["10.1.0.0/16"]},
+           'group_arp_table': {"10.1.0.20": {'mac_address': "aaaa.bbbb.cccc"}},
+           'site_vtc_patterns': {'site-a': "5011%"}, 'site_phone_lists': {'site-a': []}}
+    conductor._run_enrichment_node(run, {"site-a"})
+    shared_utils.flush_background_writer()
+
+    assert delegated == []
+    assert os.path.exists(f"{output_dir}site-a/vtc_devices_enriched.yml")
+    plan = phase_graph.plan_run(phase_graph.MODE_TARGETS['full'], ["site-a"], output_dir)
+    assert plan == {'discovery': set(), 'arp': set(), 'aggregate': False, 'cucm': False, 'enrichment': set()}
+
+def test_failed_cucm_query_writes_no_enrichment_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(conductor, 'OUTPUT_DIR', f"{tmp_path}/")
+    run = {'sites': ["site-a"], 'site_phone_lists': None}
+    conductor._run_enrichment_node(run, {"site-a"})
+    assert not os.path.exists(f"{tmp_path}/site-a/vtc_devices_enriched.yml")
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+import pytest
+import scan_cache
+import shared_utils
+
+DEVICE = {'device_name': "access-sw2", 'ip': "10.1.0.2"}
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_cache, 'LOCK_POLL_INTERVAL', 0.01)
+    return scan_cache.create_scan_cache_dir(str(tmp_path))
+
+def test_scans_only_missing_parts(cache_dir):
+    calls = []
+    def scan_missing(missing):
+        calls.append(missing)
+        return {part: f"{part}-result" for part in missing}
+    assert scan_cache.cached_scan(cache_dir, DEVICE, ['cdp'], scan_missing) == {'cdp': "cdp-result"}
+    assert scan_cache.cached_scan(cache_dir, DEVICE, ['cdp', 'arp'], scan_missing) == {'cdp': "cdp-result", 'arp': "arp-result"}
+    assert scan_cache.cached_scan(cache_dir, DEVICE, ['arp'], scan_missing) == {'arp': "arp-result"}
+    assert calls == [['cdp'], ['arp']]
+
+def test_stale_lock_is_taken_over(cache_dir):
+    # A worker that crashed mid-scan leaves its lock behind; once it is older than LOCK_STALE_AFTER it is broken
+    _, lock_path = scan_cache._entry_paths(cache_dir, DEVICE['ip'])
+    with open(lock_path, 'w') as f:
+        f.write("12345")
+    stale_time = time.time() - scan_cache.LOCK_STALE_AFTER - 1
+    os.utime(lock_path, (stale_time, stale_time))
+
+    result = scan_cache.cached_scan(cache_dir, DEVICE, ['cdp'], lambda missing: {'cdp': []})
+    assert result == {'cdp': []}
+    assert not os.path.exists(lock_path)
+
+def test_fresh_lock_waits_for_the_holder(cache_dir):
+    # A live holder's lock is not broken; the waiter picks up the result it publishes instead of scanning
+    result_path, lock_path = scan_cache._entry_paths(cache_dir, DEVICE['ip'])
+    assert shared_utils.try_acquire_file_lock(lock_path, scan_cache.LOCK_STALE_AFTER)
+    def publish():
+        time.sleep(0.1)
+        shared_utils.save_json_cache(result_path, {'cdp': ["from-holder"]})
+        shared_utils.release_file_lock(lock_path)
+    holder = threading.Thread(target=publish)
+    holder.start()
+    result = scan_cache.cached_scan(cache_dir, DEVICE, ['cdp'], lambda missing: pytest.fail("scanned under a held lock"))
+    holder.join()
+    assert result == {'cdp': ["from-holder"]}
+
+def test_heartbeat_keeps_a_long_scan_locked(cache_dir, monkeypatch):
+    # A scan running far longer than LOCK_STALE_AFTER keeps its lock fresh, so no other worker scans in parallel
+    monkeypatch.setattr(scan_cache, 'LOCK_HEARTBEAT_INTERVAL', 0.05)
+    monkeypatch.setattr(scan_cache, 'LOCK_STALE_AFTER', 0.2)
+    scans = []
+    def slow_scan(missing):
+        scans.append(threading.current_thread().name)
+        time.sleep(0.6)
+        return {'cdp': ["slow"]}
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(scan_cache.cached_scan(cache_dir, DEVICE, ['cdp'], slow_scan)))
+               for _ in range(2)]
+    workers[0].start()
+    time.sleep(0.05)
+    workers[1].start()
+    for worker in workers:
+        worker.join()
+    assert len(scans) == 1
+    assert results == [{'cdp': ["slow"]}] * 2
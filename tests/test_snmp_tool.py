@@ -0,0 +1,127 @@
+import pytest
+from tools import snmp_tool
+
+# The wire bytes of a GetResponse to a GETBULK (max-repetitions 5) of ipNetToMediaEntry (1.3.6.1.2.1.4.22.1)
+# from a switch with a single ARP entry, 10.0.0.1 -> 0011.2233.4455 on ifIndex 10101 (Vlan10). The fifth
+# varbind has already left the table (ipRoutingDiscards.0, a Counter32). Written out by hand from the BER
+# rules rather than with snmp_tool's encoder, so the decoder is checked against an independent encoding.
+GET_BULK_RESPONSE = bytes.fromhex(
+    "30 81 8f"                                           # Message, long-form length (143)
+    "02 01 01"                                           #   version: 1 (SNMPv2c)
+    "04 06 70 75 62 6c 69 63"                            #   community: "public"
+    "a2 81 81"                                           #   GetResponse-PDU, long-form length (129)
+    "02 04 1a 2b 3c 4d"                                  #     request-id: 0x1a2b3c4d
+    "02 01 00"                                           #     error-status: noError
+    "02 01 00"                                           #     error-index: 0
+    "30 73"                                              #     variable-bindings (115)
+    "30 15 06 0f 2b 06 01 02 01 04 16 01 01 ce 75 0a 00 00 01 02 02 27 75"           # ipNetToMediaIfIndex: 10101
+    "30 19 06 0f 2b 06 01 02 01 04 16 01 02 ce 75 0a 00 00 01 04 06 00 11 22 33 44 55"  # ipNetToMediaPhysAddress
+    "30 17 06 0f 2b 06 01 02 01 04 16 01 03 ce 75 0a 00 00 01 40 04 0a 00 00 01"     # ipNetToMediaNetAddress: 10.0.0.1
+    "30 14 06 0f 2b 06 01 02 01 04 16 01 04 ce 75 0a 00 00 01 02 01 03"              # ipNetToMediaType: dynamic
+    "30 10 06 08 2b 06 01 02 01 04 17 00 41 04 00 c3 50 00"                          # ipRoutingDiscards.0: Counter32
+)
+ARP_ENTRY_OID = snmp_tool.IP_NET_TO_MEDIA_OID
+
+def _decode(encoded: bytes):
+    # Decodes a single TLV back into (tag, value) the way parse_response does
+    tag, value, next_offset = snmp_tool._read_tlv(encoded, 0)
+    assert next_offset == len(encoded)
+    return tag, snmp_tool._decode_value(tag, value)
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 255, 256, 10101, 2**31 - 1, -1, -128, -129, -(2**31)])
+def test_integer_round_trip(value):
+    assert _decode(snmp_tool._encode_integer(value)) == (snmp_tool.TAG_INTEGER, value)
+
+@pytest.mark.parametrize("value", [b"", b"Gi1/0/1", bytes(range(256)) * 2])
+def test_octet_string_round_trip(value):
+    # 512 bytes needs a two-byte long-form length
+    assert _decode(snmp_tool._tlv(snmp_tool.TAG_OCTET_STRING, value)) == (snmp_tool.TAG_OCTET_STRING, value)
+
+@pytest.mark.parametrize("oid", [
+    "1.3.6.1.2.1.1.0",
+    "1.3.6.1.2.1.31.1.1.1.1.10101",
+    "1.3.6.1.4.1.9.9.23.1.2.1.1.6.10101.2",
+    "1.3.6.1.2.1.4.22.1.2.127.128.16383.16384.4294967295",
+])
+def test_oid_round_trip(oid):
+    assert _decode(snmp_tool._encode_oid(oid)) == (snmp_tool.TAG_OID, oid)
+
+def test_oid_multi_byte_sub_identifiers_encoding():
+    # 10101 = 78 * 128 + 117 -> 0xce 0x75; 128 -> 0x81 0x00
+    assert snmp_tool._encode_oid("1.3.6.1.2.1.31.1.1.1.1.10101") == bytes.fromhex("06 0c 2b 06 01 02 01 1f 01 01 01 01 ce 75")
+    assert snmp_tool._encode_oid("1.3.128") == bytes.fromhex("06 03 2b 81 00")
+
+@pytest.mark.parametrize("tag, encoded_value, expected", [
+    (0x41, "00 ff ff ff ff", 4294967295),                  # Counter32, padded so it isn't read as negative
+    (0x42, "00 c3 50 00", 12800000),                        # Gauge32
+    (0x43, "01 e2 40", 123456),                             # TimeTicks
+    (0x46, "00 ff ff ff ff ff ff ff ff", 2**64 - 1),        # Counter64
+])
+def test_counter_types_decode_unsigned(tag, encoded_value, expected):
+    assert _decode(snmp_tool._tlv(tag, bytes.fromhex(encoded_value))) == (tag, expected)
+
+def test_end_of_mib_view_round_trip():
+    assert _decode(snmp_tool._tlv(snmp_tool.TAG_END_OF_MIB_VIEW, b"")) == (snmp_tool.TAG_END_OF_MIB_VIEW, b"")
+
+def test_build_get_bulk():
+    message = snmp_tool.build_get_bulk("public", 0x1a2b3c4d, "1.3.6.1.2.1.4.22.1", max_repetitions=40)
+    _, body, end = snmp_tool._read_tlv(message, 0)
+    assert end == len(message)
+    fields, offset = [], 0
+    while offset < len(body):
+        tag, value, offset = snmp_tool._read_tlv(body, offset)
+        fields.append((tag, value))
+    (_, version), (_, community), (pdu_tag, pdu) = fields
+    assert (snmp_tool._decode_value(snmp_tool.TAG_INTEGER, version), community, pdu_tag) == (1, b"public", snmp_tool.TAG_GET_BULK)
+    request_id, offset = snmp_tool._read_tlv(pdu, 0)[1:]
+    non_repeaters, offset = snmp_tool._read_tlv(pdu, offset)[1:]
+    max_repetitions, offset = snmp_tool._read_tlv(pdu, offset)[1:]
+    varbind_list = snmp_tool._read_tlv(pdu, offset)[1]
+    assert [int.from_bytes(field, 'big') for field in (request_id, non_repeaters, max_repetitions)] == [0x1a2b3c4d, 0, 40]
+    varbind = snmp_tool._read_tlv(varbind_list, 0)[1]
+    oid_tag, oid, value_offset = snmp_tool._read_tlv(varbind, 0)
+    assert (oid_tag, snmp_tool._decode_oid(oid)) == (snmp_tool.TAG_OID, "1.3.6.1.2.1.4.22.1")
+    assert snmp_tool._read_tlv(varbind, value_offset)[:2] == (snmp_tool.TAG_NULL, b"")
+
+def test_parse_get_bulk_response():
+    request_id, error_status, varbinds = snmp_tool.parse_response(GET_BULK_RESPONSE)
+    assert (request_id, error_status) == (0x1a2b3c4d, 0)
+    assert varbinds == [
+        (f"{ARP_ENTRY_OID}.1.10101.10.0.0.1", snmp_tool.TAG_INTEGER, 10101),
+        (f"{ARP_ENTRY_OID}.2.10101.10.0.0.1", snmp_tool.TAG_OCTET_STRING, bytes.fromhex("001122334455")),
+        (f"{ARP_ENTRY_OID}.3.10101.10.0.0.1", snmp_tool.TAG_IP_ADDRESS, "10.0.0.1"),
+        (f"{ARP_ENTRY_OID}.4.10101.10.0.0.1", snmp_tool.TAG_INTEGER, 3),
+        ("1.3.6.1.2.1.4.23.0", 0x41, 12800000),
+    ]
+
+def test_parse_response_rejects_other_pdus():
+    request = snmp_tool.build_get_bulk("public", 1, "1.3.6.1.2.1.1")
+    with pytest.raises(ValueError):
+        snmp_tool.parse_response(request)
+
+def test_bulk_walk_stops_when_leaving_the_table(monkeypatch):
+    requested = []
+    def fake_request(sock, host, community, oid):
+        requested.append(oid)
+        return snmp_tool.parse_response(GET_BULK_RESPONSE)[2]
+    monkeypatch.setattr(snmp_tool, '_request', fake_request)
+    table = snmp_tool.bulk_walk("192.0.2.1", "public", ARP_ENTRY_OID)
+    assert requested == [ARP_ENTRY_OID]
+    assert sorted(table) == [f"{column}.10101.10.0.0.1" for column in range(1, 5)]
+    assert snmp_tool.parse_arp_table(table, {'10101': b"Vlan10"}) == {
+        '10.0.0.1': {'mac_address': '0011.2233.4455', 'age': 'N/A', 'interface': 'Vlan10', 'protocol': 'Internet', 'type': 'ARPA'}
+    }
+
+def test_bulk_walk_stops_at_end_of_mib_view(monkeypatch):
+    root = snmp_tool.IF_NAME_OID
+    responses = [
+        [(f"{root}.1", snmp_tool.TAG_OCTET_STRING, b"Gi1/0/1"), (f"{root}.2", snmp_tool.TAG_OCTET_STRING, b"Gi1/0/2")],
+        [(f"{root}.10101", snmp_tool.TAG_OCTET_STRING, b"Vlan10"), (f"{root}.10101", snmp_tool.TAG_END_OF_MIB_VIEW, b"")],
+    ]
+    requested = []
+    def fake_request(sock, host, community, oid):
+        requested.append(oid)
+        return responses.pop(0)
+    monkeypatch.setattr(snmp_tool, '_request', fake_request)
+    assert snmp_tool.bulk_walk("192.0.2.1", "public", root) == {'1': b"Gi1/0/1", '2': b"Gi1/0/2", '10101': b"Vlan10"}
+    assert requested == [root, f"{root}.2"]
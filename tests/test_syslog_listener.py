@@ -0,0 +1,41 @@
+import pytest
+import orchestrator
+import syslog_listener
+
+CONFIG_CHANGE = "%SYS-5-CONFIG_I: Configured from console by admin on vty0 (10.9.0.5)"
+
+@pytest.mark.parametrize("message, hostname", [
+    # RFC 3164 header
+    (f"<189>Mar  1 18:46:11 core-sw1 {CONFIG_CHANGE}", "core-sw1"),
+    # RFC 3164 header in front of Cisco's own sequence number and timestamp
+    (f"<189>Mar  1 18:46:11 core-sw1 1234: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", "core-sw1"),
+    # Cisco "<seq>: *Mmm dd hh:mm:ss" with the hostname after the timestamp
+    (f"<189>1234: *Mar  1 18:46:11.123: core-sw1: {CONFIG_CHANGE}", "core-sw1"),
+    (f"<189>1234: Mar 12 08:02:59: core-sw1: {CONFIG_CHANGE}", "core-sw1"),
+    # Cisco "<seq>: <host>: ..." ('logging origin-id hostname')
+    (f"<189>1234: core-sw1: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", "core-sw1"),
+    (f"<189>000087: CORE-SW1: .Mar 12 08:02:59: {CONFIG_CHANGE}", "CORE-SW1"),
+    # Cisco "<seq>: *Mmm dd hh:mm:ss" without a hostname: the facility is not mistaken for one
+    (f"<189>1234: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", None),
+    (f"<189>1234: {CONFIG_CHANGE}", None),
+], ids=["rfc3164", "rfc3164-with-cisco-seq", "seq-timestamp-host", "seq-synced-timestamp-host", "seq-host",
+        "seq-host-dot-timestamp", "seq-timestamp-no-host", "seq-no-timestamp"])
+def test_syslog_hostname(message, hostname):
+    assert syslog_listener.syslog_hostname(message) == hostname
+
+def test_device_index_matches_on_header_hostname(monkeypatch):
+    topology = {'site-a': [{'device_name': "core-sw1", 'ip': "10.1.0.1"}, {'device_name': "access-sw2", 'ip': "10.1.0.2"}]}
+    monkeypatch.setattr(orchestrator, '_load_site_topology', lambda site: topology.get(site))
+    index = syslog_listener.DeviceIndex(["site-a"])
+    # Source IP of a loopback/SVI that is not the management address
+    assert index.lookup("10.99.0.1", f"<189>1234: CORE-SW1: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", now=0) == ("site-a", topology['site-a'][0])
+    assert index.lookup("10.1.0.2", f"<189>1234: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", now=0) == ("site-a", topology['site-a'][1])
+    assert index.lookup("10.99.0.1", f"<189>1234: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", now=0) is None
+
+@pytest.mark.parametrize("message, expected", [
+    (f"<189>1234: *Mar  1 18:46:11.123: {CONFIG_CHANGE}", True),
+    ("<189>1234: *Mar  1 18:46:11: %VSHD-5-VSHD_SYSLOG_CONFIG_I: Configured from vty by admin on 10.9.0.5@pts/0", True),
+    ("<189>1234: *Mar  1 18:46:11: %LINK-3-UPDOWN: Interface GigabitEthernet1/0/1, changed state to up", False),
+])
+def test_is_config_change(message, expected):
+    assert syslog_listener.is_config_change(message) is expected
@@ -0,0 +1,67 @@
+import json
+import pytest
+from tools import timeout_policy_tool
+
+DEVICE = "10.1.0.1"
+DEFAULT = 30
+
+def _record(*latencies, operation='show version'):
+    for seconds in latencies:
+        timeout_policy_tool.record_latency(DEVICE, operation, seconds)
+
+def test_default_until_enough_samples():
+    _record(*[1.0] * (timeout_policy_tool.MIN_SAMPLES - 1))
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT) == DEFAULT
+
+def test_steady_state_follows_the_tail_latency():
+    _record(4.0, 5.0, 6.0, 7.0, 8.0)
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT) == 7.0 * timeout_policy_tool.TIMEOUT_FACTOR
+
+def test_single_slow_sample_is_ignored():
+    _record(*[5.0] * 9, 25.0)
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', 100) == 5.0 * timeout_policy_tool.TIMEOUT_FACTOR
+
+@pytest.mark.parametrize("latency, default, expected", [
+    (0.1, DEFAULT, timeout_policy_tool.MIN_TIMEOUT_SECONDS),    # fast device: floor
+    (0.1, 5, 5),                                                # floor never exceeds a shorter default
+    (100.0, DEFAULT, DEFAULT * timeout_policy_tool.MAX_DEFAULT_MULTIPLE),
+], ids=["min", "min-below-default", "max"])
+def test_timeout_is_clamped(latency, default, expected):
+    _record(*[latency] * timeout_policy_tool.MIN_SAMPLES)
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', default) == expected
+
+def test_one_timeout_does_not_inflate_the_next_deadline():
+    _record(*[5.0] * 10)
+    before = timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT)
+    timeout_policy_tool.record_timeout(DEVICE, 'show version')
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT) == before
+
+def test_repeated_timeouts_grow_the_deadline_until_a_success():
+    # 15 s from the history; doubled from the second timeout in a row on, up to the clamp
+    _record(*[5.0] * 10)
+    deadlines = []
+    for _ in range(4):
+        timeout_policy_tool.record_timeout(DEVICE, 'show version')
+        deadlines.append(timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT))
+    assert deadlines == [15.0, 30.0, 60.0, DEFAULT * timeout_policy_tool.MAX_DEFAULT_MULTIPLE]
+    _record(5.0)
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT) == 15.0
+
+def test_flush_keeps_samples_and_streaks_for_the_next_run(monkeypatch):
+    _record(*[5.0] * 10)
+    timeout_policy_tool.record_timeout(DEVICE, 'show version')
+    timeout_policy_tool.record_timeout(DEVICE, 'show version')
+    timeout_policy_tool.flush()
+    with open(timeout_policy_tool.HISTORY_FILE, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved[timeout_policy_tool.STREAKS_KEY] == {f"{DEVICE}|show version": 2}
+
+    # A new process picks both up; its success clears the streak in the file as well
+    monkeypatch.setattr(timeout_policy_tool, '_history', None)
+    assert timeout_policy_tool.get_timeout(DEVICE, 'show version', DEFAULT) == 30.0
+    _record(5.0)
+    timeout_policy_tool.flush()
+    with open(timeout_policy_tool.HISTORY_FILE, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved[timeout_policy_tool.STREAKS_KEY] == {}
+    assert len(saved[f"{DEVICE}|show version"]) == 11
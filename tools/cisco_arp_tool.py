@@ -1,6 +1,8 @@
 import re
-from netmiko import ConnectHandler
-from netmiko.exceptions import NetmikoTimeoutException, NetmikoAuthenticationException
+from tools import cisco_session_tool
+
+# Commands needed for ARP collection, in the form expected by cisco_session_tool.run_command_batch
+ARP_COMMANDS = [{'command': 'show arp', 'use_textfsm': False}]
 
 def parse_cisco_arp(arp_output: str) -> dict:
     # Manually parses the raw string output of a 'show arp' command, capturing all details.
@@ -37,28 +39,23 @@ def parse_cisco_arp(arp_output: str) -> dict:
 
     return arp_table_structured
 
-def get_cisco_arp_dict(device_info: dict) -> dict | None:
+def parse_arp_outputs(outputs: dict) -> dict | None:
+    # Turns the raw outputs of ARP_COMMANDS into the dictionary returned by get_cisco_arp_dict.
+    raw_arp_output = outputs.get('show arp')
+    if not raw_arp_output:
+        print("--- [ARP] Error: ARP table is empty or command failed. ---")
+        return None
+    print("--- [ARP] Parsing full ARP table details... ---")
+    return parse_cisco_arp(raw_arp_output)
+
+def get_cisco_arp_dict(device_info: dict, username: str, password: str) -> dict | None:
     """
     Connects to a Cisco device and returns the parsed ARP table as a dictionary.
     Returns:
         A dictionary keyed by IP address with full details, or None on failure.
     """
-    try:
-        print(f"--- [ARP] Connecting to {device_info['host']}... ---")
-        with ConnectHandler(**device_info) as net_connect:
-            print("--- [ARP] Connection successful. Retrieving ARP table... ---")
-            raw_arp_output = net_connect.send_command('show arp', use_textfsm=False)
-
-            if not raw_arp_output:
-                print("--- [ARP] Error: ARP table is empty or command failed. ---")
-                return None
-
-            print("--- [ARP] Parsing full ARP table details... ---")
-            return parse_cisco_arp(raw_arp_output)
-
-    except (NetmikoTimeoutException, NetmikoAuthenticationException) as e:
-        print(f"--- [ARP] Error: Could not connect to network device. {e} ---")
-        return None
-    except Exception as e:
-        print(f"--- [ARP] An unexpected error occurred: {e} ---")
+    outputs = cisco_session_tool.run_command_batch(device_info, username, password, ARP_COMMANDS)
+    if outputs is None:
+        print(f"--- [ARP] Error: Could not connect to network device {device_info['ip']}. ---")
         return None
+    return parse_arp_outputs(outputs)
@@ -1,5 +1,89 @@
 import re
-from netmiko import ConnectHandler
+import time
+import hashlib
+from tools import cisco_session_tool
+
+# Commands needed for discovery, in the form expected by cisco_session_tool.run_command_batch.
+# The sanity check runs first so the slow detail command is skipped when CDP is off.
+CDP_COMMANDS = [
+    {'command': "show cdp"},
+    {'command': "show cdp neighbors detail", 'read_timeout': 90, 'skip_if': lambda outputs: cdp_disabled(outputs.get("show cdp"))},
+]
+
+# Cached neighbor lists older than this are re-pulled even if the fingerprint matches,
+# since the summary table does not show neighbor IP addresses.
+CDP_CACHE_MAX_AGE = 7 * 24 * 3600
+# Title of the hold time column in the 'show cdp neighbors' header (IOS, NX-OS and older releases)
+HOLDTIME_HEADER_PATTERN = re.compile(r"\b(Holdtme|Hldtme|Holdtime|Hold Time)\b", re.IGNORECASE)
+
+def cdp_disabled(show_cdp_output: str | None) -> bool:
+    # A device with CDP disabled will typically include this string.
+    return bool(show_cdp_output) and "cdp is not enabled" in show_cdp_output.lower()
+
+def _holdtime_column(header_line: str) -> tuple[int, int] | None:
+    # Returns the (start, end) character span of the hold time column in the summary table header,
+    # i.e. from its title to the start of the next column's title (IOS "Holdtme", NX-OS "Hldtme").
+    match = HOLDTIME_HEADER_PATTERN.search(header_line)
+    if not match:
+        return None
+    next_column = re.search(r"\S", header_line[match.end():])
+    end = match.end() + next_column.start() if next_column else len(header_line)
+    return match.start(), end
+
+def cdp_fingerprint(summary_output: str | None) -> str:
+    # Hashes the 'show cdp neighbors' summary table into a cheap change fingerprint.
+    # The hold time column counts down every second, so on each row the number under its header is dropped.
+    # Numbers in any other column (e.g. a phone's "Port 1") still count, so a port change alters the fingerprint.
+    # Without a recognizable header nothing is dropped; the fingerprint then changes on every run and the
+    # detail is simply always pulled.
+    if not summary_output:
+        return ""
+    normalized_lines, holdtime_span = [], None
+    for line in summary_output.strip().splitlines():
+        if holdtime_span is None:
+            holdtime_span = _holdtime_column(line)
+        else:
+            for number in re.finditer(r"(?<!\S)\d{1,5}(?!\S)", line):
+                if number.start() < holdtime_span[1] and number.end() > holdtime_span[0]:
+                    line = line[:number.start()] + line[number.end():]
+                    break
+        tokens = line.split()
+        if tokens:
+            normalized_lines.append(" ".join(tokens))
+    return hashlib.sha256("\n".join(normalized_lines).encode('utf-8')).hexdigest()
+
+def _cache_entry_valid(cache_entry: dict | None) -> bool:
+    # A cached neighbor list can stand in for the detail output only while it is younger than CDP_CACHE_MAX_AGE
+    return bool(cache_entry) and time.time() - cache_entry.get('fetched_at', 0) < CDP_CACHE_MAX_AGE
+
+def incremental_cdp_commands(cache_entry: dict | None) -> list:
+    # Builds the CDP command list for incremental discovery.
+    # The summary table is always pulled; the slow detail command only runs when its fingerprint
+    # differs from the cached one (or there is no usable cache entry).
+    def detail_not_needed(outputs):
+        if cdp_disabled(outputs.get("show cdp")):
+            return True
+        fingerprint = cdp_fingerprint(outputs.get("show cdp neighbors"))
+        return _cache_entry_valid(cache_entry) and bool(fingerprint) and fingerprint == cache_entry.get('fingerprint')
+    return [
+        {'command': "show cdp"},
+        {'command': "show cdp neighbors", 'skip_if': lambda outputs: cdp_disabled(outputs.get("show cdp"))},
+        {'command': "show cdp neighbors detail", 'read_timeout': 90, 'skip_if': detail_not_needed},
+    ]
+
+def parse_incremental_cdp_outputs(outputs: dict, host: str, cache_entry: dict | None) -> tuple[list, dict | None]:
+    # Parses the outputs of incremental_cdp_commands.
+    # Returns (neighbors, new_cache_entry); the cached neighbor list is reused when the detail command was skipped.
+    if cdp_disabled(outputs.get("show cdp")):
+        return parse_cdp_outputs(outputs, host), None
+    fingerprint = cdp_fingerprint(outputs.get("show cdp neighbors"))
+    if "show cdp neighbors detail" not in outputs and cache_entry:
+        print(f"  -> CDP fingerprint unchanged on {host}. Reusing {len(cache_entry.get('neighbors', []))} cached neighbor(s).")
+        return cache_entry.get('neighbors', []), cache_entry
+    neighbors = parse_cdp_outputs(outputs, host)
+    if outputs.get("show cdp neighbors detail") is None or not fingerprint:
+        return neighbors, None # Never cache a failed pull
+    return neighbors, {'fingerprint': fingerprint, 'neighbors': neighbors, 'fetched_at': time.time()}
 
 def is_cdp_enabled(net_connect) -> bool:
     """
@@ -11,11 +95,7 @@ def is_cdp_enabled(net_connect) -> bool:
         True if CDP is enabled, False otherwise.
     """
     output = net_connect.send_command("show cdp")
-
-    # A device with CDP disabled will typically include this string.
-    if "cdp is not enabled" in output.lower():
-        return False    
-    return True
+    return not cdp_disabled(output)
 
 def parse_cdp_neighbors_detail(cdp_output: str) -> list:
     # Parses the output of 'show cdp neighbors detail' to extract key information.
@@ -32,6 +112,7 @@ def parse_cdp_neighbors_detail(cdp_output: str) -> list:
         ip_address_match = re.search(r"IP address: (.+)", block)
         platform_match = re.search(r"Platform: (.+?),", block)
         interface_match = re.search(r"Interface: (.+?),", block)
+        capabilities_match = re.search(r"Capabilities: (.+)", block)
         
         if device_id_match and ip_address_match:
             device_info['device_name'] = device_id_match.group(1).strip()
@@ -40,38 +121,29 @@ def parse_cdp_neighbors_detail(cdp_output: str) -> list:
                 device_info['platform'] = platform_match.group(1).strip()
             if interface_match:
                 device_info['local_interface'] = interface_match.group(1).strip()
+            if capabilities_match:
+                # e.g. "Router Switch IGMP" -> ['Router', 'Switch', 'IGMP']
+                device_info['capabilities'] = capabilities_match.group(1).split()
             discovered_devices.append(device_info)
     return discovered_devices
 
+def parse_cdp_outputs(outputs: dict, host: str = '') -> list:
+    # Turns the raw outputs of CDP_COMMANDS into the neighbor list returned by get_discovered_devices.
+    if cdp_disabled(outputs.get("show cdp")):
+        print(f"  -> Warning: CDP is not enabled on {host}. Skipping discovery on this device.")
+        return [] # Return an empty list, as there are no neighbors to find.
+    output = outputs.get("show cdp neighbors detail")
+    if not output:
+        # This now specifically means CDP is on, but no neighbors were seen.
+        print("  -> No active CDP neighbors found.")
+        return []
+    return parse_cdp_neighbors_detail(output)
+
 def get_discovered_devices(device_info: dict, username: str, password: str) -> list | None:
     # Connects to a seed device and discovers its CDP neighbors.
     # Includes a check to ensure CDP is globally enabled on the device first.
-    conn_details = {
-        'device_type': device_info.get('type', 'cisco_ios'),
-        'host': device_info['ip'],
-        'username': username,
-        'password': password,
-    }
-    try:
-        print(f"--- [CDP] Connecting to device {conn_details['host']} for discovery... ---")
-        with ConnectHandler(**conn_details) as net_connect:
-            # --- Start Sanity Check ---
-            # Before we do anything else, check if CDP is even running.
-            if not is_cdp_enabled(net_connect):
-                print(f"  -> Warning: CDP is not enabled on {conn_details['host']}. Skipping discovery on this device.")
-                return [] # Return an empty list, as there are no neighbors to find.
-            # --- End Sanity Check ---
-            print(f"  -> CDP is enabled. Running 'show cdp neighbors detail'...")
-            output = net_connect.send_command("show cdp neighbors detail", read_timeout=90)
-            
-            if not output:
-                # This now specifically means CDP is on, but no neighbors were seen.
-                print("  -> No active CDP neighbors found.")
-                return []
-                
-            return parse_cdp_neighbors_detail(output)
-            
-    except Exception as e:
-        print(f"--- [CDP] Error during discovery on {conn_details['host']}: {e}")
+    outputs = cisco_session_tool.run_command_batch(device_info, username, password, CDP_COMMANDS)
+    if outputs is None:
         # Return None to indicate a connection/authentication failure which is different from finding zero neighbors.
         return None
+    return parse_cdp_outputs(outputs, device_info['ip'])
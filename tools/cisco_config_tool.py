@@ -1,21 +1,157 @@
+import os
+import re
 import hashlib
-from netmiko import ConnectHandler
+import tempfile
+import paramiko
+from tools import cisco_session_tool
+
+# Commands needed for a config backup, in the form expected by cisco_session_tool.run_command_batch
+CONFIG_COMMANDS = [{'command': "show running-config", 'read_timeout': 120}]
+
+# --- File-Transfer Retrieval ---
+# With SAD_CONFIG_TRANSFER=sftp the running-config is copied to the device's flash and pulled over an SFTP
+# channel on the already open SSH session, instead of being screen-scraped through the prompt reader.
+# The file is streamed to CONFIG_SPOOL_DIR and hashed as it arrives. 'show running-config' stays as the fallback.
+CONFIG_TRANSFER_MODE = os.getenv('SAD_CONFIG_TRANSFER', '').lower()
+CONFIG_TRANSFER_KEY = "transfer running-config"
+CONFIG_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "sad_config_spool")
+CONFIG_TRANSFER_FILENAME = "sad-running-config.cfg"
+# Per device type: where to copy the config, the path the SFTP server exposes it under, and how to remove it
+CONFIG_TRANSFER_TARGETS = {
+    'cisco_ios': {'copy_to': f"flash:{CONFIG_TRANSFER_FILENAME}", 'sftp_path': f"flash:/{CONFIG_TRANSFER_FILENAME}",
+                  'delete': f"delete /force flash:{CONFIG_TRANSFER_FILENAME}"},
+    'cisco_xe': {'copy_to': f"bootflash:{CONFIG_TRANSFER_FILENAME}", 'sftp_path': f"bootflash:/{CONFIG_TRANSFER_FILENAME}",
+                 'delete': f"delete /force bootflash:{CONFIG_TRANSFER_FILENAME}"},
+    'cisco_nxos': {'copy_to': f"bootflash:{CONFIG_TRANSFER_FILENAME}", 'sftp_path': f"/bootflash/{CONFIG_TRANSFER_FILENAME}",
+                   'delete': f"delete bootflash:{CONFIG_TRANSFER_FILENAME} no-prompt"},
+}
+TRANSFER_CHUNK_SIZE = 32768
+
+class _HashingWriter:
+    # File wrapper that hashes everything written through it, so the config never has to sit in memory
+    def __init__(self, file_obj):
+        self._file_obj = file_obj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._file_obj.write(data)
+
+def _copy_running_config(net_connect, target: dict):
+    # Copies the running-config to a file on the device, answering the confirmation prompts
+    output = net_connect.send_command_timing(f"copy running-config {target['copy_to']}")
+    if "Destination filename" in output or "[confirm]" in output:
+        output += net_connect.send_command_timing("\n")
+    if "(y/n)" in output:
+        output += net_connect.send_command_timing("y")
+    if "%" in output or "rror" in output:
+        raise RuntimeError(f"copy failed: {output.strip()}")
+
+def transfer_running_config(net_connect, device_type: str, spool_path: str) -> dict:
+    """
+    Pulls the running-config as a file over an SFTP channel on an open netmiko session.
+    The file is streamed to 'spool_path' (replaced atomically) and hashed while it is written.
+    Returns:
+        A dictionary with 'path', 'sha256' and 'size'. Raises on any failure so the caller can fall back.
+    """
+    target = CONFIG_TRANSFER_TARGETS[device_type]
+    _copy_running_config(net_connect, target)
+    os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+    temp_path = f"{spool_path}.{os.getpid()}.tmp"
+    try:
+        # A new channel on the existing transport: no second login
+        with paramiko.SFTPClient.from_transport(net_connect.remote_conn.get_transport()) as sftp:
+            with open(temp_path, 'wb') as f, sftp.open(target['sftp_path'], 'rb') as remote_file:
+                remote_file.prefetch()
+                writer = _HashingWriter(f)
+                for chunk in iter(lambda: remote_file.read(TRANSFER_CHUNK_SIZE), b""):
+                    writer.write(chunk)
+        os.replace(temp_path, spool_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        net_connect.send_command_timing(target['delete'])
+    return {'path': spool_path, 'sha256': writer.sha256.hexdigest(), 'size': writer.size}
+
+def config_commands(device_info: dict) -> list:
+    # Returns the config commands for a device: the file transfer first when enabled and supported,
+    # then 'show running-config', which only runs if the transfer was not attempted or failed.
+    device_type = device_info.get('type', 'cisco_ios')
+    if CONFIG_TRANSFER_MODE != 'sftp' or device_type not in CONFIG_TRANSFER_TARGETS:
+        return CONFIG_COMMANDS
+    spool_path = os.path.join(CONFIG_SPOOL_DIR, f"{device_info['ip']}.cfg")
+    transfer = {'command': CONFIG_TRANSFER_KEY, 'handler': lambda net_connect: transfer_running_config(net_connect, device_type, spool_path)}
+    return [transfer] + [dict(entry, skip_if=lambda outputs: bool(outputs.get(CONFIG_TRANSFER_KEY))) for entry in CONFIG_COMMANDS]
+
+# One-line commands that print a device's last-change marker, by netmiko device type.
+# IOS prints "! Last configuration change at ..."; NX-OS prints "!Running configuration last done at: ...".
+# IOS's "! No configuration change since last restart" is deliberately not a marker: it reads the same after
+# every reload, even one into a different startup-config, so those devices always get a full pull.
+# Types not listed here always pull the full config.
+CONFIG_MARKER_COMMANDS = {
+    'cisco_ios': "show running-config | include configuration change",
+    'cisco_xe': "show running-config | include configuration change",
+    'cisco_nxos': "show running-config | include Running configuration last done",
+}
+CONFIG_MARKER_PATTERN = re.compile(r"^!\s*(Last configuration change.*|Running configuration last done.*)$", re.MULTILINE)
+
+def parse_config_marker(marker_output: str | None) -> str | None:
+    # Extracts the last-change marker line from the marker command's output, or None if there isn't one
+    if not marker_output:
+        return None
+    match = CONFIG_MARKER_PATTERN.search(marker_output)
+    return match.group(1).strip() if match else None
+
+def _skip_when(entry: dict, condition) -> dict:
+    # Returns a copy of a command entry that is also skipped when 'condition(outputs)' is true
+    previous = entry.get('skip_if')
+    return dict(entry, skip_if=lambda outputs: condition(outputs) or bool(previous and previous(outputs)))
+
+def precheck_config_commands(device_info: dict, stored_marker: str | None) -> list:
+    # Builds the config commands with a cheap change precheck in front.
+    # The full config retrieval is skipped when the device's marker matches 'stored_marker'.
+    marker_command = CONFIG_MARKER_COMMANDS.get(device_info.get('type', 'cisco_ios'))
+    if not marker_command:
+        return config_commands(device_info)
+    def marker_unchanged(outputs):
+        marker = parse_config_marker(outputs.get(marker_command))
+        return bool(stored_marker) and marker == stored_marker
+    return [{'command': marker_command}] + [_skip_when(entry, marker_unchanged) for entry in config_commands(device_info)]
+
+def parse_config_outputs(outputs: dict, device_type: str = 'cisco_ios') -> dict:
+    # Turns the outputs of config_commands / precheck_config_commands into a config result:
+    #   'text'      - the screen-scraped running configuration, or None if it was not scraped
+    #   'path'      - the spooled file when it was pulled by file transfer (with its 'sha256'), else None
+    #   'marker'    - the device's last-change marker, if the precheck ran
+    #   'unchanged' - True when the precheck showed the marker had not moved, so the pull was skipped
+    marker = parse_config_marker(outputs.get(CONFIG_MARKER_COMMANDS.get(device_type, '')))
+    transfer = outputs.get(CONFIG_TRANSFER_KEY) or {}
+    pulled = "show running-config" in outputs or CONFIG_TRANSFER_KEY in outputs
+    return {'text': outputs.get("show running-config"), 'path': transfer.get('path'), 'sha256': transfer.get('sha256'),
+            'marker': marker, 'unchanged': not pulled and marker is not None}
+
+def read_config_text(config_result: dict | None) -> str | None:
+    # Returns the config text of a config result, reading the spooled file if it was transferred
+    if not config_result:
+        return None
+    if config_result.get('path'):
+        try:
+            with open(config_result['path'], 'r', encoding='utf-8', errors='replace', newline='') as f:
+                return f.read()
+        except OSError as e:
+            print(f"    -> Error reading transferred config '{config_result['path']}': {e}")
+            return None
+    return config_result.get('text')
 
 def get_running_config(device_info: dict, username: str, password: str) -> str | None:
     # Connects to a device and retrieves its running configuration
-    conn_details = {
-        'device_type': device_info.get('type', 'cisco_ios'),
-        'host': device_info.get('ip'),
-        'username': username,
-        'password': password,
-    }
-    try:
-        with ConnectHandler(**conn_details) as net_connect:
-            output = net_connect.send_command("show running-config", read_timeout=120)
-            return output
-    except Exception as e:
-        print(f"    -> Error getting config from {conn_details['host']}: {e}")
+    outputs = cisco_session_tool.run_command_batch(device_info, username, password, config_commands(device_info))
+    if outputs is None:
+        print(f"    -> Error getting config from {device_info.get('ip')}")
         return None
+    return read_config_text(parse_config_outputs(outputs, device_info.get('type', 'cisco_ios')))
 
 def calculate_md5(config_text: str) -> str:
     # Calculates the MD5 hash of a given string of text
@@ -0,0 +1,161 @@
+import time
+import threading
+from netmiko import ConnectHandler
+from netmiko.exceptions import ReadTimeout
+from tools import governor_tool, timeout_policy_tool
+
+# netmiko's own send_command read_timeout, used for commands that don't set one
+DEFAULT_READ_TIMEOUT = 10
+
+# --- Persistent Session Pool ---
+# Long-running processes (the conductor's daemon mode) can keep SSH sessions open between cycles,
+# so repeat polls of the same device skip the login entirely. Disabled unless enable_session_pool() is called.
+SESSION_KEEPALIVE_SECONDS = 30
+_session_pool = {}          # (host, username, device_type) -> {'conn', 'last_used', 'lock', 'users'}
+_session_pool_lock = threading.Lock()
+_session_idle_timeout = None
+
+def enable_session_pool(idle_timeout: float):
+    # Turns on session reuse for this process; sessions unused for 'idle_timeout' seconds are closed
+    global _session_idle_timeout
+    _session_idle_timeout = idle_timeout
+
+def _close_quietly(conn):
+    try:
+        conn.disconnect()
+    except Exception:
+        pass
+
+def evict_idle_sessions(now: float = None) -> int:
+    # Closes pooled sessions that have been idle longer than the idle timeout. Returns how many were closed.
+    # Entries that are checked out, or that a caller is waiting to check out, are never evicted.
+    if _session_idle_timeout is None:
+        return 0
+    now = now or time.monotonic()
+    with _session_pool_lock:
+        idle_keys = [key for key, entry in _session_pool.items()
+                     if now - entry['last_used'] > _session_idle_timeout and not entry['users']]
+        idle_entries = [_session_pool.pop(key) for key in idle_keys]
+    for entry in idle_entries:
+        _close_quietly(entry['conn'])
+    return len(idle_entries)
+
+def close_all_sessions():
+    # Logs out of every pooled session, e.g. when a worker process exits, instead of leaving them to the vty timeout
+    with _session_pool_lock:
+        entries = list(_session_pool.values())
+        _session_pool.clear()
+    for entry in entries:
+        _close_quietly(entry['conn'])
+
+def _checkout_session(conn_details: dict) -> dict:
+    # Returns a locked pool entry holding a healthy session for the device, logging in only if needed
+    key = (conn_details['host'], conn_details['username'], conn_details['device_type'])
+    evict_idle_sessions()
+    with _session_pool_lock:
+        entry = _session_pool.setdefault(key, {'conn': None, 'last_used': time.monotonic(), 'lock': threading.Lock(), 'users': 0})
+        # Counted before its lock is taken, so eviction never drops an entry a caller is about to use (its session would leak)
+        entry['users'] += 1
+    entry['lock'].acquire()
+    try:
+        if entry['conn'] is not None and not entry['conn'].is_alive():
+            print(f"--- [SESSION] Pooled session to {conn_details['host']} is dead. Reconnecting... ---")
+            _close_quietly(entry['conn'])
+            entry['conn'] = None
+        if entry['conn'] is None:
+            entry['conn'] = ConnectHandler(**conn_details, keepalive=SESSION_KEEPALIVE_SECONDS)
+        else:
+            print(f"--- [SESSION] Reusing pooled session to {conn_details['host']}. ---")
+    except Exception:
+        # The entry stays pooled without a session; the next caller logs in again, or eviction drops it
+        _checkin_session(entry, healthy=False)
+        raise
+    return entry
+
+def _checkin_session(entry: dict, healthy: bool):
+    if not healthy:
+        _close_quietly(entry['conn'])
+        entry['conn'] = None
+    entry['last_used'] = time.monotonic()
+    with _session_pool_lock:
+        entry['users'] -= 1
+    entry['lock'].release()
+
+def build_connection_details(device_info: dict, username: str, password: str) -> dict:
+    # Builds the netmiko connection arguments for one of our standardized device dictionaries.
+    return {
+        'device_type': device_info.get('type', 'cisco_ios'),
+        'host': device_info['ip'],
+        'username': username,
+        'password': password,
+    }
+
+def _run_commands(net_connect, host: str, commands: list) -> tuple[dict, bool]:
+    # Runs the batch over an open connection. Returns (outputs, any_command_failed).
+    # Each command's read_timeout is adapted to the device's latency history (see timeout_policy_tool);
+    # the command's own read_timeout is the default until enough history exists.
+    outputs, failed = {}, False
+    for entry in commands:
+        command = entry['command']
+        if command in outputs:
+            continue
+        skip_if = entry.get('skip_if')
+        if skip_if and skip_if(outputs):
+            continue
+        send_kwargs = {k: v for k, v in entry.items() if k not in ('command', 'skip_if', 'handler')}
+        try:
+            if entry.get('handler'):
+                outputs[command] = entry['handler'](net_connect)
+            else:
+                send_kwargs['read_timeout'] = timeout_policy_tool.get_timeout(host, command, send_kwargs.get('read_timeout', DEFAULT_READ_TIMEOUT))
+                started = time.monotonic()
+                try:
+                    outputs[command] = net_connect.send_command(command, **send_kwargs)
+                except ReadTimeout:
+                    timeout_policy_tool.record_timeout(host, command)
+                    raise
+                timeout_policy_tool.record_latency(host, command, time.monotonic() - started)
+        except Exception as e:
+            # A single failed command should not throw away the rest of the batch
+            print(f"--- [SESSION] Error running '{command}' on {host}: {e}")
+            outputs[command] = None
+            failed = True
+    return outputs, failed
+
+def run_command_batch(device_info: dict, username: str, password: str, commands: list) -> dict | None:
+    """
+    Logs in to a device once and runs every requested command over that single session.
+    Each entry in 'commands' is a dict with a 'command' key plus any send_command keyword
+    arguments (e.g. read_timeout, use_textfsm). An optional 'skip_if' callable receives the
+    outputs collected so far and can return True to skip the command. An optional 'handler'
+    callable replaces send_command: it receives the open netmiko connection and its return
+    value is stored as the output (used for file transfers over the same session).
+    With the session pool enabled the login is reused from earlier batches to the same device.
+    The session holds a governor slot for the device, its site and the login (AAA) while it runs.
+    Returns:
+        A dictionary keyed by command string with the raw (or TextFSM) output of each command,
+        or None if the session could not be established.
+    """
+    conn_details = build_connection_details(device_info, username, password)
+    with governor_tool.limit(device=conn_details['host'], aaa=username):
+        return _run_batch(conn_details, commands)
+
+def _run_batch(conn_details: dict, commands: list) -> dict | None:
+    try:
+        print(f"--- [SESSION] Connecting to {conn_details['host']} to run {len(commands)} command(s)... ---")
+        if _session_idle_timeout is None:
+            with ConnectHandler(**conn_details) as net_connect:
+                outputs, _ = _run_commands(net_connect, conn_details['host'], commands)
+            return outputs
+        entry = _checkout_session(conn_details)
+    except Exception as e:
+        print(f"--- [SESSION] Error: Could not open session to {conn_details['host']}: {e}")
+        return None
+    healthy = False
+    try:
+        outputs, failed = _run_commands(entry['conn'], conn_details['host'], commands)
+        # A failed command may have left the channel in a bad state; only keep the session if it still answers
+        healthy = not failed or entry['conn'].is_alive()
+    finally:
+        _checkin_session(entry, healthy)
+    return outputs
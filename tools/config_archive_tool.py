@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import zlib
+import fcntl
+import difflib
+import hashlib
+import datetime
+import threading
+import contextlib
+
+# --- Archive Layout ---
+# <archive_dir>/objects/<2 hex>/<sha256>.z  zlib-compressed blobs, keyed by the SHA-256 of the raw config text.
+#                                          A blob holds either the full text or a line delta against a base blob.
+# <archive_dir>/index/<device>.json        the device's version history, oldest first.
+# <archive_dir>/index/<device>.json.lock   held while a version is added, since backups of the same device can run
+#                                          at once (syslog-triggered backups alongside the conductor's backup phases).
+OBJECTS_SUBDIR = "objects"
+INDEX_SUBDIR = "index"
+# After this many deltas in a row the next version is stored in full, which bounds the cost of materializing it
+MAX_DELTA_CHAIN = 10
+
+# Lines that change without anyone touching the config. They are ignored when deciding whether a
+# config changed, but are kept in the stored text so every version materializes exactly as pulled.
+VOLATILE_LINE_PATTERNS = [
+    re.compile(r"^ntp clock-period "),
+    re.compile(r"^!\s*Last configuration change"),
+    re.compile(r"^!\s*NVRAM config last updated"),
+    re.compile(r"^!\s*No configuration change since last restart"),
+    re.compile(r"^!\s*Running configuration last done"),
+    re.compile(r"^!\s*Time:"),
+    re.compile(r"^Building configuration"),
+    re.compile(r"^Current configuration\s*:"),
+]
+
+def normalize_config(config_text: str) -> str:
+    # Strips volatile lines and trailing whitespace so only real config changes alter the content hash
+    lines = []
+    for line in config_text.splitlines():
+        line = line.rstrip()
+        if any(pattern.match(line) for pattern in VOLATILE_LINE_PATTERNS):
+            continue
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+def content_hash(config_text: str) -> str:
+    # The hash that identifies a config version: SHA-256 of the normalized text
+    return hashlib.sha256(normalize_config(config_text).encode('utf-8')).hexdigest()
+
+# --- Blob Store ---
+def _blob_path(archive_dir: str, blob_key: str) -> str:
+    return os.path.join(archive_dir, OBJECTS_SUBDIR, blob_key[:2], f"{blob_key}.z")
+
+def _index_path(archive_dir: str, device_name: str) -> str:
+    return os.path.join(archive_dir, INDEX_SUBDIR, f"{device_name}.json")
+
+@contextlib.contextmanager
+def _index_lock(archive_dir: str, device_name: str):
+    # Holds the device's index lock for the block; works across threads and processes
+    lock_path = f"{_index_path(archive_dir, device_name)}.lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def _write_atomic(path: str, data: bytes):
+    # Writes via a temp file and os.replace, so readers never see a half-written blob or index.
+    # The temp name is unique per thread, since devices with identical configs share (and may race on) one blob.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def _write_blob(archive_dir: str, blob_key: str, payload: dict):
+    # Blobs are immutable, so an existing one is never rewritten
+    path = _blob_path(archive_dir, blob_key)
+    if not os.path.exists(path):
+        _write_atomic(path, zlib.compress(json.dumps(payload).encode('utf-8'), 9))
+
+def _read_blob(archive_dir: str, blob_key: str) -> dict:
+    with open(_blob_path(archive_dir, blob_key), 'rb') as f:
+        return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+def _make_delta(base_lines: list, new_lines: list) -> list:
+    # Encodes new_lines as ops against base_lines: ['=', start, end] copies a base slice, ['+', [lines]] inserts
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(['=', i1, i2])
+        elif j2 > j1:
+            ops.append(['+', new_lines[j1:j2]])
+    return ops
+
+def _apply_delta(base_lines: list, ops: list) -> list:
+    lines = []
+    for op in ops:
+        if op[0] == '=':
+            lines.extend(base_lines[op[1]:op[2]])
+        else:
+            lines.extend(op[1])
+    return lines
+
+def _chain_length(archive_dir: str, blob_key: str) -> int:
+    # Number of deltas between a blob and the full copy it is ultimately based on
+    length = 0
+    payload = _read_blob(archive_dir, blob_key)
+    while 'base' in payload:
+        length += 1
+        payload = _read_blob(archive_dir, payload['base'])
+    return length
+
+def load_blob_text(archive_dir: str, blob_key: str) -> str:
+    # Rebuilds the full text of a blob, following its delta chain back to the nearest full copy
+    chain = []
+    payload = _read_blob(archive_dir, blob_key)
+    while 'base' in payload:
+        chain.append(payload['ops'])
+        payload = _read_blob(archive_dir, payload['base'])
+    lines = payload['text'].split("\n")
+    for ops in reversed(chain):
+        lines = _apply_delta(lines, ops)
+    return "\n".join(lines)
+
+# --- Version Index ---
+def list_versions(archive_dir: str, device_name: str) -> list:
+    # Returns the device's version history (oldest first); each entry has 'version', 'timestamp', 'hash',
+    # 'blob' and 'chain' (number of deltas to walk to materialize it)
+    try:
+        with open(_index_path(archive_dir, device_name), 'r', encoding='utf-8') as f:
+            return json.load(f).get('versions', [])
+    except FileNotFoundError:
+        return []
+
+def latest_version(archive_dir: str, device_name: str) -> dict | None:
+    versions = list_versions(archive_dir, device_name)
+    return versions[-1] if versions else None
+
+def materialize_version(archive_dir: str, device_name: str, version: int = None) -> str | None:
+    """
+    Rebuilds a stored config exactly as it was pulled from the device.
+    Args:
+        version: The version number from list_versions(); the latest version when omitted.
+    Returns:
+        The config text, or None if the device (or that version) is not in the archive.
+    """
+    versions = list_versions(archive_dir, device_name)
+    if version is not None:
+        versions = [entry for entry in versions if entry['version'] == version]
+    if not versions:
+        return None
+    return load_blob_text(archive_dir, versions[-1]['blob'])
+
+def store_config(archive_dir: str, device_name: str, config_text: str, timestamp: str = None) -> dict | None:
+    """
+    Adds a config to the device's history if it differs (after normalization) from the latest version.
+    New versions are stored as a delta against the previous one, or in full every MAX_DELTA_CHAIN versions.
+    Identical texts share one blob, so re-storing an old config costs nothing.
+    Concurrent calls for the same device are serialized, so each one deltas against the version the other stored.
+    Returns:
+        The new version entry, or None if the config was unchanged.
+    """
+    new_hash = content_hash(config_text)
+    with _index_lock(archive_dir, device_name):
+        versions = list_versions(archive_dir, device_name)
+        previous = versions[-1] if versions else None
+        if previous and previous['hash'] == new_hash:
+            return None
+
+        blob_key = hashlib.sha256(config_text.encode('utf-8')).hexdigest()
+        chain = 0
+        if not os.path.exists(_blob_path(archive_dir, blob_key)):
+            if previous and previous['chain'] < MAX_DELTA_CHAIN:
+                base_lines = load_blob_text(archive_dir, previous['blob']).split("\n")
+                ops = _make_delta(base_lines, config_text.split("\n"))
+                _write_blob(archive_dir, blob_key, {'base': previous['blob'], 'ops': ops})
+                chain = previous['chain'] + 1
+            else:
+                _write_blob(archive_dir, blob_key, {'text': config_text})
+        else:
+            chain = _chain_length(archive_dir, blob_key)
+
+        entry = {
+            'version': previous['version'] + 1 if previous else 1,
+            'timestamp': timestamp or datetime.datetime.now().isoformat(timespec='seconds'),
+            'hash': new_hash,
+            'blob': blob_key,
+            'chain': chain,
+        }
+        index = {'device_name': device_name, 'versions': versions + [entry]}
+        _write_atomic(_index_path(archive_dir, device_name), json.dumps(index, indent=2).encode('utf-8'))
+        return entry
@@ -1,11 +1,25 @@
 # filename: tools/cucm_vtc_tool.py
+import io
+import re
 import requests
 import base64
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree
+from tools import governor_tool, timeout_policy_tool
 
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
 AXL_VERSION = "14.0"
+# Default wait for an AXL query, until the publisher's latency history says otherwise
+AXL_TIMEOUT = 30
+# Rows requested per executeSQLQuery page (SKIP/FIRST). AXL refuses results over its size limit with a fault
+# suggesting a smaller row count; the page size then shrinks to fit for the rest of the query.
+AXL_PAGE_SIZE = 1000
+# Pages fetched ahead in parallel; the governor's 'cucm_axl' limits still decide how many run at once
+AXL_PAGE_WORKERS = 2
+# "Query request too large. Total rows matched: 15000 rows. Suggestive Row Fetch: less than 5000 rows"
+AXL_TOO_LARGE_PATTERN = re.compile(r"Suggestive Row Fetch: less than (\d+) rows", re.IGNORECASE)
 SOAP_TEMPLATE = """
 <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:ns="http://www.cisco.com/AXL/API/{version}">
    <soapenv:Header/>
@@ -16,48 +30,168 @@ SOAP_TEMPLATE = """
    </soapenv:Body>
 </soapenv:Envelope>
 """
-SQL_TEMPLATE = """
-    SELECT d.name AS device_name,
-           d.description AS device_description,
-           tp.name AS model_phone,
-           n.dnorpattern AS phone_number
+SQL_FROM_WHERE = """
     FROM device d
     JOIN devicenumplanmap dmap ON d.pkid = dmap.fkdevice
     JOIN numplan n ON dmap.fknumplan = n.pkid
     JOIN typeproduct tp ON d.tkmodel = tp.tkmodel
-    WHERE n.dnorpattern LIKE '{vtc_pattern}'
-    ORDER BY n.dnorpattern
+    WHERE {where_clause}
+"""
+# Pages are cut with Informix SKIP/FIRST; the order includes the device name so page boundaries are stable
+SQL_TEMPLATE = """
+    SELECT SKIP {skip} FIRST {first}
+           d.name AS device_name,
+           d.description AS device_description,
+           tp.name AS model_phone,
+           n.dnorpattern AS phone_number
+""" + SQL_FROM_WHERE + """
+    ORDER BY n.dnorpattern, d.name
 """
+COUNT_SQL_TEMPLATE = "SELECT COUNT(*) AS row_count" + SQL_FROM_WHERE
+
+# --- DN Patterns ---
+def _where_clause(patterns: list) -> str:
+    # Several sites' DN patterns are fetched in one statement as an OR of LIKEs
+    escaped = [pattern.replace("'", "''") for pattern in patterns]
+    return " OR ".join(f"n.dnorpattern LIKE '{pattern}'" for pattern in escaped)
+
+def _like_to_regex(pattern: str) -> re.Pattern:
+    # Translates a SQL LIKE pattern ('%' any run, '_' any one character) into an anchored regex
+    return re.compile(''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in pattern) + r'\Z', re.DOTALL)
+
+def split_by_pattern(devices: list, patterns: list) -> dict:
+    # Splits the rows of a batched query back out per DN pattern. A row matching several patterns is listed under each.
+    matchers = {pattern: _like_to_regex(pattern) for pattern in patterns}
+    devices_by_pattern = {pattern: [] for pattern in patterns}
+    for device in devices:
+        for pattern, matcher in matchers.items():
+            if matcher.match(device['phone_number']):
+                devices_by_pattern[pattern].append(device)
+    return devices_by_pattern
+
+class AXLFault(Exception):
+    # A SOAP fault returned by the AXL API
+    pass
+
+# --- Response Parsing ---
+def iter_rows(source):
+    """
+    Streams the <row> elements out of an executeSQLQuery response without building the whole tree.
+    Args:
+        source: A file-like object (or path) holding the SOAP response.
+    Yields:
+        One dict per row, mapping each column name to its text. Raises AXLFault if the response is a SOAP fault.
+    """
+    for _, element in etree.iterparse(source, events=('end',), tag=('row', 'faultstring')):
+        if element.tag == 'faultstring':
+            raise AXLFault(element.text)
+        yield {column.tag: column.text for column in element}
+        # Free the row, and the rows before it, as we go
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
 
-def get_vtc_devices(cucm_host: str, username: str, password: str, vtc_phone_pattern: str) -> list | None:
-    # Queries CUCM for devices matching a specific phone number pattern.
-    cucm_url = f"https://{cucm_host}:8443/axl/"
+def _device_from_row(row: dict) -> dict:
+    return {'device_name': row.get('device_name') or 'N/A', 'description': row.get('device_description') or 'N/A',
+            'model': row.get('model_phone') or 'N/A', 'phone_number': row.get('phone_number') or 'N/A'}
+
+# --- Transport ---
+def _execute_sql(session: requests.Session, cucm_host: str, username: str, headers: dict, sql_query: str) -> bytes:
+    # Runs one executeSQLQuery and returns the raw SOAP response. Raises AXLFault for SOAP faults
+    # (which AXL sends with HTTP 500) and requests exceptions for everything else.
+    payload = SOAP_TEMPLATE.format(version=AXL_VERSION, sql_query=sql_query)
+    timeout = timeout_policy_tool.get_timeout(cucm_host, 'axl_query', AXL_TIMEOUT)
+    try:
+        with governor_tool.limit(device=cucm_host, aaa=username, service='cucm_axl'):
+            response = session.post(f"https://{cucm_host}:8443/axl/", headers=headers, data=payload.encode('utf-8'), verify=False, timeout=timeout)
+    except requests.exceptions.ReadTimeout:
+        timeout_policy_tool.record_timeout(cucm_host, 'axl_query')
+        raise
+    timeout_policy_tool.record_latency(cucm_host, 'axl_query', response.elapsed.total_seconds())
+    if response.status_code >= 400:
+        # Surface the SOAP fault if there is one, otherwise the HTTP error
+        try:
+            next(iter_rows(io.BytesIO(response.content)), None)
+        except etree.XMLSyntaxError:
+            pass
+        response.raise_for_status()
+    return response.content
+
+def _fetch_page(session, cucm_host, username, headers, where_clause, skip: int, first: int) -> list:
+    # Fetches rows [skip, skip + first) as a list of raw responses. A page AXL finds too large is split in
+    # half until it fits, so one unusually wide page never fails the query.
+    try:
+        return [_execute_sql(session, cucm_host, username, headers, SQL_TEMPLATE.format(skip=skip, first=first, where_clause=where_clause))]
+    except AXLFault as e:
+        if not AXL_TOO_LARGE_PATTERN.search(str(e)) or first <= 1:
+            raise
+        half = first // 2
+        return (_fetch_page(session, cucm_host, username, headers, where_clause, skip, half)
+                + _fetch_page(session, cucm_host, username, headers, where_clause, skip + half, first - half))
+
+def _calibrate_first_page(session, cucm_host, username, headers, where_clause) -> tuple[int, bytes]:
+    # Fetches the first page, shrinking the page size to AXL's suggestion while it says the result is too large.
+    # Returns (page_size, raw response).
+    page_size = AXL_PAGE_SIZE
+    while True:
+        try:
+            return page_size, _execute_sql(session, cucm_host, username, headers, SQL_TEMPLATE.format(skip=0, first=page_size, where_clause=where_clause))
+        except AXLFault as e:
+            suggested = AXL_TOO_LARGE_PATTERN.search(str(e))
+            if not suggested or page_size <= 1:
+                raise
+            page_size = max(1, min(page_size // 2, int(int(suggested.group(1)) * 0.9)))
+            print(f"--- [CUCM] AXL result too large. Retrying with {page_size} rows per page. ---")
+
+def iter_vtc_devices(cucm_host: str, username: str, password: str, vtc_phone_patterns: str | list):
+    """
+    Queries CUCM for devices matching one or more phone number patterns (in a single statement),
+    one SKIP/FIRST page at a time.
+    The matching rows are counted first, and the first page calibrates the page size. The remaining pages are
+    fetched AXL_PAGE_WORKERS ahead in parallel and parsed as a stream, so only a few pages are ever held in memory.
+    Yields:
+        Device dicts in phone number order. Raises requests exceptions, AXLFault or XMLSyntaxError on failure.
+    """
     auth_string = f"{username}:{password}"
     auth_token = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
     headers = {'Authorization': f'Basic {auth_token}', 'Content-Type': 'text/xml', 'SOAPAction': f'CUCM:DB ver={AXL_VERSION} executeSQLQuery'}
-    
-    final_sql_query = SQL_TEMPLATE.format(vtc_pattern=vtc_phone_pattern)
-    payload = SOAP_TEMPLATE.format(version=AXL_VERSION, sql_query=final_sql_query)
-    
-    print(f"--- [CUCM] Querying {cucm_host} for devices with pattern '{vtc_phone_pattern}'... ---")
+    where_clause = _where_clause([vtc_phone_patterns] if isinstance(vtc_phone_patterns, str) else vtc_phone_patterns)
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=AXL_PAGE_WORKERS) as executor:
+        count_response = _execute_sql(session, cucm_host, username, headers, COUNT_SQL_TEMPLATE.format(where_clause=where_clause))
+        total_rows = int((next(iter_rows(io.BytesIO(count_response)), None) or {}).get('row_count') or 0)
+        page_size, first_page = _calibrate_first_page(session, cucm_host, username, headers, where_clause)
+        print(f"--- [CUCM] {total_rows} matching row(s), fetched in pages of up to {page_size}. ---")
+
+        fetch = lambda skip: executor.submit(_fetch_page, session, cucm_host, username, headers, where_clause, skip, page_size)
+        offsets = iter(range(page_size, total_rows, page_size))
+        # A sliding window of pages in flight, consumed in order
+        window = [fetch(skip) for skip in itertools.islice(offsets, AXL_PAGE_WORKERS)]
+        pages = [first_page]
+        while True:
+            for content in pages:
+                for row in iter_rows(io.BytesIO(content)):
+                    yield _device_from_row(row)
+            if not window:
+                return
+            pages = window.pop(0).result()
+            window.extend(fetch(skip) for skip in itertools.islice(offsets, 1))
+
+def get_vtc_devices(cucm_host: str, username: str, password: str, vtc_phone_patterns: str | list) -> list | None:
+    # Queries CUCM for devices matching a phone number pattern, or any of a list of patterns in one batched query
+    # (split_by_pattern sorts the rows back out per pattern).
+    # Returns the full list, or None if the query failed (see iter_vtc_devices to stream the rows instead).
+    pattern_list = [vtc_phone_patterns] if isinstance(vtc_phone_patterns, str) else vtc_phone_patterns
+    print(f"--- [CUCM] Querying {cucm_host} for devices with pattern(s) {', '.join(repr(p) for p in pattern_list)}... ---")
     try:
-        response = requests.post(cucm_url, headers=headers, data=payload.encode('utf-8'), verify=False, timeout=30)
-        response.raise_for_status()
+        devices = list(iter_vtc_devices(cucm_host, username, password, pattern_list))
     except requests.exceptions.RequestException as e:
         print(f"--- [CUCM] Error: AXL request failed: {e} ---")
         return None
-
-    try:
-        root = etree.fromstring(response.content)
-        fault_string = root.findtext('.//faultstring')
-        if fault_string:
-            print(f"--- [CUCM] Error: AXL API returned a fault: {fault_string} ---")
-            return None
-        ns = {'axl': f'http://www.cisco.com/AXL/API/{AXL_VERSION}'}
-        rows = root.xpath("//row", namespaces=ns)
-        devices = [{'device_name': r.findtext('device_name', 'N/A'), 'description': r.findtext('device_description', 'N/A'), 'model': r.findtext('model_phone', 'N/A'), 'phone_number': r.findtext('phone_number', 'N/A')} for r in rows]
-        print(f"--- [CUCM] Found {len(devices)} matching devices. ---")
-        return devices
+    except AXLFault as e:
+        print(f"--- [CUCM] Error: AXL API returned a fault: {e} ---")
+        return None
     except etree.XMLSyntaxError:
         print("--- [CUCM] Error: Failed to parse AXL XML response. ---")
         return None
+    print(f"--- [CUCM] Found {len(devices)} matching devices. ---")
+    return devices
@@ -0,0 +1,183 @@
+import os
+import time
+import secrets
+import threading
+import contextlib
+from multiprocessing.managers import BaseManager
+import yaml
+
+# --- Configuration ---
+# Limits are read from this file (see configs/governor.yml). Without it nothing is limited.
+GOVERNOR_CONFIG = os.getenv('SAD_GOVERNOR_CONFIG', './configs/governor.yml')
+# Set by start_governor_server() so worker processes share the conductor's governor instead of their own
+GOVERNOR_ADDRESS_ENV = 'SAD_GOVERNOR_ADDRESS'
+GOVERNOR_AUTHKEY_ENV = 'SAD_GOVERNOR_AUTHKEY'
+# Scopes a connection can be limited by. 'service' limits are configured per service name.
+SCOPES = ['device', 'site', 'aaa', 'service']
+
+def load_limits(path: str = GOVERNOR_CONFIG) -> dict:
+    # Loads the limits file, returning no limits if it is missing
+    try:
+        with open(path, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
+
+# --- Governor ---
+class Governor:
+    """
+    Concurrency and rate limits for outbound connections, keyed by scope (e.g. ('device', '10.0.0.1')).
+    Each scope's limit can set 'concurrency' (simultaneous holders) and/or 'rate' (new connections per second,
+    refilled into a token bucket of size 'burst'). All keys of one acquisition are taken together, so
+    callers can never deadlock by holding one scope while waiting for another.
+    """
+    def __init__(self, limits: dict):
+        self._limits = limits
+        self._cond = threading.Condition()
+        self._active = {}
+        self._buckets = {}   # key -> [tokens, last refill time]
+        self._stats = {}     # metric name -> {'acquired', 'waiting', 'total_wait', 'max_wait'}
+
+    def _limit_for(self, key: tuple) -> dict:
+        scope, name = key
+        if scope == 'service':
+            return (self._limits.get('services') or {}).get(name) or {}
+        return self._limits.get(scope) or {}
+
+    def _wait_needed(self, keys: list, now: float) -> tuple[float | None, tuple | None]:
+        # Returns (0, None) if every key can be taken now. Otherwise returns the wait and the key causing it:
+        # the seconds until a rate token frees up, or None if a concurrency limit is full (wait for a release)
+        longest, blocker = 0.0, None
+        for key in keys:
+            limit = self._limit_for(key)
+            if limit.get('concurrency') and self._active.get(key, 0) >= limit['concurrency']:
+                return None, key
+            if limit.get('rate'):
+                tokens = self._refill(key, limit, now)
+                if tokens < 1 and (1 - tokens) / limit['rate'] > longest:
+                    longest, blocker = (1 - tokens) / limit['rate'], key
+        return longest, blocker
+
+    def _refill(self, key: tuple, limit: dict, now: float) -> float:
+        burst = limit.get('burst', 1)
+        bucket = self._buckets.setdefault(key, [burst, now])
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * limit['rate'])
+        bucket[1] = now
+        return bucket[0]
+
+    def _metric(self, key: tuple) -> dict:
+        # Devices are aggregated into one metric; the other scopes are reported per name
+        name = 'device' if key[0] == 'device' else f"{key[0]}:{key[1]}"
+        return self._stats.setdefault(name, {'acquired': 0, 'blocked': 0, 'waiting': 0, 'total_wait': 0.0, 'max_wait': 0.0})
+
+    def acquire(self, keys: list) -> float:
+        # Blocks until every key is available, takes them and returns how long the caller waited.
+        # Each stretch of waiting is charged to the scope that caused it, not to every scope requested,
+        # so the metrics show which limit is the bottleneck.
+        keys = [tuple(key) for key in keys]
+        start = time.monotonic()
+        waits = {}   # key -> seconds spent blocked on it
+        with self._cond:
+            while True:
+                blocked_at = time.monotonic()
+                wait, blocker = self._wait_needed(keys, blocked_at)
+                if wait == 0:
+                    break
+                stats = self._metric(blocker)
+                stats['waiting'] += 1
+                self._cond.wait(timeout=wait)
+                stats['waiting'] -= 1
+                waits[blocker] = waits.get(blocker, 0.0) + time.monotonic() - blocked_at
+            for key in keys:
+                self._active[key] = self._active.get(key, 0) + 1
+                if key in self._buckets:
+                    self._buckets[key][0] -= 1
+                stats = self._metric(key)
+                stats['acquired'] += 1
+                if key in waits:
+                    stats['blocked'] += 1
+                    stats['total_wait'] += waits[key]
+                    stats['max_wait'] = max(stats['max_wait'], waits[key])
+        return time.monotonic() - start
+
+    def release(self, keys: list):
+        with self._cond:
+            for key in keys:
+                key = tuple(key)
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+            self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        # Queue-wait metrics per scope: acquisitions, acquisitions that had to wait for this scope, callers
+        # currently waiting on it, and the total/average/max time (seconds) callers spent waiting on it
+        with self._cond:
+            return {name: {**stats, 'avg_wait': stats['total_wait'] / stats['acquired'] if stats['acquired'] else 0.0}
+                    for name, stats in sorted(self._stats.items())}
+
+# --- Shared Governor Server ---
+class _GovernorManager(BaseManager):
+    pass
+
+_shared_governor = None
+
+def _init_server(limits: dict):
+    # Runs in the manager process: creates the one Governor every client proxies to
+    global _shared_governor
+    _shared_governor = Governor(limits)
+
+def _get_shared_governor():
+    return _shared_governor
+
+_GovernorManager.register('get_governor', callable=_get_shared_governor)
+
+def start_governor_server(limits: dict = None) -> _GovernorManager:
+    # Hosts one Governor for the whole run in a manager process and publishes its address in the environment,
+    # so worker processes started afterwards acquire from it. Call shutdown() on the result when done.
+    authkey = secrets.token_bytes(16)
+    manager = _GovernorManager(address=('127.0.0.1', 0), authkey=authkey)
+    manager.start(initializer=_init_server, initargs=(load_limits() if limits is None else limits,))
+    host, port = manager.address
+    os.environ[GOVERNOR_ADDRESS_ENV] = f"{host}:{port}"
+    os.environ[GOVERNOR_AUTHKEY_ENV] = authkey.hex()
+    print(f"--- [GOVERNOR] Connection governor listening on {host}:{port} ---")
+    return manager
+
+# --- Client API (used by the tools) ---
+_governor = None
+_governor_lock = threading.Lock()
+_current_site = None
+
+def get_governor():
+    # Returns the run's shared governor if one was started, otherwise a governor local to this process
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            address = os.getenv(GOVERNOR_ADDRESS_ENV)
+            if address:
+                host, port = address.rsplit(':', 1)
+                manager = _GovernorManager(address=(host, int(port)), authkey=bytes.fromhex(os.environ[GOVERNOR_AUTHKEY_ENV]))
+                manager.connect()
+                _governor = manager.get_governor()
+            else:
+                _governor = Governor(load_limits())
+        return _governor
+
+def set_current_site(site_name: str | None):
+    # Records which site this process is working on; connections are then also limited per site
+    global _current_site
+    _current_site = site_name
+
+@contextlib.contextmanager
+def limit(device: str = None, aaa: str = None, service: str = None):
+    # Holds a governor slot for every given scope (plus the current site) for the duration of the block
+    keys = [(scope, name) for scope, name in (('device', device), ('site', _current_site), ('aaa', aaa), ('service', service)) if name]
+    governor = get_governor()
+    waited = governor.acquire(keys)
+    if waited >= 1:
+        print(f"--- [GOVERNOR] Waited {waited:.1f}s for a slot ({', '.join(f'{s}={n}' for s, n in keys)}). ---")
+    try:
+        yield
+    finally:
+        governor.release(keys)
@@ -0,0 +1,164 @@
+import os
+import ipaddress
+import requests
+from tools import governor_tool, timeout_policy_tool
+
+# Disable warnings for self-signed certificates
+requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+
+# Device types that are collected over NX-API (JSON over HTTPS) instead of screen-scraping over SSH.
+# Set SAD_NXAPI=off to force SSH everywhere; SAD_NXAPI_URL can point at a lab or stand-in endpoint.
+NXAPI_DEVICE_TYPES = ['cisco_nxos']
+NXAPI_ENABLED = os.getenv('SAD_NXAPI', 'on').lower() != 'off'
+NXAPI_URL_TEMPLATE = os.getenv('SAD_NXAPI_URL', 'https://{host}/ins')
+NXAPI_TIMEOUT = 30
+
+# --- JSON Helpers ---
+def _as_list(value) -> list:
+    # NX-API returns a single item as a dict and several as a list; always hand back a list
+    if not value:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _rows(table: dict | None, table_name: str, row_name: str) -> list:
+    # Returns the rows of a TABLE_x/ROW_x pair. Some commands (e.g. 'show ip interface') return
+    # TABLE_x itself as a list with one ROW_x per element, so both shapes are flattened.
+    if not table:
+        return []
+    rows = []
+    for sub_table in _as_list(table.get(table_name)):
+        rows.extend(_as_list(sub_table.get(row_name)))
+    return rows
+
+# CDP capability names as NX-API reports them, mapped to the names in the IOS text output
+CAPABILITY_NAMES = {'router': 'Router', 'switch': 'Switch', 'host': 'Host', 'phone': 'Phone', 'trans-bridge': 'Trans-Bridge',
+                    'source-route-bridge': 'Source-Route-Bridge', 'igmp_cnd_filtering': 'IGMP', 'repeater': 'Repeater'}
+
+# --- Parsers (JSON -> the same dictionaries the text parsers produce) ---
+def parse_cdp_json(body: dict | None) -> list:
+    # Maps 'show cdp neighbors detail' JSON onto the neighbor dicts of cisco_cdp_tool.parse_cdp_neighbors_detail
+    discovered_devices = []
+    for row in _rows(body, 'TABLE_cdp_neighbor_detail_info', 'ROW_cdp_neighbor_detail_info'):
+        ip_address = row.get('v4mgmtaddr') or row.get('v4addr')
+        if not row.get('device_id') or not ip_address:
+            continue
+        device_info = {'device_name': row['device_id'], 'ip_address': ip_address}
+        if row.get('platform_id'):
+            device_info['platform'] = row['platform_id']
+        if row.get('intf_id'):
+            device_info['local_interface'] = row['intf_id']
+        capabilities = row.get('capability')
+        if capabilities:
+            device_info['capabilities'] = [CAPABILITY_NAMES.get(cap.lower(), cap) for cap in _as_list(capabilities)]
+        discovered_devices.append(device_info)
+    return discovered_devices
+
+def parse_arp_json(body: dict | None) -> dict:
+    # Maps 'show ip arp' JSON onto the IP-keyed dict of cisco_arp_tool.parse_cisco_arp
+    arp_table_structured = {}
+    for vrf in _rows(body, 'TABLE_vrf', 'ROW_vrf'):
+        for adj in _rows(vrf, 'TABLE_adj', 'ROW_adj'):
+            if not adj.get('ip-addr-out') or not adj.get('mac'):
+                continue
+            arp_table_structured[adj['ip-addr-out']] = {
+                'mac_address': adj['mac'],
+                'age': adj.get('time-stamp', 'N/A'),
+                'interface': adj.get('intf-out', 'N/A'),
+                'protocol': 'Internet',
+                'type': 'ARPA'
+            }
+    return arp_table_structured
+
+def parse_vlan_json(vlan_body: dict | None, interface_body: dict | None) -> dict:
+    # Maps 'show vlan brief' and 'show ip interface' JSON onto the dict of cisco_vlan_tool.parse_vlan_outputs
+    vlan_list = []
+    for row in _rows(vlan_body, 'TABLE_vlanbriefxbrief', 'ROW_vlanbriefxbrief'):
+        ports = row.get('vlanshowplist-ifidx') or ''
+        vlan_list.append({
+            'vlan_id': row.get('vlanshowbr-vlanid'),
+            'name': row.get('vlanshowbr-vlanname'),
+            'status': row.get('vlanshowbr-vlanstate'),
+            'interfaces': [port for port in ports.split(',') if port],
+        })
+    subnets = set()
+    for row in _rows(interface_body, 'TABLE_intf', 'ROW_intf'):
+        try:
+            subnets.add(str(ipaddress.IPv4Interface(f"{row['prefix']}/{row['masklen']}").network))
+        except (KeyError, ValueError):
+            # Ignore unnumbered interfaces and invalid IP/mask combinations
+            continue
+    return {'vlan_list': vlan_list, 'subnet_list': sorted(subnets)}
+
+# Each collectable part maps to the NX-API commands it needs and the parser that turns their JSON bodies into results
+NXAPI_PARTS = {
+    'vlan': (["show vlan brief", "show ip interface"], lambda bodies: parse_vlan_json(bodies["show vlan brief"], bodies["show ip interface"])),
+    'cdp': (["show cdp neighbors detail"], lambda bodies: parse_cdp_json(bodies["show cdp neighbors detail"])),
+    'arp': (["show ip arp"], lambda bodies: parse_arp_json(bodies["show ip arp"])),
+}
+
+def uses_nxapi(device_info: dict) -> bool:
+    return NXAPI_ENABLED and device_info.get('type') in NXAPI_DEVICE_TYPES
+
+# --- Transport ---
+def run_nxapi_commands(device_info: dict, username: str, password: str, commands: list) -> dict | None:
+    """
+    Runs a batch of show commands in one NX-API JSON-RPC request.
+    Returns:
+        A dictionary keyed by command with each JSON body ({} when the command returned no rows,
+        None when that command failed), or None if NX-API could not be reached at all.
+    """
+    url = NXAPI_URL_TEMPLATE.format(host=device_info['ip'])
+    payload = [{'jsonrpc': '2.0', 'method': 'cli', 'params': {'cmd': command, 'version': 1}, 'id': index + 1}
+               for index, command in enumerate(commands)]
+    # The timeout is learned per device (see timeout_policy_tool); 'nxapi' covers the whole batched request
+    timeout = timeout_policy_tool.get_timeout(device_info['ip'], 'nxapi', NXAPI_TIMEOUT)
+    try:
+        print(f"--- [NX-API] Querying {device_info['ip']} for {len(commands)} command(s)... ---")
+        with governor_tool.limit(device=device_info['ip'], aaa=username, service='nxapi'):
+            response = requests.post(url, json=payload, auth=(username, password), headers={'content-type': 'application/json-rpc'},
+                                     verify=False, timeout=timeout)
+        timeout_policy_tool.record_latency(device_info['ip'], 'nxapi', response.elapsed.total_seconds())
+        response.raise_for_status()
+        replies = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Connection errors, auth failures, NX-API disabled (refused / 404) or a non-JSON reply
+        if isinstance(e, requests.exceptions.ReadTimeout):
+            timeout_policy_tool.record_timeout(device_info['ip'], 'nxapi')
+        print(f"--- [NX-API] Error: Could not query {device_info['ip']}: {e}")
+        return None
+    replies = replies if isinstance(replies, list) else [replies]
+    outputs = {command: None for command in commands}
+    for reply in replies:
+        command_index = reply.get('id', 0) - 1
+        if not 0 <= command_index < len(commands):
+            continue
+        if 'error' in reply:
+            print(f"--- [NX-API] Error running '{commands[command_index]}' on {device_info['ip']}: {reply['error'].get('message')}")
+            continue
+        # Commands with nothing to show (e.g. no CDP neighbors) come back with a null body
+        outputs[commands[command_index]] = (reply.get('result') or {}).get('body') or {}
+    return outputs
+
+def collect_parts(device_info: dict, username: str, password: str, parts: list) -> dict:
+    # Collects every part NX-API supports in a single request.
+    # Returns a dict keyed by part name; a part is None when NX-API (or one of its commands) failed,
+    # so the caller can fall back to SSH for it.
+    parts = [part for part in parts if part in NXAPI_PARTS]
+    if not parts:
+        return {}
+    commands = list(dict.fromkeys(command for part in parts for command in NXAPI_PARTS[part][0]))
+    bodies = run_nxapi_commands(device_info, username, password, commands)
+    if bodies is None:
+        return {part: None for part in parts}
+    results = {}
+    for part in parts:
+        part_bodies = {command: bodies.get(command) for command in NXAPI_PARTS[part][0]}
+        if any(body is None for body in part_bodies.values()):
+            results[part] = None
+            continue
+        try:
+            results[part] = NXAPI_PARTS[part][1](part_bodies)
+        except Exception as e:
+            print(f"  -> Error mapping NX-API '{part}' output from {device_info['ip']}: {e}")
+            results[part] = None
+    return results
@@ -0,0 +1,260 @@
+import os
+import time
+import random
+import socket
+import ipaddress
+from tools import governor_tool, timeout_policy_tool
+
+# --- Configuration ---
+# A minimal SNMPv2c GETBULK client, just enough to walk the ARP and CDP tables without an interactive login.
+SNMP_PORT = int(os.getenv('SAD_SNMP_PORT', '161'))
+SNMP_TIMEOUT = 2
+SNMP_RETRIES = 2
+SNMP_MAX_REPETITIONS = 40
+
+# MIB tables we walk
+IF_NAME_OID = "1.3.6.1.2.1.31.1.1.1.1"              # IF-MIB::ifName, indexed by ifIndex
+IP_NET_TO_MEDIA_OID = "1.3.6.1.2.1.4.22.1"          # IP-MIB::ipNetToMediaEntry, indexed by ifIndex.a.b.c.d
+CDP_CACHE_OID = "1.3.6.1.4.1.9.9.23.1.2.1.1"        # CISCO-CDP-MIB::cdpCacheEntry, indexed by ifIndex.deviceIndex
+
+# ipNetToMediaTable / cdpCacheTable column numbers
+ARP_COLUMN_MAC, ARP_COLUMN_IP, ARP_COLUMN_TYPE = 2, 3, 4
+CDP_COLUMN_ADDRESS_TYPE, CDP_COLUMN_ADDRESS, CDP_COLUMN_DEVICE_ID, CDP_COLUMN_PLATFORM, CDP_COLUMN_CAPABILITIES = 3, 4, 6, 8, 9
+ARP_TYPE_INVALID = 2
+# ipNetToMediaType values, named like the 'show arp' Type column where there is an equivalent
+ARP_TYPE_NAMES = {1: 'other', 3: 'ARPA', 4: 'static'}
+# cdpCacheCapabilities bits, named like the 'Capabilities:' line of 'show cdp neighbors detail'
+CDP_CAPABILITY_BITS = [(0x01, 'Router'), (0x02, 'Trans-Bridge'), (0x04, 'Source-Route-Bridge'), (0x08, 'Switch'),
+                       (0x10, 'Host'), (0x20, 'IGMP'), (0x40, 'Repeater'), (0x80, 'Phone'), (0x100, 'Remotely-Managed')]
+
+# --- BER Encoding ---
+TAG_INTEGER, TAG_OCTET_STRING, TAG_NULL, TAG_OID, TAG_SEQUENCE = 0x02, 0x04, 0x05, 0x06, 0x30
+TAG_IP_ADDRESS = 0x40
+TAG_GET_BULK, TAG_RESPONSE = 0xA5, 0xA2
+TAG_END_OF_MIB_VIEW = 0x82
+SNMP_VERSION_2C = 1
+
+def _encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(length_bytes)]) + length_bytes
+
+def _tlv(tag: int, value: bytes) -> bytes:
+    return bytes([tag]) + _encode_length(len(value)) + value
+
+def _encode_integer(value: int) -> bytes:
+    return _tlv(TAG_INTEGER, value.to_bytes(max(1, (value.bit_length() + 8) // 8), 'big', signed=True))
+
+def _encode_oid(oid: str) -> bytes:
+    parts = [int(part) for part in oid.split('.')]
+    encoded = bytearray([40 * parts[0] + parts[1]])
+    for part in parts[2:]:
+        chunk = [part & 0x7F]
+        part >>= 7
+        while part:
+            chunk.append(0x80 | (part & 0x7F))
+            part >>= 7
+        encoded.extend(reversed(chunk))
+    return _tlv(TAG_OID, bytes(encoded))
+
+def build_get_bulk(community: str, request_id: int, oid: str, max_repetitions: int = SNMP_MAX_REPETITIONS) -> bytes:
+    # Builds an SNMPv2c GetBulkRequest for a single OID
+    varbind = _tlv(TAG_SEQUENCE, _encode_oid(oid) + _tlv(TAG_NULL, b""))
+    pdu = _tlv(TAG_GET_BULK, _encode_integer(request_id) + _encode_integer(0) + _encode_integer(max_repetitions) + _tlv(TAG_SEQUENCE, varbind))
+    return _tlv(TAG_SEQUENCE, _encode_integer(SNMP_VERSION_2C) + _tlv(TAG_OCTET_STRING, community.encode('utf-8')) + pdu)
+
+# --- BER Decoding ---
+def _read_tlv(data: bytes, offset: int) -> tuple[int, bytes, int]:
+    # Returns (tag, value, offset of the next TLV)
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        length_size = length & 0x7F
+        length = int.from_bytes(data[offset:offset + length_size], 'big')
+        offset += length_size
+    return tag, data[offset:offset + length], offset + length
+
+def _decode_oid(value: bytes) -> str:
+    parts = [value[0] // 40, value[0] % 40]
+    current = 0
+    for byte in value[1:]:
+        current = (current << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(current)
+            current = 0
+    return ".".join(str(part) for part in parts)
+
+def _decode_value(tag: int, value: bytes):
+    # Integers (and Counter/Gauge/TimeTicks) become ints, IpAddress a dotted string, anything else raw bytes
+    if tag in (TAG_INTEGER, 0x41, 0x42, 0x43, 0x46):
+        return int.from_bytes(value, 'big', signed=(tag == TAG_INTEGER))
+    if tag == TAG_IP_ADDRESS and len(value) == 4:
+        return str(ipaddress.IPv4Address(value))
+    if tag == TAG_OID:
+        return _decode_oid(value)
+    return value
+
+def parse_response(data: bytes) -> tuple[int, int, list]:
+    # Parses an SNMP response message into (request_id, error_status, [(oid, tag, value), ...])
+    _, message, _ = _read_tlv(data, 0)
+    _, _, offset = _read_tlv(message, 0)          # version
+    _, _, offset = _read_tlv(message, offset)     # community
+    pdu_tag, pdu, _ = _read_tlv(message, offset)
+    if pdu_tag != TAG_RESPONSE:
+        raise ValueError(f"unexpected PDU type 0x{pdu_tag:02x}")
+    _, request_id, offset = _read_tlv(pdu, 0)
+    _, error_status, offset = _read_tlv(pdu, offset)
+    _, _, offset = _read_tlv(pdu, offset)         # error index
+    _, varbind_list, _ = _read_tlv(pdu, offset)
+    varbinds, offset = [], 0
+    while offset < len(varbind_list):
+        _, varbind, offset = _read_tlv(varbind_list, offset)
+        _, oid, value_offset = _read_tlv(varbind, 0)
+        value_tag, value, _ = _read_tlv(varbind, value_offset)
+        varbinds.append((_decode_oid(oid), value_tag, _decode_value(value_tag, value)))
+    return int.from_bytes(request_id, 'big', signed=True), int.from_bytes(error_status, 'big'), varbinds
+
+# --- Transport ---
+def _request(sock: socket.socket, host: str, community: str, oid: str) -> list:
+    # Sends one GETBULK and waits for the matching response, retrying on timeout
+    request_id = random.randint(1, 2**31 - 1)
+    message = build_get_bulk(community, request_id, oid)
+    for _ in range(SNMP_RETRIES + 1):
+        sock.sendto(message, (host, SNMP_PORT))
+        started = time.monotonic()
+        try:
+            while True:
+                data, _ = sock.recvfrom(65535)
+                response_id, error_status, varbinds = parse_response(data)
+                if response_id != request_id:
+                    continue # A late reply to an earlier retry
+                if error_status:
+                    raise ValueError(f"agent returned error status {error_status}")
+                timeout_policy_tool.record_latency(host, 'snmp_getbulk', time.monotonic() - started)
+                return varbinds
+        except socket.timeout:
+            continue
+    raise TimeoutError(f"no SNMP response from {host}")
+
+def bulk_walk(host: str, community: str, root_oid: str) -> dict:
+    """
+    Walks every object under 'root_oid' with repeated GETBULK requests.
+    Returns:
+        A dictionary mapping each OID suffix (the part after 'root_oid.') to its decoded value.
+        Raises on timeout or agent errors.
+    """
+    prefix = f"{root_oid}."
+    results = {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # Per-request timeout, learned from the agent's latency history (see timeout_policy_tool)
+        sock.settimeout(timeout_policy_tool.get_timeout(host, 'snmp_getbulk', SNMP_TIMEOUT))
+        next_oid = root_oid
+        while True:
+            varbinds = _request(sock, host, community, next_oid)
+            for oid, tag, value in varbinds:
+                if tag == TAG_END_OF_MIB_VIEW or not oid.startswith(prefix):
+                    return results
+                results[oid[len(prefix):]] = value
+            if not varbinds or varbinds[-1][0] == next_oid:
+                return results
+            next_oid = varbinds[-1][0]
+
+def _columns(table: dict) -> dict:
+    # Regroups a table walked from its entry OID ({'<column>.<index>': value}) into {index: {column: value}}
+    rows = {}
+    for suffix, value in table.items():
+        parts = suffix.split('.', 1)
+        if len(parts) == 2:
+            rows.setdefault(parts[1], {})[int(parts[0])] = value
+    return rows
+
+# --- Parsers (SNMP tables -> the same dictionaries the CLI parsers produce) ---
+def _format_mac(value) -> str:
+    # Formats a MAC like 'show arp' does: 0011.2233.4455
+    hex_digits = bytes(value).hex() if isinstance(value, (bytes, bytearray)) else ''
+    return ".".join(hex_digits[i:i + 4] for i in range(0, len(hex_digits), 4))
+
+def _text(value) -> str:
+    return value.decode('utf-8', errors='replace') if isinstance(value, (bytes, bytearray)) else str(value)
+
+def _interface_names(if_names: dict) -> dict:
+    return {index: _text(name) for index, name in if_names.items()}
+
+def parse_arp_table(arp_table: dict, if_names: dict) -> dict:
+    # Maps a walked ipNetToMediaTable onto the IP-keyed dict of cisco_arp_tool.parse_cisco_arp
+    names = _interface_names(if_names)
+    arp_table_structured = {}
+    for index, row in _columns(arp_table).items():
+        ip_address = row.get(ARP_COLUMN_IP)
+        mac_address = _format_mac(row.get(ARP_COLUMN_MAC))
+        if not ip_address or not mac_address or row.get(ARP_COLUMN_TYPE) == ARP_TYPE_INVALID:
+            continue
+        arp_table_structured[ip_address] = {
+            'mac_address': mac_address,
+            'age': 'N/A', # ipNetToMediaTable has no age column
+            'interface': names.get(index.split('.')[0], 'N/A'),
+            'protocol': 'Internet',
+            'type': ARP_TYPE_NAMES.get(row.get(ARP_COLUMN_TYPE), 'N/A')
+        }
+    return arp_table_structured
+
+def parse_cdp_cache(cdp_table: dict, if_names: dict) -> list:
+    # Maps a walked cdpCacheTable onto the neighbor dicts of cisco_cdp_tool.parse_cdp_neighbors_detail
+    names = _interface_names(if_names)
+    discovered_devices = []
+    for index, row in _columns(cdp_table).items():
+        address = row.get(CDP_COLUMN_ADDRESS)
+        # Address type 1 is IPv4, carried as 4 raw octets
+        if row.get(CDP_COLUMN_ADDRESS_TYPE) != 1 or not isinstance(address, (bytes, bytearray)) or len(address) != 4:
+            continue
+        device_info = {'device_name': _text(row.get(CDP_COLUMN_DEVICE_ID, b'')), 'ip_address': str(ipaddress.IPv4Address(bytes(address)))}
+        if not device_info['device_name']:
+            continue
+        if CDP_COLUMN_PLATFORM in row:
+            device_info['platform'] = _text(row[CDP_COLUMN_PLATFORM])
+        local_interface = names.get(index.split('.')[0])
+        if local_interface:
+            device_info['local_interface'] = local_interface
+        capabilities = row.get(CDP_COLUMN_CAPABILITIES)
+        if isinstance(capabilities, (bytes, bytearray)) and capabilities:
+            bits = int.from_bytes(capabilities, 'big')
+            device_info['capabilities'] = [name for bit, name in CDP_CAPABILITY_BITS if bits & bit]
+        discovered_devices.append(device_info)
+    return discovered_devices
+
+# Each collectable part maps to the tables it walks and the parser that turns them into results
+SNMP_PARTS = {
+    'arp': ([IP_NET_TO_MEDIA_OID], lambda tables: parse_arp_table(tables[IP_NET_TO_MEDIA_OID], tables[IF_NAME_OID])),
+    'cdp': ([CDP_CACHE_OID], lambda tables: parse_cdp_cache(tables[CDP_CACHE_OID], tables[IF_NAME_OID])),
+}
+
+def collect_parts(device_info: dict, community: str, parts: list) -> dict:
+    # Walks the tables for every part SNMP supports (plus ifName, for interface names).
+    # Returns a dict keyed by part name; a part is None when its walk failed, so the caller can fall back to SSH.
+    parts = [part for part in parts if part in SNMP_PARTS]
+    if not parts:
+        return {}
+    print(f"--- [SNMP] Walking {', '.join(parts)} tables on {device_info['ip']}... ---")
+    tables, unreachable = {}, False
+    with governor_tool.limit(device=device_info['ip'], service='snmp'):
+        for oid in [IF_NAME_OID] + [oid for part in parts for oid in SNMP_PARTS[part][0]]:
+            tables[oid] = None
+            if unreachable:
+                continue
+            try:
+                tables[oid] = bulk_walk(device_info['ip'], community, oid)
+            except TimeoutError as e:
+                # Don't wait out the timeout again for every remaining table
+                print(f"--- [SNMP] Error: {e}")
+                unreachable = True
+            except (OSError, ValueError, IndexError) as e:
+                print(f"--- [SNMP] Error walking {oid} on {device_info['ip']}: {e}")
+    results = {}
+    for part in parts:
+        if any(tables[oid] is None for oid in SNMP_PARTS[part][0]):
+            results[part] = None
+            continue
+        results[part] = SNMP_PARTS[part][1]({**tables, IF_NAME_OID: tables[IF_NAME_OID] or {}})
+    return results
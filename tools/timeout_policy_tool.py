@@ -0,0 +1,137 @@
+import os
+import json
+import math
+import fcntl
+import threading
+
+# --- Configuration ---
+# Per-device, per-operation latency history, kept across runs. Tools ask get_timeout() for how long to wait
+# instead of using a fixed constant, and report what they measured with record_latency() (or record_timeout()
+# when the wait ran out, since then the real latency is unknown).
+HISTORY_FILE = os.getenv('SAD_LATENCY_HISTORY', './output/.cache/latency_history.json')
+# Samples kept per (device, operation); the oldest are dropped first
+HISTORY_SIZE = 50
+# Below this many samples the tool's own default timeout is used
+MIN_SAMPLES = 5
+# The timeout is the tail latency (see tail_latency()) times this factor...
+TIMEOUT_FACTOR = float(os.getenv('SAD_TIMEOUT_FACTOR', '3'))
+# ...but never below MIN_TIMEOUT_SECONDS (or the default, if that is lower) nor above MAX_DEFAULT_MULTIPLE x the default
+MIN_TIMEOUT_SECONDS = 10
+MAX_DEFAULT_MULTIPLE = 4
+# After this many timeouts in a row the timeout is doubled, and doubled again for each further one (up to
+# the clamp). A single timeout is not enough: it is more often a hiccup than a device that got slower.
+TIMEOUT_STREAK = 2
+# Reserved history key holding "target|operation" -> consecutive timeouts (sample keys always contain a '|')
+STREAKS_KEY = 'timeout_streaks'
+
+_lock = threading.Lock()
+_history = None      # "target|operation" -> latencies (seconds), as loaded plus recorded in this process
+_pending = {}        # "target|operation" -> latencies recorded since the last flush(); STREAKS_KEY -> updated streaks
+
+def _key(target: str, operation: str) -> str:
+    return f"{target}|{operation}"
+
+def _load_history() -> dict:
+    try:
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return {}
+
+def _loaded_history() -> dict:
+    global _history
+    if _history is None:
+        _history = _load_history()
+    return _history
+
+def _samples(key: str) -> list:
+    return _loaded_history().get(key, [])
+
+def _streak(key: str) -> int:
+    # Consecutive timeouts of 'key' since its last completed operation
+    return _loaded_history().get(STREAKS_KEY, {}).get(key, 0)
+
+def _set_streak(key: str, count: int):
+    # Updates the in-memory streak and queues it for flush(); 0 removes the entry
+    streaks = _history.setdefault(STREAKS_KEY, {})
+    if count:
+        streaks[key] = count
+    else:
+        streaks.pop(key, None)
+    _pending.setdefault(STREAKS_KEY, {})[key] = count
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def tail_latency(samples: list) -> float:
+    # p99 of the samples. With fewer than 100 of them p99 is simply the slowest one, so a single outlier
+    # would set the timeout on its own; the second-slowest is used instead.
+    if len(samples) >= 100:
+        return percentile(samples, 0.99)
+    return sorted(samples)[-2]
+
+def get_timeout(target: str, operation: str, default: float) -> float:
+    # Returns how long to wait for 'operation' on 'target': its tail latency x TIMEOUT_FACTOR, or 'default'
+    # until enough history has been collected; grown after repeated timeouts, then clamped
+    key = _key(target, operation)
+    with _lock:
+        samples, streak = _samples(key), _streak(key)
+    timeout = default
+    if len(samples) >= MIN_SAMPLES:
+        timeout = max(tail_latency(samples) * TIMEOUT_FACTOR, min(default, MIN_TIMEOUT_SECONDS))
+    if streak >= TIMEOUT_STREAK:
+        timeout *= 2 ** (streak - TIMEOUT_STREAK + 1)
+    return round(min(timeout, default * MAX_DEFAULT_MULTIPLE), 1)
+
+def record_latency(target: str, operation: str, seconds: float):
+    # Records how long a completed operation took, and ends any run of timeouts for it
+    key = _key(target, operation)
+    with _lock:
+        samples = _samples(key) + [round(seconds, 2)]
+        _history[key] = samples[-HISTORY_SIZE:]
+        _pending.setdefault(key, []).append(round(seconds, 2))
+        if _streak(key):
+            _set_streak(key, 0)
+
+def record_timeout(target: str, operation: str):
+    # Records that an operation ran out of time. The timeout is not a latency (the operation may have needed
+    # far longer, or was only briefly stuck), so it is counted instead: after TIMEOUT_STREAK in a row
+    # get_timeout() starts granting more time, and the next completed operation resets the count.
+    key = _key(target, operation)
+    with _lock:
+        _set_streak(key, _streak(key) + 1)
+
+def flush():
+    # Merges the latencies recorded in this process into the history file. Called at the end of each phase;
+    # the file is locked while merging so workers finishing at the same time don't drop each other's samples.
+    global _history
+    with _lock:
+        if not _pending:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        try:
+            os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+            with open(f"{HISTORY_FILE}.lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                history = _load_history()
+                for key, samples in pending.items():
+                    if key == STREAKS_KEY:
+                        # Streaks are counts, not samples: the latest value from this process wins
+                        streaks = history.setdefault(STREAKS_KEY, {})
+                        for streak_key, count in samples.items():
+                            if count:
+                                streaks[streak_key] = count
+                            else:
+                                streaks.pop(streak_key, None)
+                        continue
+                    history[key] = (history.get(key, []) + samples)[-HISTORY_SIZE:]
+                temp_path = f"{HISTORY_FILE}.{os.getpid()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(history, f)
+                os.replace(temp_path, HISTORY_FILE)
+            _history = history
+        except OSError as e:
+            print(f"  -> Error: Could not save latency history '{HISTORY_FILE}'. Reason: {e}")
@@ -1,5 +1,28 @@
+import threading
 import requests
 from lxml import etree
+from tools import governor_tool, timeout_policy_tool
+
+# Default wait for the status document, until the device's latency history says otherwise
+STATUS_TIMEOUT = 15
+# Connections kept open by the shared HTTP session: hosts whose pools are kept, and connections per host
+HTTP_POOL_HOSTS = 64
+HTTP_POOL_PER_HOST = 2
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    # Returns this process's shared HTTP session, so concurrent polls reuse kept-alive connections
+    # from a bounded pool instead of opening a new one per request
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_PER_HOST)
+            _http_session.mount('https://', adapter)
+            _http_session.mount('http://', adapter)
+        return _http_session
 
 # Disable warnings for self-signed certificates
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
@@ -21,28 +44,116 @@ def find_value(element, default='N/A'):
     else:
         return default
 
-def get_device_status(device_ip: str, username: str, password: str) -> dict | None:
+# Status fields we report, keyed by their path below the <Status> root
+STATUS_FIELDS = {
+    'uptime_seconds': 'SystemUnit/Uptime',
+    'software_version': 'SystemUnit/Software/Version',
+    'software_release_date': 'SystemUnit/Software/ReleaseDate',
+    # Note: Call status might be in a different top-level tag
+    'active_calls': 'Call/NumberOfActiveCalls',
+    'in_progress_calls': 'Call/NumberOfInProgressCalls',
+    'system_name': 'SystemUnit/Name',
+}
+# Subtrees holding those fields. Codecs with xAPI serve each one on its own via /getxml?location=...,
+# which is a few KB instead of the full status document.
+XAPI_LOCATIONS = ['/Status/SystemUnit', '/Status/Call']
+STREAM_CHUNK_SIZE = 16 * 1024
+# Once the fields are found the rest of the body is still read, so the kept-alive connection can go back to the
+# pool. Past this many leftover bytes (a large legacy status.xml) dropping the connection is cheaper.
+MAX_DRAIN_BYTES = 256 * 1024
+# Codecs whose /getxml was rejected; they get the full status.xml from then on
+_xapi_unsupported = set()
+
+def extract_fields(chunks, wanted: dict) -> dict:
+    """
+    Pulls fields out of an XML document as it streams in, without building the whole tree.
+    Args:
+        chunks: An iterable of bytes making up the document.
+        wanted: Field name -> element path below the root (e.g. 'SystemUnit/Name').
+    Returns:
+        A dictionary of the fields found. Parsing stops as soon as every wanted field has been seen
+        (the rest of 'chunks' is left unread), and elements nobody needs are freed as soon as they close.
+    """
+    fields_by_path = {path: field for field, path in wanted.items()}
+    parser = etree.XMLPullParser(events=('start', 'end'))
+    found, stack = {}, []
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                stack.append(element.tag)
+                continue
+            path = '/'.join(stack[1:])
+            stack.pop()
+            field = fields_by_path.get(path)
+            if field and field not in found:
+                found[field] = find_value(element)
+                if len(found) == len(fields_by_path):
+                    return found
+            # Keep children of wanted elements, since find_value() may need their <Value>
+            if '/'.join(stack[1:]) not in fields_by_path:
+                element.clear()
+    parser.close()
+    return found
+
+def _drain(chunks):
+    # Reads what is left of a streamed body (up to MAX_DRAIN_BYTES) so urllib3 can reuse the connection
+    drained = 0
+    for chunk in chunks:
+        drained += len(chunk)
+        if drained > MAX_DRAIN_BYTES:
+            return
+
+def _stream_fields(url: str, auth: tuple, timeout: float, device_ip: str, wanted: dict) -> dict:
+    # GETs an XML document and extracts the wanted fields while it downloads
+    with get_http_session().get(url, auth=auth, verify=False, timeout=timeout, stream=True) as response:
+        timeout_policy_tool.record_latency(device_ip, 'vtc_status', response.elapsed.total_seconds())
+        response.raise_for_status()
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        fields = extract_fields(chunks, wanted)
+        _drain(chunks)
+        return fields
+
+def _fetch_xapi_fields(device_ip: str, auth: tuple, timeout: float, fields: dict) -> dict | None:
+    # Fetches just the status subtrees holding 'fields' through location-filtered xAPI requests.
+    # Returns None (and remembers it) if the codec doesn't support /getxml, so the caller falls back to status.xml.
+    status_data = {}
+    for location in XAPI_LOCATIONS:
+        wanted = {field: path for field, path in fields.items() if f"/Status/{path}".startswith(f"{location}/")}
+        if not wanted:
+            continue
+        try:
+            status_data.update(_stream_fields(f"https://{device_ip}/getxml?location={location}", auth, timeout, device_ip, wanted))
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code not in (400, 404, 405, 501):
+                raise
+            _xapi_unsupported.add(device_ip)
+            return None
+        except etree.XMLSyntaxError:
+            # Older firmware answers unknown URLs with an HTML page
+            _xapi_unsupported.add(device_ip)
+            return None
+    return status_data
+
+def get_device_status(device_ip: str, username: str, password: str, fields: list = None) -> dict | None:
     # Connects to a VTC device via its HTTP GET API and retrieves status info
-    url = f"https://{device_ip}/status.xml"
+    # 'fields' limits the fetch to some of STATUS_FIELDS (only their xAPI subtrees are requested); default is all.
+    # Safe to call from several threads at once; requests share the pooled session from get_http_session()
+    wanted = {field: STATUS_FIELDS[field] for field in (fields or STATUS_FIELDS)}
     auth = (username, password)
+    timeout = timeout_policy_tool.get_timeout(device_ip, 'vtc_status', STATUS_TIMEOUT)
     try:
-        # Make one single GET request to fetch the entire status document
-        response = requests.get(url, auth=auth,  verify=False, timeout=15)
-        response.raise_for_status()
-        # Parse the entire XML response at once
-        root = etree.fromstring(response.content)
-        # Use precise XPath to find each element we care about.
-        status_data = {
-            'uptime_seconds': find_value(root.find('./SystemUnit/Uptime')),
-            'software_version': find_value(root.find('./SystemUnit/Software/Version')),
-            'software_release_date': find_value(root.find('./SystemUnit/Software/ReleaseDate')),
-            # Note: Call status might be in a different top-level tag
-            'active_calls': find_value(root.find('./Call/NumberOfActiveCalls')),
-            'in_progress_calls': find_value(root.find('./Call/NumberOfInProgressCalls')),
-            'system_name': find_value(root.find('./SystemUnit/Name')),
-        }        
-        return status_data
+        with governor_tool.limit(device=device_ip, service='vtc_api'):
+            status_data = None if device_ip in _xapi_unsupported else _fetch_xapi_fields(device_ip, auth, timeout, wanted)
+            if status_data is None:
+                # Fall back to the full status document, still only reading it until every field is found
+                status_data = _stream_fields(f"https://{device_ip}/status.xml", auth, timeout, device_ip, wanted)
+        return {field: status_data.get(field, 'N/A') for field in wanted}
 
+    except requests.exceptions.ReadTimeout:
+        # The device accepted the connection but did not answer in time; it gets longer if this keeps happening
+        timeout_policy_tool.record_timeout(device_ip, 'vtc_status')
+        return None
     except requests.exceptions.RequestException:
         # This catches connection errors, timeouts, auth failures, etc. Indicates we could not talk to the device
         return None
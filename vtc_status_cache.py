@@ -0,0 +1,50 @@
+import time
+# --- Local Module Imports ---
+import shared_utils
+
+# --- Configuration ---
+# A persisted per-site cache of VTC status fields, so enrichment only re-polls what may have changed.
+# Every field has its own TTL: static fields are refreshed daily, while the call counters (and uptime)
+# are refreshed often for codecs that were in a call when last polled and rarely for idle ones.
+STATIC_FIELDS = ['software_version', 'software_release_date', 'system_name']
+CALL_FIELDS = ['active_calls', 'in_progress_calls']
+STATIC_TTL_SECONDS = 24 * 3600
+IN_CALL_TTL_SECONDS = 5 * 60
+IDLE_TTL_SECONDS = 60 * 60
+
+def cache_path(site_name: str) -> str:
+    return f"{shared_utils.CACHE_DIR}vtc_status_{site_name}.json"
+
+def _in_call(entry: dict) -> bool:
+    # A codec counts as in a call if either call counter was above zero when last polled
+    for field in CALL_FIELDS:
+        try:
+            if int(entry[field]['value']) > 0:
+                return True
+        except (KeyError, TypeError, ValueError):
+            continue
+    return False
+
+def field_ttl(field: str, entry: dict) -> float:
+    if field in STATIC_FIELDS:
+        return STATIC_TTL_SECONDS
+    return IN_CALL_TTL_SECONDS if _in_call(entry) else IDLE_TTL_SECONDS
+
+def stale_fields(entry: dict, fields: list, now: float = None) -> list:
+    # Returns the fields that are missing from a device's cache entry or older than their TTL
+    now = now or time.time()
+    return [field for field in fields if field not in entry or now - entry[field]['fetched_at'] >= field_ttl(field, entry)]
+
+def update_entry(entry: dict, values: dict, now: float = None):
+    # Stores freshly polled values in a device's cache entry (in place)
+    now = now or time.time()
+    for field, value in values.items():
+        entry[field] = {'value': value, 'fetched_at': now}
+
+def cached_values(entry: dict, refreshed: list, now: float = None) -> tuple[dict, dict]:
+    # Returns (field -> value, field -> age in seconds) for a device. Only fields that were not 'refreshed'
+    # in this run get an age, so the report marks exactly the values that came from the cache.
+    now = now or time.time()
+    values = {field: cached['value'] for field, cached in entry.items()}
+    ages = {field: int(now - cached['fetched_at']) for field, cached in entry.items() if field not in refreshed}
+    return values, ages
@@ -0,0 +1,112 @@
+import os
+import io
+import zlib
+import contextlib
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# --- Local Module Imports ---
+import shared_utils
+
+# --- Configuration ---
+# Modules imported once by the forkserver so every worker starts with netmiko, paramiko, lxml, requests etc. loaded
+PRELOAD_MODULES = ['orchestrator']
+
+# Loaded once per worker process by _init_worker and reused for every job that worker runs
+_worker_context = None
+
+def _init_worker(temp_creds_path: str, session_idle_timeout: float | None = None):
+    # Runs once in each worker process: loads the credentials and static configs for all later jobs.
+    # With a 'session_idle_timeout' the worker keeps SSH sessions open between jobs (see cisco_session_tool).
+    global _worker_context
+    import orchestrator
+    from tools import cisco_session_tool
+    _worker_context = orchestrator.load_worker_context(temp_creds_path)
+    if session_idle_timeout:
+        cisco_session_tool.enable_session_pool(session_idle_timeout)
+        # Log out of the pooled sessions when the pool shuts this worker down. Pool workers exit without
+        # running atexit handlers, but they do run multiprocessing's finalizers.
+        multiprocessing.util.Finalize(None, cisco_session_tool.close_all_sessions, exitpriority=10)
+
+def _run_job(site: str, phase: str, options: dict, env: dict) -> tuple[int, str, dict | None, list]:
+    # Runs one orchestrator phase inside a pool worker, capturing everything it prints.
+    # The phase result and its YAML reports are returned to the conductor instead of being written here.
+    import orchestrator
+    from tools import cisco_session_tool
+    os.environ.update(env)
+    cisco_session_tool.evict_idle_sessions()
+    buffer = io.StringIO()
+    result = None
+    with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer), shared_utils.collect_report_artifacts() as artifacts:
+        try:
+            result = orchestrator.run_phase(site, phase, _worker_context, **options)
+        except Exception as e:
+            print(f"Worker Error: Unhandled exception in phase '{phase}': {e}")
+        success = result is not None
+        if success:
+            print(f"Worker for site '{site}' phase '{phase}' completed succesfully.")
+        else:
+            print(f"Worker for site '{site}' phase '{phase}' failed.")
+    return (0 if success else 1), buffer.getvalue(), result, artifacts
+
+def _mp_context():
+    # Where available the forkserver preloads PRELOAD_MODULES, so each worker forks with the imports done
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    mp_context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        mp_context.set_forkserver_preload(PRELOAD_MODULES)
+    return mp_context
+
+def create_worker_pool(max_workers: int, temp_creds_path: str) -> ProcessPoolExecutor:
+    # Starts a pool of long-lived worker processes.
+    # Each worker loads credentials and configs once in its initializer.
+    mp_context = _mp_context()
+    print(f"Starting worker pool with {max_workers} process(es) using '{mp_context.get_start_method()}'...")
+    return ProcessPoolExecutor(max_workers=max(1, max_workers), mp_context=mp_context,
+                               initializer=_init_worker, initargs=(temp_creds_path,))
+
+class SiteAffinityPool:
+    # A set of single-process pools where every job for a given site always lands on the same worker.
+    # Used by the daemon: each worker keeps its sites' SSH sessions open, and a site routed to a different
+    # worker next cycle would have to log in again. Offers the submit()/shutdown() subset run_phase_for_sites uses.
+    def __init__(self, max_workers: int, temp_creds_path: str, session_idle_timeout: float):
+        mp_context = _mp_context()
+        print(f"Starting {max_workers} site-affine worker(s) using '{mp_context.get_start_method()}'...")
+        self._pools = [ProcessPoolExecutor(max_workers=1, mp_context=mp_context, initializer=_init_worker,
+                                           initargs=(temp_creds_path, session_idle_timeout))
+                       for _ in range(max(1, max_workers))]
+
+    def submit(self, fn, site: str, *args):
+        # crc32 rather than hash(), which is salted per process and would change between runs
+        return self._pools[zlib.crc32(site.encode('utf-8')) % len(self._pools)].submit(fn, site, *args)
+
+    def shutdown(self, wait: bool = True):
+        for pool in self._pools:
+            pool.shutdown(wait=wait)
+
+def run_phase_for_sites(pool: ProcessPoolExecutor | SiteAffinityPool, sites: list, phase: str, options: dict = None, env: dict = None,
+                        site_options: dict = None) -> tuple[dict, dict]:
+    # Runs one orchestrator phase for every site on the worker pool.
+    # 'site_options' holds extra per-site keyword arguments for the phase, merged over 'options'.
+    # Each worker's output is buffered and printed as one block, prefixed with its site name,
+    # and the YAML reports it produced are queued on the shared_utils background writer.
+    # Returns once every job has finished, so callers can treat it as a barrier.
+    # Returns (exit_codes, results): site -> exit code (0 on success) and site -> phase result (None on failure).
+    exit_codes, results = {}, {}
+    futures = {}
+    for site in sites:
+        job_options = {**(options or {}), **(site_options or {}).get(site, {})}
+        futures[pool.submit(_run_job, site, phase, job_options, env or {})] = site
+    for future in as_completed(futures):
+        site = futures[future]
+        try:
+            exit_codes[site], output, results[site], artifacts = future.result()
+        except Exception as e:
+            # A worker process that died (or a broken pool) fails this site only
+            exit_codes[site], output, results[site], artifacts = 1, f"Worker process failed: {e}\n", None, []
+        for filepath, data, root_key in artifacts:
+            shared_utils.write_yaml_in_background(filepath, data, root_key)
+        print(f"\n-> [{site}] '{phase}' finished with exit code {exit_codes[site]}")
+        for line in output.splitlines():
+            print(f"[{site}] {line}")
+    return exit_codes, results